@@ -0,0 +1,92 @@
+import contextlib
+import copy
+import json
+import os
+import threading
+from typing import Optional
+
+from index import lock_file
+
+
+class Catalog:
+    """
+    Schema of all tables of a working dir kept in a single JSON file:
+    table name -> engine, primary key, columns, dtypes, number of rows, size of data, indexes,
+    numbers of distinct values of indexed columns and version.
+    Parsed file is shared by the whole process and read again only when the file changes,
+    so describing a table or validating a query doesn't touch table data.
+    Writers change it under a lock and replace the file atomically
+    """
+
+    FILENAME = "catalog.json"
+
+    # path -> (file signature, tables)
+    _loaded = {}
+    _loaded_lock = threading.Lock()
+
+    def __init__(self, working_dir: str):
+        self.path = os.path.abspath(os.path.join(working_dir, self.FILENAME))
+
+    def tables(self) -> dict:
+        """
+        Table name -> entry. Entries are shared, they must not be modified
+        """
+
+        signature = self._signature()
+        with self._loaded_lock:
+            loaded = self._loaded.get(self.path)
+            if loaded is not None and loaded[0] == signature:
+                return loaded[1]
+
+        tables = {}
+        if signature is not None:
+            with open(self.path) as f:
+                tables = json.load(f)
+        with self._loaded_lock:
+            self._loaded[self.path] = (signature, tables)
+        return tables
+
+    def table(self, name: str) -> Optional[dict]:
+        return self.tables().get(name)
+
+    @staticmethod
+    def entry(engine: str, primary_key: str, columns: list, dtypes: dict = None, rows: Optional[int] = 0,
+              size: Optional[int] = None) -> dict:
+        # rows are valid only while the size of the table data is the same
+        dtypes = dtypes or {}
+        return {
+            "engine": engine,
+            "primary_key": primary_key,
+            "columns": columns,
+            "dtypes": {column: dtypes.get(column) for column in [primary_key] + columns},
+            "rows": rows,
+            "size": size,
+            "indexes": {},
+            "distinct": {},
+            # kinds of untyped columns engines that infer types found in the whole table and its size then
+            "kinds": None,
+            "version": 1,
+        }
+
+    @contextlib.contextmanager
+    def write(self):
+        """
+        Change tables under the lock, they are saved when the context exits without errors
+        """
+
+        with lock_file(self.path + ".lock"):
+            tables = copy.deepcopy(self.tables())
+            yield tables
+            tmp = "%s.%d.tmp" % (self.path, os.getpid())
+            with open(tmp, "w") as f:
+                json.dump(tables, f)
+            os.replace(tmp, self.path)
+            with self._loaded_lock:
+                self._loaded[self.path] = (self._signature(), tables)
+
+    def _signature(self) -> Optional[tuple]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
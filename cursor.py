@@ -0,0 +1,66 @@
+from typing import Iterator, Optional
+
+# rows made at once while the result is fetched
+DEFAULT_BATCH_ROWS = 4096
+
+
+class Cursor:
+    """
+    Rows of a select made on demand by batches, only the current batch is kept in memory.
+    The first batch is made right away, so the tables are read and errors are raised when the select runs,
+    not when it is fetched. Rows are fetched as from a DB-API cursor: fetchone, fetchmany, fetchall or iteration
+    """
+
+    def __init__(self, batches: Iterator[list], arraysize: int = 1):
+        self._batches = batches
+        self._rows = []
+        # next row of the current batch to fetch
+        self._position = 0
+        # default number of rows of fetchmany
+        self.arraysize = arraysize
+        self._fill()
+
+    def __iter__(self) -> 'Cursor':
+        return self
+
+    def __next__(self) -> list:
+        if not self._fill():
+            raise StopIteration
+        self._position += 1
+        return self._rows[self._position - 1]
+
+    def fetchone(self) -> Optional[list]:
+        return next(self, None)
+
+    def fetchmany(self, size: int = None) -> list:
+        size = self.arraysize if size is None else size
+        result = []
+        while len(result) < size and self._fill():
+            taken = self._rows[self._position:self._position + size - len(result)]
+            self._position += len(taken)
+            result += taken
+        return result
+
+    def fetchall(self) -> list:
+        result = []
+        while self._fill():
+            result += self._rows[self._position:]
+            self._position = len(self._rows)
+        return result
+
+    def close(self) -> None:
+        # reading of the table stops, files read in chunks are closed
+        if hasattr(self._batches, "close"):
+            self._batches.close()
+        self._batches = iter(())
+        self._rows, self._position = [], 0
+
+    def _fill(self) -> bool:
+        # the next batch is made once the current one is fetched, False when there are no more rows
+        while self._position >= len(self._rows):
+            batch = next(self._batches, None)
+            if batch is None:
+                self.close()
+                return False
+            self._rows, self._position = batch, 0
+        return True
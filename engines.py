@@ -0,0 +1,874 @@
+import csv
+import io
+import json
+import os
+import shutil
+from types import SimpleNamespace
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
+
+# types that can be declared for a column -> stored dtype
+TYPES = {
+    "int": "int64",
+    "int8": "int8",
+    "int16": "int16",
+    "int32": "int32",
+    "int64": "int64",
+    "float": "float64",
+    "float32": "float32",
+    "float64": "float64",
+    "text": "str",
+}
+
+# zone maps keep the smallest and the largest value of every block of this many rows
+ZONE_ROWS = 4096
+
+# dtypes untyped CSV columns of a kind are parsed with, other kinds are parsed as they are
+KIND_DTYPES = {
+    "int64": "int64",
+    "float64": "float64",
+    "missing": "float64",
+    "bool": "bool",
+    "str": "str",
+}
+
+
+class EngineException(Exception):
+    pass
+
+
+class Prefix(io.RawIOBase):
+    """
+    First size bytes of a file
+    """
+
+    def __init__(self, file, size: int):
+        self.file = file
+        self.left = size
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self.file.read(min(len(buffer), self.left))
+        buffer[:len(data)] = data
+        self.left -= len(data)
+        return len(data)
+
+
+def pandas_dtype(dtype: str) -> str:
+    """
+    In-memory dtype of a declared column: nullable sized integers, floats and categorical strings
+    """
+
+    if dtype == "str":
+        return "category"
+    if dtype.startswith("int"):
+        return dtype.capitalize()
+    return dtype
+
+
+def accepts(dtype: str, value: any) -> bool:
+    """
+    Can a column of the declared dtype store the value. The smallest integer of a type stands for missing value
+    """
+
+    if value is None:
+        return True
+    if dtype == "str":
+        return isinstance(value, str)
+    if isinstance(value, bool) or not isinstance(value, (int, float, np.integer, np.floating)):
+        return False
+    if dtype.startswith("int"):
+        info = np.iinfo(dtype)
+        return isinstance(value, (int, np.integer)) and info.min < value <= info.max
+    return True
+
+
+def zone_map(values: np.ndarray, missing: any = None) -> Optional[tuple]:
+    """
+    Zone map of a numeric column: (smallest values, largest values) of its blocks, missing values are skipped.
+    Blocks with only missing values get the smallest value above the largest one, so nothing falls into them.
+    None for columns of other types
+    """
+
+    if values.dtype.kind not in "iuf":
+        return None
+    starts = np.arange(0, len(values), ZONE_ROWS)
+    if not len(starts):
+        return np.empty(0, dtype=values.dtype), np.empty(0, dtype=values.dtype)
+    if values.dtype.kind == "f":
+        return np.asarray(np.fmin.reduceat(values, starts)), np.asarray(np.fmax.reduceat(values, starts))
+    if missing is None:
+        return np.asarray(np.minimum.reduceat(values, starts)), np.asarray(np.maximum.reduceat(values, starts))
+    info = np.iinfo(values.dtype)
+    present = values != missing
+    return (np.minimum.reduceat(np.where(present, values, info.max), starts),
+            np.maximum.reduceat(np.where(present, values, info.min), starts))
+
+
+def kind(values: Union[pd.Series, pd.Index]) -> str:
+    """
+    What pandas makes of an untyped CSV column: int64, float64, bool, str, missing when it has no values,
+    object for other mixes
+    """
+
+    if values.isna().all():
+        return "missing"
+    if str(values.dtype) in ("int64", "float64", "bool"):
+        return str(values.dtype)
+    if all(isinstance(value, str) for value in values.dropna()):
+        return "str"
+    return "object"
+
+
+def wider(first: Optional[str], second: str) -> Optional[str]:
+    """
+    Kind of a column made of rows of both kinds, None when it is not known without reading all of them again
+    """
+
+    kinds = {first, second}
+    if len(kinds) == 1:
+        return first
+    if None in kinds:
+        return None
+    if "str" in kinds:
+        return "str"
+    if kinds <= {"int64", "float64", "missing"}:
+        return "float64"
+    return None
+
+
+class DictionaryColumn:
+    """
+    Dictionary encoded string column: codes are positions of values in the dictionary, -1 for missing value
+    """
+
+    def __init__(self, codes: np.ndarray, dictionary: list):
+        self.codes = codes
+        self.dictionary = np.array(dictionary + [np.nan], dtype=object)
+        self._positions = None
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __eq__(self, value: any) -> np.ndarray:
+        code = self.code(value)
+        if code is None:
+            return np.zeros(len(self.codes), dtype=bool)
+        return self.codes == code
+
+    def code(self, value: any) -> Optional[int]:
+        if self._positions is None:
+            self._positions = {}
+            for code, entry in enumerate(self.dictionary[:-1]):
+                self._positions.setdefault(entry, code)
+        return self._positions.get(value)
+
+    def take(self, rows: np.ndarray) -> np.ndarray:
+        return self.dictionary[self.codes[rows]]
+
+    def categorical(self, rows: np.ndarray) -> pd.Categorical:
+        return pd.Categorical.from_codes(np.asarray(self.codes[rows]), self.dictionary[:-1])
+
+    def values(self) -> np.ndarray:
+        return self.dictionary[self.codes]
+
+
+class NullableColumn:
+    """
+    Integer column where the smallest value of its type is a missing value
+    """
+
+    def __init__(self, data: np.ndarray):
+        self.data = data
+        self.missing = np.iinfo(data.dtype).min
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __eq__(self, value: any) -> np.ndarray:
+        if value is None:
+            return np.zeros(len(self.data), dtype=bool)
+        return np.asarray(self.data == value) & np.asarray(self.data != self.missing)
+
+    def take(self, rows: np.ndarray) -> pd.api.extensions.ExtensionArray:
+        data = np.asarray(self.data[rows])
+        return pd.arrays.IntegerArray(data, data == self.missing)
+
+    def values(self) -> pd.api.extensions.ExtensionArray:
+        return self.take(np.arange(len(self.data)))
+
+
+class Engine:
+    """
+    Storage engine - knows how a table is laid out on disk.
+    Works with pandas DataFrames indexed by primary key, so it doesn't depend on Table/Storage
+    """
+
+    name = None
+    mmap = False
+    # types of untyped columns are guessed from the values every time they are read
+    infers = False
+
+    def path(self, working_dir: str, name: str) -> str:
+        raise NotImplementedError
+
+    def exists(self, path: str) -> bool:
+        return os.path.exists(path)
+
+    def create(self, path: str, primary_key: str, columns: list, types: dict = None) -> None:
+        """
+        Types are declared dtypes of some of the columns, values of the others keep types they are read with
+        """
+        raise NotImplementedError
+
+    def load(self, path: str, columns: list = None, types: dict = None) -> pd.DataFrame:
+        """
+        Columns are the ones to read besides the primary key, all of them by default
+        """
+        raise NotImplementedError
+
+    def scan(self, path: str, chunk_rows: int, columns: list = None, types: dict = None, kinds: dict = None):
+        """
+        Iterate over the table in DataFrames of at most chunk_rows rows.
+        Kinds of untyped columns in the whole table make every chunk read them as the whole table does
+        """
+        yield self.load(path, columns, types)
+
+    def nbytes(self, path: str) -> int:
+        """
+        Size of the table on disk
+        """
+        raise NotImplementedError
+
+    def open(self, path: str, columns: list = None) -> Optional[dict]:
+        """
+        Memory map the table instead of loading it: returns column -> array, primary key column goes first.
+        Returns None if the engine doesn't support it
+        """
+        return None
+
+    def zones(self, path: str, columns: list = None) -> dict:
+        """
+        Zone maps stored with the table: column -> (smallest values, largest values) of blocks of ZONE_ROWS rows
+        """
+        return {}
+
+    def append(self, path: str, data: dict, fsync: bool = False) -> np.ndarray:
+        """
+        Append rows to the end of the table. Data is a dict: column -> list of values, None for missing.
+        Returns offsets of the new rows
+        """
+        raise NotImplementedError
+
+    def header(self, path: str) -> list:
+        """
+        Primary key and columns of the table
+        """
+        raise NotImplementedError
+
+    def size(self, path: str) -> int:
+        """
+        Position right after the last row, offsets of rows are below it
+        """
+        raise NotImplementedError
+
+    def identity(self, path: str) -> int:
+        """
+        Changes when the table is created again
+        """
+        return os.stat(path).st_ino
+
+    def keys(self, path: str, column: str, start: int) -> tuple:
+        """
+        Values of the column in rows from start offset till the end: (values, offsets, end)
+        """
+        raise NotImplementedError
+
+    def read_rows(self, path: str, offsets: np.ndarray, columns: list = None, types: dict = None,
+                  kinds: dict = None) -> pd.DataFrame:
+        """
+        Read only rows at offsets, untyped columns of the kinds they have in the whole table
+        """
+        raise NotImplementedError
+
+    def kinds(self, path: str, columns: list, start: int = None) -> dict:
+        """
+        Kinds of the untyped columns in rows from start offset till the end, all rows by default.
+        Only engines that infer types have them
+        """
+        return {}
+
+    def signature(self, path: str) -> tuple:
+        """
+        Changes whenever the table is modified
+        """
+        raise NotImplementedError
+
+    def merge(self, path: str, df: pd.DataFrame, old_signature: tuple, signature: tuple,
+              types: dict = None) -> Optional[pd.DataFrame]:
+        """
+        Bring df loaded at old_signature up to date by reading only appended rows of its columns.
+        Returns None if it is not possible and the table has to be loaded again
+        """
+        return None
+
+    @staticmethod
+    def concat(df: pd.DataFrame, appended: pd.DataFrame) -> Optional[pd.DataFrame]:
+        """
+        Rows of both frames, None if appended rows were read with other types
+        """
+
+        df = df.copy(deep=False)
+        for column in df.columns:
+            # categories of new strings go after the existing ones, so codes of loaded rows stay the same
+            if isinstance(df[column].dtype, pd.CategoricalDtype) and \
+                    isinstance(appended[column].dtype, pd.CategoricalDtype):
+                categories = df[column].cat.categories
+                df[column] = df[column].cat.add_categories(appended[column].cat.categories.difference(categories))
+                appended[column] = appended[column].cat.set_categories(df[column].cat.categories)
+        if appended.index.dtype != df.index.dtype or not appended.dtypes.equals(df.dtypes):
+            return None
+        return pd.concat([df, appended])
+
+    def remove(self, path: str) -> None:
+        raise NotImplementedError
+
+    def usecols(self, path: str, columns: Optional[list]) -> Optional[list]:
+        """
+        Primary key and the columns in the order of the table, None for all columns
+        """
+
+        if columns is None:
+            return None
+        header = self.header(path)
+        return [column for i, column in enumerate(header) if i == 0 or column in columns]
+
+
+class CsvEngine(Engine):
+    """
+    Table is a single CSV file, primary key is the first column
+    """
+
+    name = "csv"
+    infers = True
+
+    ENCODING = "utf-8"
+
+    def path(self, working_dir: str, name: str) -> str:
+        return os.path.join(working_dir, "%s.csv" % name)
+
+    def create(self, path: str, primary_key: str, columns: list, types: dict = None) -> None:
+        pd.DataFrame(columns=[primary_key] + columns).to_csv(path, index=False, encoding=self.ENCODING)
+
+    @staticmethod
+    def read(filepath: Union[str, io.StringIO]) -> pd.DataFrame:
+        return pd.read_csv(filepath, index_col=0)
+
+    def load(self, path: str, columns: list = None, types: dict = None) -> pd.DataFrame:
+        return self._read_csv(lambda: path, types, index_col=0, usecols=self.usecols(path, columns))
+
+    def scan(self, path: str, chunk_rows: int, columns: list = None, types: dict = None, kinds: dict = None):
+        # only the rows the file has when the scan starts are read, rows appended while it goes on are not
+        usecols = self.usecols(path, columns)
+        with open(path, "rb") as f:
+            source = io.BufferedReader(Prefix(f, os.fstat(f.fileno()).st_size))
+            for chunk in pd.read_csv(source, index_col=0, usecols=usecols, dtype=self.dtypes(types, "Int64", kinds),
+                                     encoding=self.ENCODING, chunksize=chunk_rows):
+                yield self.typed(chunk, types)
+
+    @staticmethod
+    def dtypes(types: Optional[dict], int64: str = "int64", kinds: dict = None) -> Optional[dict]:
+        """
+        Dtypes declared columns are parsed with. Parsing nullable integers is several times slower than numbers,
+        so small integers are parsed as floats, which hold them exactly, and int64 with the given dtype.
+        Untyped columns of known kinds are parsed with the dtypes of their kinds
+        """
+
+        dtypes = {column: KIND_DTYPES[kind] for column, kind in (kinds or {}).items() if kind in KIND_DTYPES}
+        for column, dtype in (types or {}).items():
+            if dtype == "int64":
+                dtypes[column] = int64
+            elif dtype.startswith("int"):
+                dtypes[column] = "float64"
+            else:
+                dtypes[column] = pandas_dtype(dtype)
+        return dtypes or None
+
+    @staticmethod
+    def typed(df: pd.DataFrame, types: Optional[dict]) -> pd.DataFrame:
+        for column, dtype in (types or {}).items():
+            if not dtype.startswith("int"):
+                continue
+            if column == df.index.name:
+                df.index = df.index.astype(pandas_dtype(dtype))
+            elif column in df.columns:
+                df[column] = df[column].astype(pandas_dtype(dtype))
+        return df
+
+    def _read_csv(self, source, types: Optional[dict], kinds: dict = None, **kwargs) -> pd.DataFrame:
+        try:
+            df = pd.read_csv(source(), dtype=self.dtypes(types, kinds=kinds), **kwargs)
+        except ValueError:
+            # int64 column has missing values: floats hold integers up to 2 ** 53 exactly,
+            # bigger ones are parsed as nullable integers
+            df = pd.read_csv(source(), dtype=self.dtypes(types, "float64", kinds), **kwargs)
+            for column, dtype in types.items():
+                values = df.index if column == df.index.name else df.get(column)
+                if dtype == "int64" and values is not None and np.nanmax(np.abs(values), initial=0) > 2 ** 53:
+                    df = pd.read_csv(source(), dtype=self.dtypes(types, "Int64", kinds), **kwargs)
+                    break
+        return self.typed(df, types)
+
+    def nbytes(self, path: str) -> int:
+        return os.path.getsize(path)
+
+    def append(self, path: str, data: dict, fsync: bool = False) -> np.ndarray:
+        size = max(len(values) for values in data.values())
+        lines = []
+        writer = csv.writer(SimpleNamespace(write=lines.append), lineterminator="\n")
+        for i in range(size):
+            writer.writerow([values[i] for values in data.values()])
+        lines = [line.encode(self.ENCODING) for line in lines]
+
+        with open(path, "ab") as f:
+            f.seek(0, os.SEEK_END)
+            end = f.tell()
+            f.write(b"".join(lines))
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        return end + np.concatenate([[0], np.cumsum([len(line) for line in lines])[:-1]]).astype(np.int64)
+
+    def header(self, path: str) -> list:
+        with open(path, newline="", encoding=self.ENCODING) as f:
+            return next(csv.reader(f))
+
+    def size(self, path: str) -> int:
+        return os.path.getsize(path)
+
+    def keys(self, path: str, column: str, start: int) -> tuple:
+        position = self.header(path).index(column)
+        with open(path, "rb") as f:
+            f.readline()
+            start = max(start, f.tell())
+            f.seek(start)
+            data = f.read()
+        # an unfinished row may be being written right now
+        data = data[:data.rfind(b"\n") + 1]
+        end = start + len(data)
+        if not data:
+            return np.empty(0, dtype=object), np.empty(0, dtype=np.int64), end
+
+        lines = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == ord("\n"))
+        offsets = start + np.concatenate([[0], lines[:-1] + 1])
+        values = pd.read_csv(io.BytesIO(data), header=None, usecols=[position], dtype=str, keep_default_na=False,
+                             skip_blank_lines=False)[position].to_numpy(dtype=object)
+        if len(values) != len(offsets):
+            # some values contain line breaks, so rows have to be split one by one
+            offsets, records = zip(*self._records(data, start))
+            values = np.array([next(csv.reader([record.decode(self.ENCODING)]))[position] for record in records],
+                              dtype=object)
+            offsets = np.array(offsets, dtype=np.int64)
+        return values, offsets, end
+
+    def read_rows(self, path: str, offsets: np.ndarray, columns: list = None, types: dict = None,
+                  kinds: dict = None) -> pd.DataFrame:
+        with open(path, "rb") as f:
+            records = [f.readline()]
+            for offset in sorted(offsets):
+                f.seek(offset)
+                records.append(self._record(f))
+        data = b"".join(records)
+        return self._read_csv(lambda: io.BytesIO(data), types, kinds, index_col=0, usecols=self.usecols(path, columns))
+
+    def kinds(self, path: str, columns: list, start: int = None) -> dict:
+        header = self.header(path)
+        with open(path, "rb") as f:
+            f.readline()
+            f.seek(max(start or 0, f.tell()))
+            data = f.read()
+        # an unfinished row may be being written right now
+        data = data[:data.rfind(b"\n") + 1]
+        if not data:
+            return {column: "missing" for column in columns}
+        df = pd.read_csv(io.BytesIO(data), header=None, names=header, usecols=columns, encoding=self.ENCODING)
+        return {column: kind(df[column]) for column in columns}
+
+    @staticmethod
+    def _record(f: io.BufferedReader) -> bytes:
+        # a quoted value may contain line breaks, the row ends on a line break outside of quotes
+        record = f.readline()
+        while record.count(b'"') % 2:
+            line = f.readline()
+            if not line:
+                break
+            record += line
+        return record
+
+    @staticmethod
+    def _records(data: bytes, start: int):
+        f = io.BytesIO(data)
+        while f.tell() < len(data):
+            offset = f.tell()
+            yield start + offset, CsvEngine._record(f)
+
+    def signature(self, path: str) -> tuple:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def merge(self, path: str, df: pd.DataFrame, old_signature: tuple, signature: tuple,
+              types: dict = None) -> Optional[pd.DataFrame]:
+        # the file is append-only, so if it has only grown the new rows are at the end
+        _, offset, inode = old_signature
+        if inode != signature[2] or offset >= signature[1] or df.empty:
+            return None
+
+        with open(path, "rb") as f:
+            f.seek(offset - 1)
+            if f.read(1) != b"\n":
+                return None
+            tail = f.read()
+
+        appended = self._read_csv(lambda: io.BytesIO(tail), types, header=None, names=self.header(path),
+                                  usecols=[df.index.name] + df.columns.to_list(), index_col=0)
+        return self.concat(df, appended[df.columns])
+
+    def remove(self, path: str) -> None:
+        os.remove(path)
+
+
+class ColumnarEngine(Engine):
+    """
+    Table is a directory with a raw binary file per column and schema.json.
+    Numbers are stored as int64/float64, strings are dictionary encoded:
+    int32 codes in the column file and distinct values in <column>.dict, one JSON string per line.
+    Column type is declared on create or fixed by the first value written into it.
+    Declared integer columns keep their size, the smallest value of the type stands for missing value.
+    Schema holds the number of rows and is replaced atomically after every append,
+    so a partially written append is never visible.
+    A column that has to hold floats after integers is written into a new <column>.float64.bin,
+    schema "files" points at it since the same replace, readers of the old schema keep the old file.
+    Numeric columns have zone maps in <column>.zone: smallest and largest values of every block of rows.
+    Append rewrites only the zones of the blocks it writes into, zones of uncommitted rows may only
+    make a block wider, so they are never wrong for the committed ones.
+    """
+
+    name = "columnar"
+    mmap = True
+
+    SCHEMA = "schema.json"
+    MISSING = -1
+
+    def path(self, working_dir: str, name: str) -> str:
+        return os.path.join(working_dir, "%s.col" % name)
+
+    def create(self, path: str, primary_key: str, columns: list, types: dict = None) -> None:
+        os.mkdir(path)
+        types = types or {}
+        schema = {
+            "primary_key": primary_key,
+            "columns": columns,
+            "dtypes": {column: types.get(column) for column in [primary_key] + columns},
+            "types": types,
+            "rows": 0,
+        }
+        self._save_schema(path, schema)
+
+    def schema(self, path: str) -> dict:
+        with open(os.path.join(path, self.SCHEMA)) as f:
+            return json.load(f)
+
+    def load(self, path: str, columns: list = None, types: dict = None) -> pd.DataFrame:
+        return self._read(path, self.schema(path), 0, columns=columns)
+
+    def scan(self, path: str, chunk_rows: int, columns: list = None, types: dict = None, kinds: dict = None):
+        schema = self.schema(path)
+        for offset in range(0, schema["rows"], chunk_rows):
+            yield self._read(path, schema, offset, chunk_rows, columns)
+
+    def nbytes(self, path: str) -> int:
+        return sum(entry.stat().st_size for entry in os.scandir(path))
+
+    def open(self, path: str, columns: list = None) -> Optional[dict]:
+        schema = self.schema(path)
+        rows = schema["rows"]
+        data = {}
+        for column in self._columns(schema, columns):
+            dtype = schema["dtypes"][column]
+            if dtype is None:
+                data[column] = np.full(rows, np.nan, dtype=object)
+            elif dtype == "str":
+                data[column] = DictionaryColumn(self._map(path, self._file(schema, column), np.int32, rows),
+                                                self._dictionary(path, column))
+            elif column in schema.get("types", {}) and dtype.startswith("int"):
+                data[column] = NullableColumn(self._map(path, self._file(schema, column), np.dtype(dtype), rows))
+            else:
+                data[column] = self._map(path, self._file(schema, column), np.dtype(dtype), rows)
+        return data
+
+    def append(self, path: str, data: dict, fsync: bool = False) -> np.ndarray:
+        schema = self.schema(path)
+        rows = schema["rows"]
+        size = max(len(values) for values in data.values())
+
+        encoded = {}
+        for column, values in data.items():
+            dtype = schema["dtypes"][column]
+            if column in schema.get("types", {}):
+                encoded[column] = self._encode(path, column, dtype, values, fsync)
+                continue
+            kind = self._kind(column, values, dtype, rows)
+            if kind is None:
+                kind = dtype
+            elif dtype is None or (dtype == "int64" and kind == "float64"):
+                # column had only missing values or has to hold floats from now on
+                self._retype(path, schema, column, kind, rows)
+            encoded[column] = self._encode(path, column, kind, values, fsync)
+
+        for column, array in encoded.items():
+            if array is not None:
+                self._write(path, self._file(schema, column), array, rows, fsync)
+                if schema["dtypes"][column] == "str":
+                    # dictionary codes are not ordered as the strings, zones are kept for numbers only
+                    continue
+                declared = column in schema.get("types", {}) and array.dtype.kind == "i"
+                missing = np.iinfo(array.dtype).min if declared else None
+                self._write_zones(path, self._file(schema, column), array.dtype, rows, rows + size, missing)
+
+        schema["rows"] = rows + size
+        self._save_schema(path, schema, fsync)
+        return np.arange(rows, rows + size)
+
+    def zones(self, path: str, columns: list = None) -> dict:
+        schema = self.schema(path)
+        blocks = -(-schema["rows"] // ZONE_ROWS)
+        zones = {}
+        for column in self._columns(schema, columns):
+            dtype = schema["dtypes"][column]
+            filepath = os.path.join(path, "%s.zone" % self._file(schema, column))
+            if dtype in (None, "str") or not os.path.exists(filepath):
+                continue
+            data = np.fromfile(filepath, dtype=np.dtype(dtype), count=blocks * 2)
+            if len(data) == blocks * 2:
+                zones[column] = (data[0::2], data[1::2])
+        return zones
+
+    def header(self, path: str) -> list:
+        schema = self.schema(path)
+        return [schema["primary_key"]] + schema["columns"]
+
+    def size(self, path: str) -> int:
+        return self.schema(path)["rows"]
+
+    def keys(self, path: str, column: str, start: int) -> tuple:
+        data = self.open(path)
+        offsets = np.arange(start, len(data[column]))
+        return np.asarray(data[column].take(offsets), dtype=object), offsets, len(data[column])
+
+    def read_rows(self, path: str, offsets: np.ndarray, columns: list = None, types: dict = None,
+                  kinds: dict = None) -> pd.DataFrame:
+        data = self.open(path, columns)
+        types = self.schema(path).get("types", {})
+        offsets = np.sort(offsets)
+        rows = {}
+        for column, values in data.items():
+            if isinstance(values, DictionaryColumn) and column in types:
+                rows[column] = values.categorical(offsets)
+            elif isinstance(values, NullableColumn):
+                rows[column] = values.take(offsets)
+            else:
+                rows[column] = np.asarray(values.take(offsets))
+        return pd.DataFrame(rows).set_index(next(iter(data)))
+
+    def signature(self, path: str) -> tuple:
+        stat = os.stat(os.path.join(path, self.SCHEMA))
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino, self.schema(path)["rows"]
+
+    def merge(self, path: str, df: pd.DataFrame, old_signature: tuple, signature: tuple,
+              types: dict = None) -> Optional[pd.DataFrame]:
+        offset = old_signature[3]
+        if offset >= signature[3] or df.empty:
+            return None
+        return self.concat(df, self._read(path, self.schema(path), offset, columns=df.columns.to_list()))
+
+    def remove(self, path: str) -> None:
+        shutil.rmtree(path)
+
+    def _read(self, path: str, schema: dict, offset: int, count: int = None, columns: list = None) -> pd.DataFrame:
+        rows = schema["rows"] - offset
+        if count is not None:
+            rows = min(rows, count)
+        data = {}
+        types = schema.get("types", {})
+        for column in self._columns(schema, columns):
+            dtype = schema["dtypes"][column]
+            if dtype is None:
+                data[column] = np.full(rows, np.nan, dtype=object)
+            elif dtype == "str" and column in types:
+                codes = self._column(path, self._file(schema, column), np.int32, offset, rows)
+                data[column] = pd.Categorical.from_codes(codes, self._dictionary(path, column))
+            elif dtype == "str":
+                codes = self._column(path, self._file(schema, column), np.int32, offset, rows)
+                dictionary = np.array(self._dictionary(path, column) + [np.nan], dtype=object)
+                data[column] = dictionary[codes]
+            elif column in types and dtype.startswith("int"):
+                values = self._column(path, self._file(schema, column), np.dtype(dtype), offset, rows)
+                data[column] = pd.arrays.IntegerArray(values, values == np.iinfo(values.dtype).min)
+            else:
+                data[column] = self._column(path, self._file(schema, column), np.dtype(dtype), offset, rows)
+        return pd.DataFrame(data).set_index(schema["primary_key"])
+
+    @staticmethod
+    def _columns(schema: dict, columns: Optional[list]) -> list:
+        if columns is None:
+            return [schema["primary_key"]] + schema["columns"]
+        return [schema["primary_key"]] + [column for column in schema["columns"] if column in columns]
+
+    @staticmethod
+    def _file(schema: dict, column: str) -> str:
+        # name of the column files without extension, a retyped column has its own
+        return schema.get("files", {}).get(column, column)
+
+    @staticmethod
+    def _column(path: str, name: str, dtype: np.dtype, offset: int, rows: int) -> np.ndarray:
+        with open(os.path.join(path, "%s.bin" % name), "rb") as f:
+            f.seek(offset * np.dtype(dtype).itemsize)
+            return np.fromfile(f, dtype=dtype, count=rows)
+
+    @staticmethod
+    def _map(path: str, name: str, dtype: np.dtype, rows: int) -> np.ndarray:
+        if not rows:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(os.path.join(path, "%s.bin" % name), dtype=dtype, mode="r", shape=(rows,))
+
+    @staticmethod
+    def _dictionary(path: str, column: str) -> list:
+        filepath = os.path.join(path, "%s.dict" % column)
+        if not os.path.exists(filepath):
+            return []
+        with open(filepath) as f:
+            return [json.loads(line) for line in f]
+
+    @staticmethod
+    def _kind(column: str, values: list, dtype: Optional[str], rows: int) -> Optional[str]:
+        kinds = set()
+        for value in values:
+            if value is None:
+                kinds.add(None)
+            elif isinstance(value, str):
+                kinds.add("str")
+            elif isinstance(value, (int, np.integer)):
+                kinds.add("int64")
+            elif isinstance(value, (float, np.floating)):
+                kinds.add("float64")
+            else:
+                raise EngineException("Column %s can't store value %r" % (column, value))
+
+        # there is no missing value for integers, so they are stored as floats
+        missing = None in kinds or (dtype is None and rows > 0)
+        kinds.discard(None)
+        if dtype is not None:
+            kinds.add(dtype)
+
+        if not kinds:
+            return None
+        if kinds == {"str"}:
+            return "str"
+        if "str" in kinds:
+            raise EngineException("Column %s can't store strings and numbers together" % column)
+        return "float64" if missing or "float64" in kinds else "int64"
+
+    def _retype(self, path: str, schema: dict, column: str, kind: str, rows: int) -> None:
+        dtype = schema["dtypes"][column]
+        if dtype is None:
+            if kind == "str":
+                array = np.full(rows, self.MISSING, dtype=np.int32)
+            else:
+                array = np.full(rows, np.nan, dtype=np.float64)
+        else:
+            array = self._column(path, self._file(schema, column), np.dtype(dtype), 0, rows).astype(np.dtype(kind))
+            # readers of the committed schema still read the old file, the new one is used since the schema is saved
+            schema.setdefault("files", {})[column] = "%s.%s" % (column, kind)
+        filepath = os.path.join(path, "%s.bin" % self._file(schema, column))
+        with open(filepath + ".tmp", "wb") as f:
+            f.write(array.tobytes())
+        os.replace(filepath + ".tmp", filepath)
+        # zones of the new file are built by the append
+        if os.path.exists(os.path.join(path, "%s.zone" % self._file(schema, column))):
+            os.remove(os.path.join(path, "%s.zone" % self._file(schema, column)))
+        schema["dtypes"][column] = kind
+
+    def _encode(self, path: str, column: str, kind: Optional[str], values: list, fsync: bool) -> Optional[np.ndarray]:
+        if kind is None:
+            return None
+        if kind != "str":
+            dtype = np.dtype(kind)
+            missing = np.iinfo(dtype).min if dtype.kind == "i" else np.nan
+            return np.array([missing if value is None else value for value in values], dtype=dtype)
+
+        entries = self._dictionary(path, column)
+        dictionary = {value: code for code, value in reversed(list(enumerate(entries)))}
+        size = len(entries)
+        added = []
+        codes = np.empty(len(values), dtype=np.int32)
+        for i, value in enumerate(values):
+            if value is None:
+                codes[i] = self.MISSING
+                continue
+            if value not in dictionary:
+                dictionary[value] = size
+                size += 1
+                added.append(value)
+            codes[i] = dictionary[value]
+
+        if added:
+            with open(os.path.join(path, "%s.dict" % column), "a") as f:
+                f.write("".join(json.dumps(value) + "\n" for value in added))
+                if fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+        return codes
+
+    @staticmethod
+    def _write(path: str, name: str, array: np.ndarray, offset: int, fsync: bool = False) -> None:
+        # write right after the last committed row, dropping leftovers of an interrupted append
+        filepath = os.path.join(path, "%s.bin" % name)
+        with open(filepath, "r+b" if os.path.exists(filepath) else "wb") as f:
+            f.seek(offset * array.itemsize)
+            f.write(array.tobytes())
+            f.truncate()
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _write_zones(self, path: str, name: str, dtype: np.dtype, rows: int, size: int, missing: any) -> None:
+        # zones from the block of the first written row, or of all blocks if some of them are missing
+        if dtype.kind not in "iuf":
+            return
+        filepath = os.path.join(path, "%s.zone" % name)
+        first = rows // ZONE_ROWS
+        if not os.path.exists(filepath) or os.path.getsize(filepath) < first * 2 * dtype.itemsize:
+            first = 0
+        values = self._column(path, name, dtype, first * ZONE_ROWS, size - first * ZONE_ROWS)
+        mins, maxs = zone_map(values, missing)
+        with open(filepath, "r+b" if os.path.exists(filepath) else "wb") as f:
+            f.seek(first * 2 * dtype.itemsize)
+            f.write(np.column_stack([mins, maxs]).tobytes())
+            f.truncate()
+
+    def _save_schema(self, path: str, schema: dict, fsync: bool = False) -> None:
+        tmp = os.path.join(path, self.SCHEMA + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(schema, f)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(path, self.SCHEMA))
+
+
+ENGINES = {engine.name: engine for engine in (CsvEngine(), ColumnarEngine())}
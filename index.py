@@ -0,0 +1,211 @@
+import contextlib
+import os
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+MAGIC = b"YASIHIX1"
+HEADER = np.dtype([("magic", "S8"), ("capacity", "<i8"), ("count", "<i8"), ("covered", "<i8"), ("identity", "<i8")])
+HEADER_SIZE = 64
+SLOT = np.dtype([("hash", "<u8"), ("offset", "<i8")])
+EMPTY = -1
+MIN_CAPACITY = 1024
+MAX_LOAD = 0.5
+
+
+@contextlib.contextmanager
+def lock_file(path: str):
+    """
+    Exclusive lock shared by processes, held while the context is open
+    """
+
+    with open(path, "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def index_key(value: any) -> str:
+    # keys are compared by text, as they are stored in CSV: 100 == '100' == 100.0
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        value = int(value)
+    return str(value)
+
+
+def hash_key(value: any) -> str:
+    # rows found by hash are checked by the caller, so the text is loose enough to hash
+    # the same number the same way whether it came from a query, a CSV file or a float column
+    if value is None or value is pd.NA:
+        return ""
+    if isinstance(value, str):
+        for number in (int, float):
+            try:
+                return hash_key(number(value))
+            except ValueError:
+                pass
+        return value
+    if isinstance(value, (float, np.floating)) and np.isnan(value):
+        return ""
+    return index_key(value)
+
+
+def hash_keys(values: any) -> np.ndarray:
+    """
+    64 bit hashes of keys, stable between processes
+    """
+
+    keys = np.array([hash_key(value) for value in values], dtype=object)
+    return pd.util.hash_array(keys, categorize=False)
+
+
+class HashIndex:
+    """
+    Persistent hash index: open addressing table of (key hash, row offset) slots in a memory mapped file.
+    Keys themselves are not stored, so rows found by hash have to be checked by the caller.
+    Several rows may have the same key.
+    Header keeps position in the table data covered by the index and identity of the table,
+    so rows appended without updating the index can be added later, and the index of a dropped table
+    is never used for a new one.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def header(self) -> Optional[np.void]:
+        if not self.exists():
+            return None
+        with open(self.path, "rb") as f:
+            header = np.frombuffer(f.read(HEADER.itemsize), dtype=HEADER)
+        if len(header) != 1 or header[0]["magic"] != MAGIC:
+            return None
+        return header[0]
+
+    def covers(self, identity: int, size: int) -> Optional[int]:
+        """
+        Position in the table data up to which the index is valid, or None if it must be built from scratch
+        """
+
+        header = self.header()
+        if header is None or header["identity"] != identity or header["covered"] > size:
+            return None
+        return int(header["covered"])
+
+    def create(self, identity: int, hashes: np.ndarray, offsets: np.ndarray, covered: int) -> None:
+        capacity = MIN_CAPACITY
+        while len(hashes) > capacity * MAX_LOAD:
+            capacity *= 2
+
+        header = np.zeros(1, dtype=HEADER)
+        header[0] = (MAGIC, capacity, len(hashes), covered, identity)
+        slots = np.empty(capacity, dtype=SLOT)
+        slots["hash"] = 0
+        slots["offset"] = EMPTY
+        self._insert(slots, hashes, offsets)
+
+        # readers may still use the old file, so a new one replaces it
+        tmp = "%s.%d.tmp" % (self.path, os.getpid())
+        with open(tmp, "wb") as f:
+            f.write(header.tobytes().ljust(HEADER_SIZE, b"\0"))
+            f.write(slots.tobytes())
+        os.replace(tmp, self.path)
+
+    def add(self, hashes: np.ndarray, offsets: np.ndarray, covered: int) -> None:
+        header = self.header()
+        if header["count"] + len(hashes) > header["capacity"] * MAX_LOAD:
+            slots = self._slots("r")
+            used = slots[slots["offset"] != EMPTY]
+            self.create(int(header["identity"]), np.concatenate([used["hash"], hashes]),
+                        np.concatenate([used["offset"], offsets]), covered)
+            return
+
+        # shared mappings are visible to other processes without msync,
+        # and the index can always be rebuilt from the table, so it isn't flushed to disk
+        self._insert(self._slots("r+"), hashes, offsets)
+        header = np.memmap(self.path, dtype=HEADER, mode="r+", shape=(1,))
+        header["count"] += len(hashes)
+        header["covered"] = covered
+
+    def lookup(self, hashes: np.ndarray) -> tuple:
+        """
+        Find rows by key hashes: (positions in hashes, row offsets) for every candidate row, ordered by position
+        """
+
+        slots = self._slots("r")
+        mask = len(slots) - 1
+        position = (hashes & np.uint64(mask)).astype(np.int64)
+        active = np.arange(len(hashes))
+        found, offsets = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+        while len(active):
+            entries = slots[position[active]]
+            empty = entries["offset"] == EMPTY
+            match = ~empty & (entries["hash"] == hashes[active])
+            found.append(active[match])
+            offsets.append(entries["offset"][match])
+            active = active[~empty]
+            position[active] = (position[active] + 1) & mask
+        found, offsets = np.concatenate(found), np.concatenate(offsets)
+        order = np.argsort(found, kind="stable")
+        return found[order], offsets[order]
+
+    def distinct(self) -> int:
+        """
+        Number of distinct key hashes, an estimate of the number of distinct keys
+        """
+
+        slots = self._slots("r")
+        return len(np.unique(slots["hash"][slots["offset"] != EMPTY]))
+
+    def new(self, hashes: np.ndarray) -> int:
+        """
+        Number of distinct hashes that are not in the index yet
+        """
+
+        found, _ = self.lookup(hashes)
+        return len(np.unique(np.delete(hashes, found)))
+
+    def remove(self) -> None:
+        if self.exists():
+            os.remove(self.path)
+
+    def lock(self):
+        """
+        Exclusive lock for writers of the table and its index
+        """
+
+        return lock_file(self.path + ".lock")
+
+    def _slots(self, mode: str) -> np.memmap:
+        capacity = int(self.header()["capacity"])
+        return np.memmap(self.path, dtype=SLOT, mode=mode, offset=HEADER_SIZE, shape=(capacity,))
+
+    @staticmethod
+    def _insert(slots: np.ndarray, hashes: np.ndarray, offsets: np.ndarray) -> None:
+        # linear probing done for all keys at once: in every round each free slot
+        # takes one of the keys pointing to it, the rest move to the next slot
+        mask = len(slots) - 1
+        position = (hashes & np.uint64(mask)).astype(np.int64)
+        pending = np.arange(len(hashes))
+        while len(pending):
+            free = slots["offset"][position[pending]] == EMPTY
+            candidates = pending[free]
+            _, first = np.unique(position[candidates], return_index=True)
+            placed = candidates[first]
+            slots["hash"][position[placed]] = hashes[placed]
+            slots["offset"][position[placed]] = offsets[placed]
+
+            pending = np.setdiff1d(pending, placed, assume_unique=True)
+            busy = pending[slots["offset"][position[pending]] != EMPTY]
+            position[busy] = (position[busy] + 1) & mask
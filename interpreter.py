@@ -1,35 +1,37 @@
-import re
+import time
 
 import nodes
-from storage import Storage
+import vm
+from cursor import DEFAULT_BATCH_ROWS, Cursor
+from engines import CsvEngine
+from nodes import NodeVisitor
+from optimizer import optimize
+from planner import Plan, Planner
+from storage import Expression, Or, ResultCache, Storage
 from tokens import TokenType
 
-UNDERSCORE_RE = re.compile(r'(?<!^)(?=[A-Z])')
-
-
-def get_visit_method_name(node: nodes.Node) -> str:
-    if not isinstance(node, nodes.Node):
-        raise Exception("Must be instance of ast.Node")
-    name = type(node).__name__
-    return "visit_%s" % UNDERSCORE_RE.sub('_', name).lower()
-
-
-class NodeVisitor:
-
-    def visit(self, node: nodes.Node) -> any:
-        method_name = get_visit_method_name(node)
-        visitor = getattr(self, method_name, self.generic_visit)
-        return visitor(node)
-
-    def generic_visit(self, node: nodes.Node):
-        raise NotImplementedError("Method = %s for node %s not implemented" % (get_visit_method_name(node), node))
+COMPARISONS = {
+    TokenType.NOT_EQUALS: "!=",
+    TokenType.LESS: "<",
+    TokenType.LESS_EQUALS: "<=",
+    TokenType.GREATER: ">",
+    TokenType.GREATER_EQUALS: ">=",
+}
 
 
 class Interpreter(NodeVisitor):
 
-    def __init__(self, tree: nodes.Node, working_dir: str) -> None:
-        self.tree = tree
-        self.storage = Storage(working_dir)
+    def __init__(self, tree: nodes.Node, working_dir: str, engine: str = CsvEngine.name,
+                 optimized: bool = False, results: ResultCache = None) -> None:
+        # constant expressions and conditions are simplified once, before the statements are run,
+        # trees from the statement cache are optimized already
+        self.tree = tree if tree is None or optimized else optimize(tree)
+        self.storage = Storage(working_dir, engine=engine)
+        self.planner = Planner(self.storage)
+        # results of selects are cached only when the cache is given
+        self.results = results
+        # selects give cursors instead of lists of rows
+        self.cursors = False
 
     def visit_empty(self, node: nodes.Empty) -> None:
         return None
@@ -50,10 +52,24 @@ class Interpreter(NodeVisitor):
         return node.name
 
     def visit_column(self, node: nodes.Column) -> str:
+        if node.table is not None:
+            return "%s.%s" % (self.visit(node.table), node.name)
         return node.name
 
+    def visit_index(self, node: nodes.Index) -> str:
+        return node.name
+
+    def visit_type(self, node: nodes.Type) -> str:
+        return node.name
+
+    def visit_aggregate(self, node: nodes.Aggregate) -> tuple:
+        return node.function, self.visit(node.column)
+
+    def visit_join(self, node: nodes.Join) -> tuple:
+        return self.visit(node.table), (self.visit(node.left), self.visit(node.right))
+
     def visit_order(self, node: nodes.Order):
-        column = self.visit(node.column)
+        column = self.operand(node.column)
         if node.order == TokenType.ASC:
             return column, True
         elif node.order == TokenType.DESC:
@@ -62,27 +78,59 @@ class Interpreter(NodeVisitor):
             raise Exception('Unknown sort order %s' % node.order)
 
     def visit_binary_operation(self, node: nodes.BinaryOperation) -> int:
-        if node.operation == TokenType.PLUS:
-            return self.visit(node.left) + self.visit(node.right)
-        elif node.operation == TokenType.MINUS:
-            return self.visit(node.left) - self.visit(node.right)
-        elif node.operation == TokenType.MUL:
-            return self.visit(node.left) * self.visit(node.right)
-        elif node.operation == TokenType.DIV:
-            return self.visit(node.left) // self.visit(node.right)
-        else:
-            raise Exception('Unknown operation %s' % node.operation)
+        return vm.run(vm.compiled(node))
+
+    def operand(self, node: nodes.Node) -> any:
+        """
+        Column, aggregate or expression computed by storage on whole columns
+        """
+
+        if isinstance(node, (nodes.BinaryOperation, nodes.Number)):
+            return Expression(vm.compiled(node))
+        if isinstance(node, nodes.String):
+            # only a parameter gives a string here, it must not become a name of a column
+            raise Exception("String %s can't be a column or an expression" % node.value)
+        return self.visit(node)
+
+    def value(self, node: nodes.Node) -> any:
+        """
+        Value compared with in a condition: literal, expression of literals
+        or expression over columns computed by storage for every row
+        """
+
+        code = vm.compiled(node)
+        if code.columns:
+            return Expression(code)
+        return vm.run(code)
 
     def visit_assign(self, node: nodes.Assign) -> tuple:
-        var = self.visit(node.left)
-        value = self.visit(node.right)
+        var = self.operand(node.left)
+        value = self.value(node.right)
         return var, value
 
+    def visit_comparison(self, node: nodes.Comparison) -> tuple:
+        if node.operation not in COMPARISONS:
+            raise Exception('Unknown comparison %s' % node.operation)
+        return self.operand(node.left), COMPARISONS[node.operation], self.value(node.right)
+
+    def visit_or(self, node: nodes.Or) -> Or:
+        return Or([[self.visit(condition) for condition in branch] for branch in node.branches])
+
     def visit_create_statement(self, node: nodes.CreateStatement) -> bool:
         table = self.visit(node.table)
         primary_key = self.visit(node.primary_key)
         columns = [self.visit(column) for column in node.columns]
-        return self.storage.create(table, primary_key, columns)
+        types = {}
+        for column, column_type in zip([primary_key] + columns, node.types):
+            if not isinstance(column_type, nodes.Empty):
+                types[column] = self.visit(column_type)
+        return self.storage.create(table, primary_key, columns, types=types)
+
+    def visit_create_index_statement(self, node: nodes.CreateIndexStatement) -> bool:
+        index = self.visit(node.index)
+        table = self.visit(node.table)
+        column = self.visit(node.column)
+        return self.storage.create_index(table, index, column)
 
     def visit_describe_statement(self, node: nodes.DescribeStatement) -> list:
         table = self.visit(node.table)
@@ -93,17 +141,92 @@ class Interpreter(NodeVisitor):
         assignments = [self.visit(asignee) for asignee in node.assignments]
         return self.storage.insert(table, assignments)
 
+    def visit_insert_values_statement(self, node: nodes.InsertValuesStatement) -> None:
+        table = self.visit(node.table)
+        columns = [self.visit(column) for column in node.columns]
+        rows = [list(zip(columns, [self.visit(value) for value in values])) for values in node.rows]
+        return self.storage.insert_many(table, rows)
+
     def visit_select_statement(self, node: nodes.SelectStatement) -> list:
         if isinstance(node.result, nodes.BinaryOperation) or isinstance(node.result, nodes.Number):
             return self.visit(node.result)
+        elif self.results is not None:
+            return self.cached(node)
+        elif self.cursors:
+            return Cursor(self.plan(node).stream(DEFAULT_BATCH_ROWS))
         else:
-            table = self.visit(node.table)
-            result = [self.visit(column) for column in node.result]
-            where = [self.visit(asignee) for asignee in node.where]
-            limit = self.visit(node.limit)
-            order = self.visit(node.order)
-            return self.storage.select(table, result, where, order, limit)
-
-    def do(self):
+            return self.plan(node).rows()
+
+    def cached(self, node: nodes.SelectStatement) -> list:
+        """
+        Rows of the select from the result cache, they are shared and must not be changed.
+        Query is the select with bound values as storage gets it, so texts that differ only in spacing
+        or in constant expressions share the result. Results read by a cursor are not cached:
+        they are read by parts to not keep big results in memory
+        """
+
+        query = self.query(node)
+        names = [query[0]] + ([query[-1][0]] if query[-1] is not None else [])
+        if not all(self.storage.exists(name) for name in names):
+            return self.plan(node).rows()
+        # signatures are taken before the run, so a write during it leaves a stale entry, not a wrong one
+        tables = tuple((name, self.storage.cache_key(name), self.storage.signature(name)) for name in names)
+        rows = self.results.get(repr(query), tables)
+        if rows is None and self.cursors:
+            return Cursor(self.plan(node).stream(DEFAULT_BATCH_ROWS))
+        if rows is None:
+            rows = self.plan(node).rows()
+            self.results.put(repr(query), tables, rows)
+        return Cursor(iter([rows])) if self.cursors else rows
+
+    def visit_explain_statement(self, node: nodes.ExplainStatement) -> list:
+        """
+        Lines of the plan. With analyze the statement is run and every line is
+        [stage, milliseconds, rows in, rows out, bytes of column data read]
+        """
+
+        statement = node.statement
+        expression = isinstance(statement.result, nodes.BinaryOperation) or isinstance(statement.result, nodes.Number)
+        plan = None if expression else self.plan(statement)
+        if not node.analyze:
+            return [["Expression"]] if plan is None else [[line] for line in plan.explain()]
+
+        lines = [
+            ["Lexing", round(node.lexing * 1000, 3), None, node.tokens, None],
+            ["Parsing", round(node.parsing * 1000, 3), node.tokens, None, None],
+        ]
+        if plan is None:
+            start = time.perf_counter()
+            self.visit(statement.result)
+            return lines + [["Expression", round((time.perf_counter() - start) * 1000, 3), None, 1, None]]
+        return lines + plan.analyze()
+
+    def query(self, node: nodes.SelectStatement) -> tuple:
+        """
+        Table, result, where, order, limit, group and join of the select as the planner takes them
+        """
+
+        table = self.visit(node.table)
+        result = [self.operand(column) for column in node.result]
+        where = [self.visit(asignee) for asignee in node.where]
+        group = [self.visit(column) for column in node.group]
+        limit = self.visit(node.limit)
+        order = self.visit(node.order)
+        join = self.visit(node.join) if node.join is not None else None
+        return table, result, where, order, limit, group, join
+
+    def plan(self, node: nodes.SelectStatement) -> Plan:
+        table, result, where, order, limit, group, join = self.query(node)
+        if join is not None:
+            joined, on = join
+            return self.planner.join(table, joined, on, result, where, order, limit, group)
+        return self.planner.select(table, result, where, order, limit, group)
+
+    def do(self, cursor: bool = False):
+        """
+        Results of the statements, rows of selects are lists or, with cursor, cursors fetching them by parts
+        """
+
+        self.cursors = cursor
         if self.tree is not None:
             return self.visit(self.tree)
@@ -1,3 +1,4 @@
+import functools
 import re
 
 from tokens import TokenType, Token
@@ -20,7 +21,9 @@ class Lexer:
         return self._next()
 
     @staticmethod
+    @functools.lru_cache(maxsize=None)
     def get_regexp() -> re.compile:
+        # token types don't change, the regexp is built once
         parts = []
         for token_type in TokenType:
             if not token_type.value:
@@ -1,5 +1,11 @@
+import functools
+import re
+from typing import Optional
+
 from tokens import Token
 
+UNDERSCORE_RE = re.compile(r'(?<!^)(?=[A-Z])')
+
 
 class Node:
     pass
@@ -23,6 +29,16 @@ class String(Node):
         self.value = token.value
 
 
+class Parameter(Node):
+
+    def __init__(self, token: Token, index: Optional[int], name: Optional[str] = None):
+        # token of the literal the parameter stands for, or of the ? or :name placeholder
+        self.token = token
+        # number of the value bound to the parameter, None for a named placeholder
+        self.index = index
+        self.name = name
+
+
 class Identifier(Node):
 
     def __init__(self, token: Token):
@@ -35,9 +51,30 @@ class Table(Identifier):
 
 
 class Column(Identifier):
+
+    def __init__(self, token: Token, table: 'Table' = None):
+        super().__init__(token)
+        # table of a qualified column: table.column
+        self.table = table
+
+
+class Index(Identifier):
     pass
 
 
+class Type(Identifier):
+    pass
+
+
+class Aggregate(Node):
+
+    def __init__(self, token: Token, column):
+        self.token = token
+        self.function = token.value.lower()
+        # Empty for count(*)
+        self.column = column
+
+
 class Order(Node):
 
     def __init__(self, column: Column, order):
@@ -52,6 +89,30 @@ class Assign(Node):
         self.right = right
 
 
+class Comparison(Node):
+
+    def __init__(self, left: Column, token_type, right: any):
+        self.left = left
+        self.right = right
+        self.operation = token_type
+
+
+class Or(Node):
+
+    def __init__(self, branches: list):
+        # every branch is a list of conditions joined by AND
+        self.branches = branches
+
+
+class Join(Node):
+
+    def __init__(self, table: Table, left: Column, right: Column):
+        # rows of the tables are joined where the left column equals the right one
+        self.table = table
+        self.left = left
+        self.right = right
+
+
 class BinaryOperation(Node):
 
     def __init__(self, left, token_type, right):
@@ -66,6 +127,17 @@ class DescribeStatement(Node):
         self.table = table
 
 
+class ExplainStatement(Node):
+
+    def __init__(self, statement, analyze=False, lexing=0.0, parsing=0.0, tokens=0):
+        self.statement = statement
+        self.analyze = analyze
+        # seconds spent on lexing and parsing of the statement and number of its tokens
+        self.lexing = lexing
+        self.parsing = parsing
+        self.tokens = tokens
+
+
 class Statements(Node):
 
     def __init__(self, children):
@@ -74,10 +146,20 @@ class Statements(Node):
 
 class CreateStatement(Node):
 
-    def __init__(self, table, primary_key, columns):
+    def __init__(self, table, primary_key, columns, types=None):
         self.table = table
         self.primary_key = primary_key
         self.columns = columns
+        # types of the primary key and columns, Empty for a column without type
+        self.types = types or []
+
+
+class CreateIndexStatement(Node):
+
+    def __init__(self, index, table, column):
+        self.index = index
+        self.table = table
+        self.column = column
 
 
 class InsertStatement(Node):
@@ -87,11 +169,44 @@ class InsertStatement(Node):
         self.assignments = assignments
 
 
+class InsertValuesStatement(Node):
+
+    def __init__(self, table, columns, rows):
+        self.table = table
+        self.columns = columns
+        self.rows = rows
+
+
 class SelectStatement(Node):
 
-    def __init__(self, table, result, where, order, limit=0):
+    def __init__(self, table, result, where, order, limit=0, group=None, join=None):
         self.table = table
+        self.join = join
         self.result = result
         self.where = where
         self.order = order
         self.limit = limit
+        self.group = group or []
+
+
+def get_visit_method_name(node: Node) -> str:
+    if not isinstance(node, Node):
+        raise Exception("Must be instance of ast.Node")
+    return visit_method_name(type(node).__name__)
+
+
+@functools.lru_cache(maxsize=None)
+def visit_method_name(name: str) -> str:
+    # every node is visited by the name of its class, there are few of them
+    return "visit_%s" % UNDERSCORE_RE.sub('_', name).lower()
+
+
+class NodeVisitor:
+
+    def visit(self, node: Node) -> any:
+        method_name = get_visit_method_name(node)
+        visitor = getattr(self, method_name, self.generic_visit)
+        return visitor(node)
+
+    def generic_visit(self, node: Node):
+        raise NotImplementedError("Method = %s for node %s not implemented" % (get_visit_method_name(node), node))
@@ -0,0 +1,245 @@
+import operator
+from typing import Mapping, Optional, Sequence, Union
+
+import nodes
+import vm
+from nodes import NodeVisitor
+from tokens import Token, TokenType
+
+# comparisons of literals known before the statement is run
+CONSTANT_COMPARISONS = {
+    TokenType.EQUALS: operator.eq,
+    TokenType.NOT_EQUALS: operator.ne,
+    TokenType.LESS: operator.lt,
+    TokenType.LESS_EQUALS: operator.le,
+    TokenType.GREATER: operator.gt,
+    TokenType.GREATER_EQUALS: operator.ge,
+}
+
+# bound of a range: (upper, strict)
+BOUNDS = {
+    TokenType.LESS: (True, True),
+    TokenType.LESS_EQUALS: (True, False),
+    TokenType.GREATER: (False, True),
+    TokenType.GREATER_EQUALS: (False, False),
+}
+
+
+class OptimizerException(Exception):
+    pass
+
+
+def position(node: nodes.Node) -> int:
+    """
+    Position in the text of the first token of the node
+    """
+
+    if isinstance(node, nodes.BinaryOperation):
+        return position(node.left)
+    if isinstance(node, nodes.Column) and node.table is not None:
+        return node.table.token.pos
+    return node.token.pos
+
+
+def literal(node: nodes.Node) -> Optional[tuple]:
+    """
+    (value,) of a number or a string, None for other nodes
+    """
+
+    if isinstance(node, nodes.Number):
+        return int(node.value),
+    if isinstance(node, nodes.String):
+        return str(node.value.strip("'")),
+    return None
+
+
+def number(node: nodes.Node) -> nodes.Node:
+    # a parameter can be bound to a string where only numbers are allowed
+    if isinstance(node, nodes.String):
+        raise OptimizerException("Number is required at pos %d, got %s" % (node.token.pos, node.value))
+    return node
+
+
+class Optimizer(NodeVisitor):
+    """
+    Rewrites the tree before it is interpreted: parameters get their values, constant expressions are computed,
+    conditions that are always true are removed, repeated conditions and ranges on the same expression are merged.
+    The tree is not changed, so a parsed statement can be optimized with other values again,
+    expressions without parameters are kept as they are with their compiled code.
+    Nodes made of several ones keep the position of their first token
+    """
+
+    def __init__(self, values: list = None, parameters: Union[Sequence, Mapping] = None):
+        # literal tokens bound to the parameters by their number
+        self.values = values or []
+        # values of the placeholders: a sequence for ?, a mapping for :name
+        self.parameters = parameters
+
+    def generic_visit(self, node: nodes.Node) -> nodes.Node:
+        return node
+
+    def visit_statements(self, node: nodes.Statements) -> nodes.Statements:
+        return nodes.Statements([self.visit(child) for child in node.children])
+
+    def visit_parameter(self, node: nodes.Parameter) -> nodes.Node:
+        if node.token.type == TokenType.PARAMETER:
+            return self.bind(node)
+        if node.index >= len(self.values):
+            raise OptimizerException("No value for parameter %d at pos %d" % (node.index + 1, node.token.pos))
+        token = self.values[node.index]
+        return nodes.Number(token) if token.type == TokenType.INT else nodes.String(token)
+
+    def bind(self, node: nodes.Parameter) -> nodes.Node:
+        """
+        Value of a placeholder as a literal at its position
+        """
+
+        try:
+            value = self.parameters[node.index if node.name is None else node.name]
+        except (IndexError, KeyError, TypeError):
+            raise OptimizerException("No value for parameter %s at pos %d" % (node.token.value, node.token.pos))
+        # bool is an int in python, but not in SQL
+        if isinstance(value, int) and not isinstance(value, bool):
+            return nodes.Number(Token(TokenType.INT, str(value), node.token.pos))
+        if isinstance(value, str):
+            if "'" in value:
+                raise OptimizerException("Value of parameter %s at pos %d can't have quotes"
+                                         % (node.token.value, node.token.pos))
+            return nodes.String(Token(TokenType.STRING, "'%s'" % value, node.token.pos))
+        raise OptimizerException("Value of parameter %s at pos %d must be int or str, got %s"
+                                 % (node.token.value, node.token.pos, type(value).__name__))
+
+    def visit_explain_statement(self, node: nodes.ExplainStatement) -> nodes.ExplainStatement:
+        return nodes.ExplainStatement(self.visit(node.statement), node.analyze, node.lexing, node.parsing, node.tokens)
+
+    def visit_insert_statement(self, node: nodes.InsertStatement) -> nodes.InsertStatement:
+        return nodes.InsertStatement(node.table, [self.visit(assignee) for assignee in node.assignments])
+
+    def visit_insert_values_statement(self, node: nodes.InsertValuesStatement) -> nodes.InsertValuesStatement:
+        return nodes.InsertValuesStatement(node.table, node.columns,
+                                           [[self.visit(value) for value in values] for values in node.rows])
+
+    def visit_select_statement(self, node: nodes.SelectStatement) -> nodes.SelectStatement:
+        if isinstance(node.result, list):
+            result = [self.visit(item) for item in node.result]
+        else:
+            result = self.visit(node.result)
+        limit = self.visit(node.limit)
+        for value in ([] if isinstance(result, list) else [result]) + [limit]:
+            number(value)
+        order = node.order
+        if isinstance(order, nodes.Order):
+            order = nodes.Order(self.visit(order.column), order.order)
+        return nodes.SelectStatement(node.table, result, self.where(node.where) if node.where else node.where,
+                                     order, limit, node.group, node.join)
+
+    def visit_binary_operation(self, node: nodes.BinaryOperation) -> nodes.Node:
+        left, right = number(self.visit(node.left)), number(self.visit(node.right))
+        if left is not node.left or right is not node.right:
+            node = nodes.BinaryOperation(left, node.operation, right)
+        if not isinstance(node.left, nodes.Number) or not isinstance(node.right, nodes.Number):
+            return node
+        try:
+            value = vm.run(vm.compile_expression(node))
+        except (ZeroDivisionError, vm.VMException):
+            # errors are left to the statement run
+            return node
+        return nodes.Number(Token(TokenType.INT, str(value), position(node)))
+
+    def visit_assign(self, node: nodes.Assign) -> nodes.Assign:
+        return nodes.Assign(self.visit(node.left), self.visit(node.right))
+
+    def visit_comparison(self, node: nodes.Comparison) -> nodes.Comparison:
+        return nodes.Comparison(self.visit(node.left), node.operation, self.visit(node.right))
+
+    def visit_or(self, node: nodes.Or) -> nodes.Or:
+        """
+        Branches that are never true are removed. Or with a single branch is its conditions,
+        an empty branch is always true
+        """
+
+        branches, never = [], []
+        for branch in node.branches:
+            branch = self.where(branch)
+            if not branch:
+                return nodes.Or([[]])
+            if len(branch) == 1 and self.truth(branch[0]) is False:
+                never.append(branch)
+            else:
+                branches.append(branch)
+        # when all of them are never true, the first one stands for them
+        return nodes.Or(branches or never[:1])
+
+    def where(self, where: list) -> list:
+        """
+        Conditions joined by AND without the ones that are always true and without repeats,
+        the last of the repeats is kept. A condition that is never true replaces all of them
+        """
+
+        result = []
+        for item in where:
+            item = self.visit(item)
+            # or of a single branch is its conditions, they are simplified already
+            items = item.branches[0] if isinstance(item, nodes.Or) and len(item.branches) == 1 else [item]
+            for item in items:
+                truth = self.truth(item)
+                if truth is False:
+                    return [item]
+                if truth is None:
+                    key = self.key(item)
+                    if key is not None:
+                        result = [known for known in result if self.key(known) != key]
+                    result.append(item)
+        return self.ranges(result)
+
+    @staticmethod
+    def key(item: nodes.Node) -> Optional[tuple]:
+        """
+        Condition as (operation, expression, value) to find repeats, None if it is not a comparison with a literal
+        """
+
+        if not isinstance(item, (nodes.Assign, nodes.Comparison)) or literal(item.right) is None:
+            return None
+        operation = TokenType.EQUALS if isinstance(item, nodes.Assign) else item.operation
+        try:
+            source = vm.compiled(item.left).source()
+        except vm.VMException:
+            return None
+        value, = literal(item.right)
+        return operation, source, type(value), value
+
+    @staticmethod
+    def truth(item: nodes.Node) -> Optional[bool]:
+        """
+        Value of a comparison of literals of the same type, None if it is not known before the run
+        """
+
+        if not isinstance(item, (nodes.Assign, nodes.Comparison)):
+            return None
+        left, right = literal(item.left), literal(item.right)
+        if left is None or right is None or type(left[0]) is not type(right[0]):
+            return None
+        operation = TokenType.EQUALS if isinstance(item, nodes.Assign) else item.operation
+        return CONSTANT_COMPARISONS[operation](left[0], right[0])
+
+    def ranges(self, where: list) -> list:
+        """
+        Of several upper (or lower) bounds of the same expression by numbers only the tightest one is kept
+        """
+
+        bounds, tightest = {}, {}
+        for i, item in enumerate(where):
+            key = self.key(item)
+            if key is None or key[0] not in BOUNDS or key[2] is not int:
+                continue
+            operation, source, _, value = key
+            upper, strict = BOUNDS[operation]
+            # bigger rank is a tighter bound
+            bounds[i] = (source, upper), (-value if upper else value, strict)
+            if bounds[i][0] not in tightest or bounds[i][1] > bounds[tightest[bounds[i][0]]][1]:
+                tightest[bounds[i][0]] = i
+        return [item for i, item in enumerate(where) if i not in bounds or tightest[bounds[i][0]] == i]
+
+
+def optimize(tree: nodes.Node, values: list = None, parameters: Union[Sequence, Mapping] = None) -> nodes.Node:
+    return Optimizer(values, parameters).visit(tree)
@@ -1,7 +1,12 @@
+import time
+
 import lexer
 import nodes
 from tokens import TokenType, Token
 
+COMPARISONS = (TokenType.NOT_EQUALS, TokenType.LESS, TokenType.LESS_EQUALS, TokenType.GREATER,
+               TokenType.GREATER_EQUALS)
+
 
 class ParserException(Exception):
     pass
@@ -16,12 +21,53 @@ class ParserUnexpectedToken(ParserException):
 
 class Parser:
 
-    def __init__(self, lex: lexer.Lexer):
+    def __init__(self, lex: lexer.Lexer, parameterize: bool = False):
         self.lexer = iter(lex)
+        # tokens are lexed on demand, so time of lexing is counted apart from parsing
+        self.lexing = 0.0
+        self.tokens = 0
+        # literals become parameters numbered in the order of the text, the tree is bound to values later
+        self.parameterize = parameterize
+        self.parameters = 0
+        # ? placeholders numbered in the order of the text
+        self.placeholders = 0
+        # tokens read while trying a rule are kept to be read again if it does not match
+        self.read = None
+        self.pending = []
         self.token = self.get_next_token()
 
     def get_next_token(self) -> Token:
-        return next(self.lexer)
+        if self.pending:
+            token = self.pending.pop(0)
+        else:
+            start = time.perf_counter()
+            token = next(self.lexer)
+            self.lexing += time.perf_counter() - start
+            self.tokens += 1
+        if self.read is not None:
+            self.read.append(token)
+        return token
+
+    def attempt(self, rule: callable) -> tuple:
+        """
+        Parse by the rule: (True, node) if it matches, (False, None) if it does not,
+        then the parser is back at the token it started from
+        """
+
+        state, outer = (self.token, self.parameters, self.placeholders), self.read
+        self.read = [self.token]
+        try:
+            return True, rule()
+        except ParserException:
+            self.token, self.parameters, self.placeholders = state
+            self.pending = self.read[1:] + self.pending
+            self.read = [self.token]
+            return False, None
+        finally:
+            # tokens read by the rule are read by the rule being tried around it too
+            if outer is not None:
+                outer += self.read[1:]
+            self.read = outer
 
     def move_forward(self, token_type: TokenType) -> None:
         if self.token.type == token_type:
@@ -29,12 +75,33 @@ class Parser:
         else:
             raise ParserUnexpectedToken(self.token, token_type)
 
-    def expr(self) -> nodes.Node:
+    def literal(self, token_type: TokenType) -> nodes.Node:
+        """
+        literal -> token_type | PARAMETER
+        Example: ?
+        Example: :uid
+        """
+
+        token = self.token
+        if token.type == TokenType.PARAMETER:
+            self.move_forward(TokenType.PARAMETER)
+            if token.value == "?":
+                self.placeholders += 1
+                return nodes.Parameter(token, self.placeholders - 1)
+            return nodes.Parameter(token, None, token.value[1:])
+        self.move_forward(token_type)
+        if self.parameterize:
+            self.parameters += 1
+            return nodes.Parameter(token, self.parameters - 1)
+        return nodes.Number(token) if token_type == TokenType.INT else nodes.String(token)
+
+    def expr(self, first: nodes.Node = None) -> nodes.Node:
         """
         expr -> term ((PLUS | MINUS) term)*
+        First is the already parsed first factor
         """
 
-        node = self.term()
+        node = self.term(first)
         while self.token.type in (TokenType.PLUS, TokenType.MINUS):
             if self.token.type == TokenType.PLUS:
                 self.move_forward(TokenType.PLUS)
@@ -44,12 +111,12 @@ class Parser:
                 node = nodes.BinaryOperation(left=node, token_type=TokenType.MINUS, right=self.term())
         return node
 
-    def term(self) -> nodes.Node:
+    def term(self, first: nodes.Node = None) -> nodes.Node:
         """
         term -> factor ((MUL | DIV) factor)*
         """
 
-        node = self.factor()
+        node = self.factor() if first is None else first
         while self.token.type in (TokenType.MUL, TokenType.DIV):
             if self.token.type == TokenType.MUL:
                 self.move_forward(TokenType.MUL)
@@ -61,28 +128,35 @@ class Parser:
 
     def factor(self) -> nodes.Node:
         """
-        factor -> INT | LPAREN expr RPAREN
+        factor -> INT | PARAMETER | LPAREN expr RPAREN | column_ref
         """
 
-        if self.token.type == TokenType.INT:
-            node = nodes.Number(self.token)
-            self.move_forward(TokenType.INT)
+        if self.token.type in (TokenType.INT, TokenType.PARAMETER):
+            node = self.literal(TokenType.INT)
         elif self.token.type == TokenType.LPAREN:
             self.move_forward(TokenType.LPAREN)
             node = self.expr()
             self.move_forward(TokenType.RPAREN)
+        elif self.token.type == TokenType.ID:
+            node = self.column_ref()
         else:
-            raise ParserUnexpectedToken(self.token, '%s | %s' % (TokenType.INT, TokenType.LPAREN))
+            raise ParserUnexpectedToken(self.token, '%s | %s | %s | %s' % (TokenType.INT, TokenType.PARAMETER,
+                                                                          TokenType.LPAREN, TokenType.ID))
 
         return node
 
     def create_stmt(self) -> nodes.Node:
         """
-        create_stmt -> CREATE TABLE ID LPAREN PRIMARY KEY ID (COMMA ID)* RPAREN SEMICOLON
+        create_stmt -> CREATE (TABLE ID LPAREN PRIMARY KEY column_def (COMMA column_def)* RPAREN SEMICOLON
+                       | create_index_sub_stmt)
         Example: create table foobar ( primary key foo, bar, buz ) ;
+        Example: create table foobar ( primary key foo int, bar text, buz int32 ) ;
+        Example: create index foobar_bar on foobar (bar);
         """
 
         self.move_forward(TokenType.CREATE)
+        if self.token.type == TokenType.INDEX:
+            return self.create_index_sub_stmt()
         self.move_forward(TokenType.TABLE)
 
         table = nodes.Table(self.token)
@@ -92,20 +166,57 @@ class Parser:
         self.move_forward(TokenType.PRIMARY)
         self.move_forward(TokenType.KEY)
 
-        primary_key = nodes.Column(self.token)
-        self.move_forward(TokenType.ID)
+        primary_key, column_type = self.column_def()
+        types = [column_type]
 
         columns = []
         while self.token.type == TokenType.COMMA:
             self.move_forward(TokenType.COMMA)
-            column = nodes.Column(self.token)
-            self.move_forward(TokenType.ID)
+            column, column_type = self.column_def()
             columns.append(column)
+            types.append(column_type)
 
         self.move_forward(TokenType.RPAREN)
         self.move_forward(TokenType.SEMICOLON)
 
-        return nodes.CreateStatement(table, primary_key, columns)
+        return nodes.CreateStatement(table, primary_key, columns, types)
+
+    def column_def(self) -> tuple:
+        """
+        column_def -> ID (ID)?
+        Example: foo
+        Example: foo int32
+        """
+
+        column = nodes.Column(self.token)
+        self.move_forward(TokenType.ID)
+        column_type = nodes.Empty()
+        if self.token.type == TokenType.ID:
+            column_type = nodes.Type(self.token)
+            self.move_forward(TokenType.ID)
+        return column, column_type
+
+    def create_index_sub_stmt(self) -> nodes.Node:
+        """
+        create_index_sub_stmt -> INDEX ID ON ID LPAREN ID RPAREN SEMICOLON
+        Example: index foobar_bar on foobar (bar);
+        """
+
+        self.move_forward(TokenType.INDEX)
+        index = nodes.Index(self.token)
+        self.move_forward(TokenType.ID)
+
+        self.move_forward(TokenType.ON)
+        table = nodes.Table(self.token)
+        self.move_forward(TokenType.ID)
+
+        self.move_forward(TokenType.LPAREN)
+        column = nodes.Column(self.token)
+        self.move_forward(TokenType.ID)
+        self.move_forward(TokenType.RPAREN)
+        self.move_forward(TokenType.SEMICOLON)
+
+        return nodes.CreateIndexStatement(index=index, table=table, column=column)
 
     def describe_stmt(self) -> nodes.Node:
         """
@@ -133,8 +244,10 @@ class Parser:
 
     def insert_stmt(self) -> nodes.Node:
         """
-        insert_stmt -> INSERT INTO ID SET assignee_sub_stmt (assignee_sub_stmt)* SEMICOLON
+        insert_stmt -> INSERT INTO ID (SET assignee_sub_stmt (COMMA assignee_sub_stmt)*
+                       | LPAREN ID (COMMA ID)* RPAREN VALUES values_sub_stmt (COMMA values_sub_stmt)*) SEMICOLON
         Example: insert into foobar set foo=4, bar='bar', buz=100500;
+        Example: insert into foobar (foo, bar) values (4, 'bar'), (5, 'buz');
         """
 
         self.move_forward(TokenType.INSERT)
@@ -143,6 +256,9 @@ class Parser:
         table = nodes.Table(self.token)
         self.move_forward(TokenType.ID)
 
+        if self.token.type == TokenType.LPAREN:
+            return self.insert_values_sub_stmt(table)
+
         assignments = []
 
         self.move_forward(TokenType.SET)
@@ -157,22 +273,62 @@ class Parser:
 
         return nodes.InsertStatement(table=table, assignments=assignments)
 
+    def insert_values_sub_stmt(self, table: nodes.Table) -> nodes.Node:
+        """
+        insert_values_sub_stmt -> LPAREN ID (COMMA ID)* RPAREN VALUES values_sub_stmt (COMMA values_sub_stmt)* SEMICOLON
+        Example: (foo, bar) values (4, 'bar'), (5, 'buz');
+        """
+
+        self.move_forward(TokenType.LPAREN)
+        columns = [nodes.Column(self.token)]
+        self.move_forward(TokenType.ID)
+        while self.token.type == TokenType.COMMA:
+            self.move_forward(TokenType.COMMA)
+            columns.append(nodes.Column(self.token))
+            self.move_forward(TokenType.ID)
+        self.move_forward(TokenType.RPAREN)
+
+        self.move_forward(TokenType.VALUES)
+
+        rows = [self.values_sub_stmt(len(columns))]
+        while self.token.type == TokenType.COMMA:
+            self.move_forward(TokenType.COMMA)
+            rows.append(self.values_sub_stmt(len(columns)))
+
+        self.move_forward(TokenType.SEMICOLON)
+
+        return nodes.InsertValuesStatement(table=table, columns=columns, rows=rows)
+
+    def values_sub_stmt(self, size: int) -> list:
+        """
+        values_sub_stmt -> LPAREN value (COMMA value)* RPAREN
+        Example: (4, 'bar')
+        """
+
+        token = self.token
+        self.move_forward(TokenType.LPAREN)
+        values = [self.value()]
+        while self.token.type == TokenType.COMMA:
+            self.move_forward(TokenType.COMMA)
+            values.append(self.value())
+        self.move_forward(TokenType.RPAREN)
+
+        if len(values) != size:
+            raise ParserException("Row at pos %d has %d values, required %d" % (token.pos, len(values), size))
+        return values
+
     def value(self) -> nodes.Node:
         """
-        value -> INT | STRING
+        value -> INT | STRING | PARAMETER
         Example: 100500
         Example 'foobar'
+        Example: ?
         """
 
-        if self.token.type == TokenType.INT:
-            node = nodes.Number(self.token)
-            self.move_forward(TokenType.INT)
-        elif self.token.type == TokenType.STRING:
-            node = nodes.String(self.token)
-            self.move_forward(TokenType.STRING)
-        else:
-            raise ParserUnexpectedToken(self.token, "%s or %s" % (TokenType.INT, TokenType.STRING))
-        return node
+        if self.token.type not in (TokenType.INT, TokenType.STRING, TokenType.PARAMETER):
+            raise ParserUnexpectedToken(self.token, "%s, %s or %s" % (TokenType.INT, TokenType.STRING,
+                                                                      TokenType.PARAMETER))
+        return self.literal(self.token.type)
 
     def select_stmt(self) -> nodes.Node:
         """
@@ -186,36 +342,40 @@ class Parser:
 
     def select_expr(self) -> nodes.Node:
         """
-        select_expr -> expr | ID (COMMA ID)* FROM ID (WHERE assignee_sub_stmt (AND assignee_sub_stmt)* (order_sub_stmt)? (limit_sub_stmt)?)?
+        select_expr -> expr | select_item (COMMA select_item)* FROM ID (join_sub_stmt)? (WHERE where_sub_stmt)?
+                       (group_sub_stmt)? (order_sub_stmt)? (limit_sub_stmt)?
         Example: select 1+1
         Example: select foo from foobar
-        Example: select foo, bar from foobar where foo='foo', bar=100500
+        Example: select foo, bar / 2 + 1 from foobar where bar * 2 > 10
+        Example: select foo, bar from foobar where foo='foo' and bar=100500
+        Example: select foo, count(*), avg(bar) from foobar group by foo
+        Example: select foobar.foo, buz from foobar join bar on foobar.uid = bar.foobar_id where buz > 5
         """
 
-        if self.token.type == TokenType.ID:
-            result = []
-
-            column = nodes.Column(self.token)
-            self.move_forward(TokenType.ID)
-            result.append(column)
+        result = [self.select_item()]
+        # expression without a table is computed right away
+        literal = isinstance(result[0], (nodes.BinaryOperation, nodes.Number, nodes.Parameter))
+        if not literal or self.token.type in (TokenType.COMMA, TokenType.FROM):
             while self.token.type == TokenType.COMMA:
                 self.move_forward(TokenType.COMMA)
-                column = nodes.Column(self.token)
-                self.move_forward(TokenType.ID)
-                result.append(column)
+                result.append(self.select_item())
 
             self.move_forward(TokenType.FROM)
             table = nodes.Table(self.token)
             self.move_forward(TokenType.ID)
 
+            join = None
+            if self.token.type == TokenType.JOIN:
+                join = self.join_sub_stmt()
+
             where = []
             if self.token.type == TokenType.WHERE:
                 self.move_forward(TokenType.WHERE)
-                where.append(self.assignee_sub_stmt())
+                where = self.where_sub_stmt()
 
-                while self.token.type == TokenType.AND:
-                    self.move_forward(TokenType.AND)
-                    where.append(self.assignee_sub_stmt())
+            group = []
+            if self.token.type == TokenType.GROUP:
+                group = self.group_sub_stmt()
 
             if self.token.type == TokenType.ORDER:
                 order = self.order_sub_stmt()
@@ -232,29 +392,181 @@ class Parser:
                 result=result,
                 where=where,
                 order=order,
-                limit=limit
+                limit=limit,
+                group=group,
+                join=join
             )
         else:
             node = nodes.SelectStatement(
                 table=nodes.Empty(),
-                result=self.expr(),
+                result=result[0],
                 where=None,
                 order=nodes.Empty(),
                 limit=nodes.Empty()
             )
         return node
 
+    def select_item(self) -> nodes.Node:
+        """
+        select_item -> ID LPAREN (MUL | column_ref) RPAREN | expr
+        Example: foo
+        Example: foobar.foo
+        Example: count(*)
+        Example: max(foo)
+        Example: (foo + 1) * bar
+        """
+
+        if self.token.type != TokenType.ID:
+            return self.expr()
+        token = self.token
+        self.move_forward(TokenType.ID)
+        if self.token.type != TokenType.LPAREN:
+            column = self.qualified_column(token) if self.token.type == TokenType.DOT else nodes.Column(token)
+            return self.expr(column)
+
+        self.move_forward(TokenType.LPAREN)
+        if self.token.type == TokenType.MUL:
+            column = nodes.Empty()
+            self.move_forward(TokenType.MUL)
+        else:
+            column = self.column_ref()
+        self.move_forward(TokenType.RPAREN)
+        return nodes.Aggregate(token, column)
+
+    def column_ref(self) -> nodes.Column:
+        """
+        column_ref -> ID (DOT ID)?
+        Example: foo
+        Example: foobar.foo
+        """
+
+        token = self.token
+        self.move_forward(TokenType.ID)
+        if self.token.type == TokenType.DOT:
+            return self.qualified_column(token)
+        return nodes.Column(token)
+
+    def qualified_column(self, table: Token) -> nodes.Column:
+        self.move_forward(TokenType.DOT)
+        column = nodes.Column(self.token, table=nodes.Table(table))
+        self.move_forward(TokenType.ID)
+        return column
+
+    def join_sub_stmt(self) -> nodes.Node:
+        """
+        join_sub_stmt -> JOIN ID ON column_ref EQUALS column_ref
+        Example: join bar on foobar.uid = bar.foobar_id
+        """
+
+        self.move_forward(TokenType.JOIN)
+        table = nodes.Table(self.token)
+        self.move_forward(TokenType.ID)
+        self.move_forward(TokenType.ON)
+        left = self.column_ref()
+        self.move_forward(TokenType.EQUALS)
+        right = self.column_ref()
+        return nodes.Join(table, left, right)
+
+    def group_sub_stmt(self) -> list:
+        """
+        group_sub_stmt -> GROUP BY column_ref (COMMA column_ref)*
+        Example: group by foo, bar
+        """
+
+        self.move_forward(TokenType.GROUP)
+        self.move_forward(TokenType.BY)
+        columns = [self.column_ref()]
+        while self.token.type == TokenType.COMMA:
+            self.move_forward(TokenType.COMMA)
+            columns.append(self.column_ref())
+        return columns
+
+    def where_sub_stmt(self) -> list:
+        """
+        where_sub_stmt -> and_sub_stmt (OR and_sub_stmt)*
+        Example: foo=5 and bar>1 or buz!='buz'
+        """
+
+        branches = [self.and_sub_stmt()]
+        while self.token.type == TokenType.OR:
+            self.move_forward(TokenType.OR)
+            branches.append(self.and_sub_stmt())
+        if len(branches) == 1:
+            return branches[0]
+        return [nodes.Or(branches)]
+
+    def and_sub_stmt(self) -> list:
+        """
+        and_sub_stmt -> condition_sub_stmt (AND condition_sub_stmt)*
+        Example: foo=5 and bar>1
+        """
+
+        conditions = self.condition_sub_stmt()
+        while self.token.type == TokenType.AND:
+            self.move_forward(TokenType.AND)
+            conditions += self.condition_sub_stmt()
+        return conditions
+
+    def condition_sub_stmt(self) -> list:
+        """
+        condition_sub_stmt -> expr (EQUALS | NOT_EQUALS | LESS | LESS_EQUALS | GREATER | GREATER_EQUALS) operand
+                              | LPAREN where_sub_stmt RPAREN
+        Example: foo=5
+        Example: foo>='bar'
+        Example: (foo=5 or bar<>6)
+        Example: foo * 2 + bar > 1000 / 3
+        Example: (foo + 1) * 2 > bar
+        """
+
+        if self.token.type == TokenType.LPAREN:
+            # parenthesis starts an expression if a comparison follows it, a group of conditions otherwise
+            matched, left = self.attempt(self.compared_expr)
+            if not matched:
+                self.move_forward(TokenType.LPAREN)
+                conditions = self.where_sub_stmt()
+                self.move_forward(TokenType.RPAREN)
+                return conditions
+        else:
+            left = self.expr()
+        operation = self.token.type
+        if operation == TokenType.EQUALS:
+            self.move_forward(TokenType.EQUALS)
+            return [nodes.Assign(left=left, right=self.operand())]
+        if operation not in COMPARISONS:
+            raise ParserUnexpectedToken(self.token, " | ".join(str(token_type) for token_type in
+                                                               (TokenType.EQUALS,) + COMPARISONS))
+        self.move_forward(operation)
+        return [nodes.Comparison(left=left, token_type=operation, right=self.operand())]
+
+    def compared_expr(self) -> nodes.Node:
+        node = self.expr()
+        if self.token.type not in (TokenType.EQUALS,) + COMPARISONS:
+            raise ParserUnexpectedToken(self.token, " | ".join(str(token_type) for token_type in
+                                                               (TokenType.EQUALS,) + COMPARISONS))
+        return node
+
+    def operand(self) -> nodes.Node:
+        """
+        operand -> STRING | expr
+        Example: 'foo'
+        Example: 1000 / 3
+        """
+
+        if self.token.type == TokenType.STRING:
+            return self.literal(TokenType.STRING)
+        return self.expr()
+
     def order_sub_stmt(self) -> nodes.Node:
         """
-        order_sub_stmt -> ORDER BY ID (ASC | DESC)
+        order_sub_stmt -> ORDER BY select_item (ASC | DESC)
         Example: order by foo asc
+        Example: order by count(*) desc
         """
 
         self.move_forward(TokenType.ORDER)
         self.move_forward(TokenType.BY)
 
-        by = nodes.Column(self.token)
-        self.move_forward(TokenType.ID)
+        by = self.select_item()
 
         asc_desc = self.token.type
         if self.token.type == TokenType.ASC:
@@ -267,18 +579,34 @@ class Parser:
 
     def limit_sub_stmt(self) -> nodes.Node:
         """
-        limit_sub_stmt -> LIMIT NUMBER
+        limit_sub_stmt -> LIMIT (NUMBER | PARAMETER)
         Example: limit 10
+        Example: limit :size
         """
 
         self.move_forward(TokenType.LIMIT)
-        limit = nodes.Number(self.token)
-        self.move_forward(TokenType.INT)
-        return limit
+        return self.literal(TokenType.INT)
+
+    def explain_stmt(self) -> nodes.Node:
+        """
+        explain_stmt -> EXPLAIN (ANALYZE)? select_stmt
+        Example: explain select foo from foobar where foo=5;
+        Example: explain analyze select foo from foobar order by foo desc limit 3;
+        """
+
+        start, lexing, tokens = time.perf_counter(), self.lexing, self.tokens
+        self.move_forward(TokenType.EXPLAIN)
+        analyze = self.token.type == TokenType.ANALYZE
+        if analyze:
+            self.move_forward(TokenType.ANALYZE)
+        statement = self.select_stmt()
+        lexing = self.lexing - lexing
+        return nodes.ExplainStatement(statement, analyze, lexing=lexing, parsing=time.perf_counter() - start - lexing,
+                                      tokens=self.tokens - tokens)
 
     def stmt(self) -> nodes.Node:
         """
-        stmt -> create_stmt | describe_stmt | insert_stmt | select_stmt
+        stmt -> create_stmt | describe_stmt | insert_stmt | select_stmt | explain_stmt
         """
 
         if self.token.type == TokenType.CREATE:
@@ -289,9 +617,12 @@ class Parser:
             result = self.insert_stmt()
         elif self.token.type == TokenType.SELECT:
             result = self.select_stmt()
+        elif self.token.type == TokenType.EXPLAIN:
+            result = self.explain_stmt()
         else:
-            raise ParserUnexpectedToken(self.token, "%s | %s | %s | %s" % (TokenType.CREATE, TokenType.DESCRIBE,
-                                                                           TokenType.INSERT, TokenType.SELECT))
+            raise ParserUnexpectedToken(self.token, "%s | %s | %s | %s | %s" % (TokenType.CREATE, TokenType.DESCRIBE,
+                                                                                TokenType.INSERT, TokenType.SELECT,
+                                                                                TokenType.EXPLAIN))
 
         return result
 
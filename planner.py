@@ -0,0 +1,594 @@
+import time
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from storage import (Expression, Or, Storage, StorageException, Table, TableColumnNotExists, combine, condition, finish,
+                     hash_join, is_aggregated, rename, rename_condition, used_columns, where_columns)
+
+# secondary index is used when it is estimated to find at most this fraction of the rows
+INDEX_FRACTION = 0.25
+# smaller tables are looked up by any index, reading them whole costs about the same
+INDEX_MIN_ROWS = 1024
+
+
+def positions(table: Table, rows: Optional[np.ndarray]) -> np.ndarray:
+    return np.arange(len(table)) if rows is None else rows
+
+
+def merge(batches: list) -> Table:
+    # only tables read in chunks give several batches, and they are data frames
+    return Table.from_df(pd.concat([table.df if rows is None else table.df.iloc[rows] for table, rows in batches]))
+
+
+def describe_item(item: Union[str, tuple, Expression]) -> str:
+    if isinstance(item, tuple):
+        function, column = item
+        return "%s(%s)" % (function, "*" if column is None else column)
+    return str(item)
+
+
+def describe_where(where: list) -> str:
+    parts = []
+    for item in map(condition, where):
+        if isinstance(item, Or):
+            parts.append("(%s)" % " or ".join(describe_where(branch) for branch in item.branches))
+        else:
+            column, op, value = item
+            parts.append("%s %s %s" % (column, op, value if isinstance(value, Expression) else repr(value)))
+    return " and ".join(parts)
+
+
+def describe_order(order: tuple) -> str:
+    return "%s %s" % (describe_item(order[0]), "asc" if order[1] else "desc")
+
+
+def join_rows(first: tuple, second: tuple, columns: list) -> Table:
+    """
+    Table of the columns (qualified by their table) of the pairs of rows with equal keys, ordered by the rows
+    of the first side. Sides are (table name, table, positions of its rows, key column).
+    Hash table is built on the side with fewer rows
+    """
+
+    (name, table, rows, key), (other, other_table, other_rows, other_key) = first, second
+    rows, other_rows = positions(table, rows), positions(other_table, other_rows)
+    values, other_values = table.values(key, rows), other_table.values(other_key, other_rows)
+    if len(rows) <= len(other_rows):
+        pairs, other_pairs = hash_join(values, other_values)
+        ordered = np.argsort(pairs, kind="stable")
+        pairs, other_pairs = pairs[ordered], other_pairs[ordered]
+    else:
+        other_pairs, pairs = hash_join(other_values, values)
+
+    # only used columns of the joined rows are copied
+    data = {}
+    for column in columns:
+        if column not in data:
+            side, _, bare = column.rpartition(".")
+            if side == name:
+                data[column] = table.array(bare, rows[pairs])
+            else:
+                data[column] = other_table.array(bare, other_rows[other_pairs])
+    return Table.from_df(pd.DataFrame(data))
+
+
+class Plan:
+    """
+    Operator of a query plan. Operators give batches of rows: (table, positions of the rows in it, None for all
+    of its rows), only tables read in chunks give more than one batch. The topmost operator gives rows of the result
+    """
+
+    def __init__(self, *children: 'Plan'):
+        self.children = list(children)
+        # time, rows and bytes counted while the plan is analyzed
+        self.stats = None
+
+    def batches(self):
+        raise NotImplementedError("Operator %s gives no batches" % type(self).__name__)
+
+    def rows(self) -> list:
+        raise NotImplementedError("Operator %s gives no rows" % type(self).__name__)
+
+    def stream(self, size: int):
+        """
+        Rows of the operator in lists of at most size rows made on demand,
+        operators that make their rows all at once give them by parts of the whole
+        """
+
+        rows = self.rows()
+        for start in range(0, len(rows), size):
+            yield rows[start:start + size]
+
+    def output(self):
+        """
+        Batches of the operator for its parent, counted while the plan is analyzed
+        """
+
+        if self.stats is None:
+            yield from self.batches()
+            return
+        batches = self.batches()
+        while True:
+            start = time.perf_counter()
+            batch = next(batches, None)
+            self.stats["time"] += time.perf_counter() - start
+            if batch is None:
+                return
+            table, rows = batch
+            self.stats["rows"] += len(positions(table, rows))
+            if not self.children:
+                self.stats["bytes"] += table.nbytes(rows)
+            yield batch
+
+    def collect(self) -> list:
+        """
+        Rows of the operator for its parent, counted while the plan is analyzed
+        """
+
+        if self.stats is None:
+            return self.rows()
+        start = time.perf_counter()
+        rows = self.rows()
+        self.stats["time"] += time.perf_counter() - start
+        self.stats["rows"] += len(rows)
+        return rows
+
+    def walk(self):
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def analyze(self) -> list:
+        """
+        Run the plan and describe its operators: [line of explain, milliseconds spent in the operator itself,
+        rows it got from its children, rows it gave, bytes of column data read by it]
+        """
+
+        for plan in self.walk():
+            plan.stats = {"time": 0.0, "rows": 0, "bytes": 0}
+        try:
+            self.collect()
+            return [[line, round(stats["time"] * 1000, 3), stats["rows in"], stats["rows"], stats["bytes"]]
+                    for line, stats in zip(self.explain(), self.statistics())]
+        finally:
+            for plan in self.walk():
+                plan.stats = None
+
+    def statistics(self) -> list:
+        # operators in the order of explain lines, their time without the time of their children
+        stats = dict(self.stats)
+        stats["time"] -= sum(child.stats["time"] for child in self.children)
+        stats["rows in"] = sum(child.stats["rows"] for child in self.children) if self.children else None
+        result = [stats]
+        for child in self.children:
+            result += child.statistics()
+        return result
+
+    def describe(self) -> str:
+        return type(self).__name__
+
+    def explain(self, depth: int = 0) -> list:
+        """
+        Lines describing the operators, children are indented under their parent
+        """
+
+        lines = ["  " * depth + self.describe()]
+        for child in self.children:
+            lines += child.explain(depth + 1)
+        return lines
+
+
+class Scan(Plan):
+    """
+    All rows of the table, it is loaded into the cache
+    """
+
+    def __init__(self, storage: Storage, name: str, columns: list):
+        super().__init__()
+        self.storage = storage
+        self.name = name
+        self.columns = columns
+
+    def batches(self):
+        yield self.storage.load(self.name, self.columns), None
+
+    def describe(self) -> str:
+        return "%s %s" % (type(self).__name__, self.name)
+
+
+class ChunkedScan(Scan):
+    """
+    All rows of the table read in chunks without caching, reading stops when the consumer stops
+    """
+
+    def batches(self):
+        empty = True
+        for table in self.storage.chunks(self.name, self.columns):
+            empty = False
+            yield table, None
+        if empty:
+            yield self.storage.load(self.name, self.columns), None
+
+    def describe(self) -> str:
+        return "%s %s (%d rows per chunk)" % (type(self).__name__, self.name, self.storage.chunk_rows)
+
+
+class IndexScan(Scan):
+    """
+    Rows of the table found by index lookups: (index name or None for the primary key, values) pairs
+    """
+
+    def __init__(self, storage: Storage, name: str, columns: list, lookups: list):
+        super().__init__(storage, name, columns)
+        self.lookups = lookups
+
+    def batches(self):
+        yield self.storage.read(self.name, self.columns, self.lookups)
+
+    def describe(self) -> str:
+        indexes = ", ".join("primary key" if index is None else "index %s" % index for index, _ in self.lookups)
+        return "%s %s by %s" % (type(self).__name__, self.name, indexes)
+
+
+class Filter(Plan):
+
+    def __init__(self, child: Plan, where: list):
+        super().__init__(child)
+        self.where = where
+
+    def batches(self):
+        for table, rows in self.children[0].output():
+            yield table, table.filter(self.where, rows=rows)
+
+    def describe(self) -> str:
+        return "%s %s" % (type(self).__name__, describe_where(self.where))
+
+
+class Sort(Plan):
+
+    def __init__(self, child: Plan, order: tuple, limit: int = 0):
+        super().__init__(child)
+        self.order = order
+        self.limit = limit
+
+    def batches(self):
+        kept = []
+        for table, rows in self.children[0].output():
+            kept.append((table, table.sort(positions(table, rows), self.order, self.limit)))
+            # with a limit only the rows that can get into the result are kept between chunks
+            if self.limit and len(kept) > 1:
+                kept = [self.merged(kept)]
+        if len(kept) > 1:
+            kept = [self.merged(kept)]
+        yield from kept
+
+    def merged(self, batches: list) -> tuple:
+        table = merge(batches)
+        return table, table.sort(positions(table, None), self.order, self.limit)
+
+    def describe(self) -> str:
+        return "%s by %s" % (type(self).__name__, describe_order(self.order))
+
+
+class TopK(Sort):
+    """
+    First rows after sorting, found by partial selection before sorting only them
+    """
+
+    def describe(self) -> str:
+        return "%s %d by %s" % (type(self).__name__, self.limit, describe_order(self.order))
+
+
+class Limit(Plan):
+
+    def __init__(self, child: Plan, limit: int):
+        super().__init__(child)
+        self.limit = limit
+
+    def batches(self):
+        left = self.limit
+        for table, rows in self.children[0].output():
+            rows = positions(table, rows)[:left]
+            left -= len(rows)
+            yield table, rows
+            if not left:
+                break
+
+    def describe(self) -> str:
+        return "%s %d" % (type(self).__name__, self.limit)
+
+
+class Project(Plan):
+    """
+    Values of the result columns, they are copied only here
+    """
+
+    def __init__(self, child: Plan, result: list):
+        super().__init__(child)
+        self.result = result
+
+    def rows(self) -> list:
+        result = []
+        for table, rows in self.children[0].output():
+            result += self.project(table, positions(table, rows))
+        return result
+
+    def stream(self, size: int):
+        # a batch of a table in memory is all of its rows, values are copied only for size rows at once
+        for table, rows in self.children[0].output():
+            rows = positions(table, rows)
+            for start in range(0, len(rows), size):
+                yield self.project(table, rows[start:start + size])
+
+    def project(self, table: Table, rows: np.ndarray) -> list:
+        return [list(row) for row in zip(*[table.values(name, rows).tolist() for name in self.result])]
+
+    def describe(self) -> str:
+        return "%s %s" % (type(self).__name__, ", ".join(describe_item(item) for item in self.result))
+
+
+class Aggregate(Plan):
+    """
+    Hash aggregation of every batch, partial aggregations of the batches are combined
+    """
+
+    def __init__(self, child: Plan, result: list, group: list, order: tuple = None, limit: int = 0):
+        super().__init__(child)
+        self.result = result
+        self.group = group
+        self.order = order
+        self.limit = limit
+
+    def rows(self) -> list:
+        partials = [table.partial(positions(table, rows), self.result, self.group, self.order)
+                    for table, rows in self.children[0].output()]
+        states = partials[0] if len(partials) == 1 else combine(partials)
+        return finish(states, self.result, self.group, self.order, self.limit)
+
+    def describe(self) -> str:
+        line = "%s %s" % (type(self).__name__, ", ".join(describe_item(item) for item in self.result))
+        if self.group:
+            line += " group by %s" % ", ".join(self.group)
+        if self.order:
+            line += " order by %s" % describe_order(self.order)
+        if self.limit:
+            line += " limit %d" % self.limit
+        return line
+
+
+class RowCount(Plan):
+    """
+    Number of rows of the table from the catalog, the child plan counts them if the catalog doesn't know it
+    """
+
+    def __init__(self, storage: Storage, name: str, width: int, child: Plan):
+        super().__init__(child)
+        self.storage = storage
+        self.name = name
+        self.width = width
+
+    def rows(self) -> list:
+        rows = self.storage.rows(self.name)
+        if rows is None:
+            return self.children[0].collect()
+        return [[rows] * self.width]
+
+    def describe(self) -> str:
+        return "%s %s" % (type(self).__name__, self.name)
+
+
+class HashJoin(Plan):
+    """
+    Pairs of rows of two tables with equal keys, sides are (table name, key column)
+    """
+
+    def __init__(self, first: Plan, second: Plan, sides: list, columns: list):
+        super().__init__(first, second)
+        self.sides = sides
+        self.columns = columns
+
+    def batches(self):
+        (table, rows), = self.children[0].output()
+        (other_table, other_rows), = self.children[1].output()
+        (name, key), (other, other_key) = self.sides
+        yield join_rows((name, table, rows, key), (other, other_table, other_rows, other_key), self.columns), None
+
+    def describe(self) -> str:
+        return "%s on %s" % (type(self).__name__, " = ".join("%s.%s" % side for side in self.sides))
+
+
+class IndexJoin(HashJoin):
+    """
+    Index nested loop join: keys of the rows of the outer side are looked up in the index of the inner table,
+    only the found rows of it are read
+    """
+
+    def __init__(self, outer: Plan, storage: Storage, inner: str, columns: list, where: list, index: Optional[str],
+                 sides: list, used: list):
+        Plan.__init__(self, outer)
+        self.storage = storage
+        self.inner = inner
+        self.inner_columns = columns
+        self.where = where
+        self.index = index
+        self.sides = sides
+        self.columns = used
+
+    def batches(self):
+        (table, rows), = self.children[0].output()
+        rows = positions(table, rows)
+        (outer, outer_key), = [side for side in self.sides if side[0] != self.inner]
+        (_, inner_key), = [side for side in self.sides if side[0] == self.inner]
+        keys = table.values(outer_key, rows)
+        inner, inner_rows = self.storage.read(self.inner, self.inner_columns, [(self.index, keys)])
+        if self.stats is not None:
+            self.stats["bytes"] += inner.nbytes(inner_rows)
+        found = {
+            outer: (outer, table, rows, outer_key),
+            self.inner: (self.inner, inner, inner.filter(self.where, rows=inner_rows), inner_key),
+        }
+        yield join_rows(*[found[name] for name, _ in self.sides], self.columns), None
+
+    def describe(self) -> str:
+        index = "primary key" if self.index is None else "index %s" % self.index
+        line = "%s %s by %s on %s" % (type(self).__name__, self.inner, index,
+                                      " = ".join("%s.%s" % side for side in self.sides))
+        if self.where:
+            line += " where %s" % describe_where(self.where)
+        return line
+
+
+class Planner:
+    """
+    Turns queries into plans. Access paths to the tables are chosen by the catalog statistics:
+    numbers of rows and of distinct values of indexed columns
+    """
+
+    def __init__(self, storage: Storage):
+        self.storage = storage
+
+    def select(self, name: str, result: list, where: list, order: tuple = None, limit: int = None,
+               group: list = None) -> Plan:
+        group = group or []
+        used = used_columns(name, self.storage.header(name), result, where, order, group)
+        aggregated = is_aggregated(result + ([order[0]] if order else []), group)
+
+        # tables that are not in memory are read in chunks when the query can stop early
+        access = self.access(name, self.columns(name, used), where, bool(limit and not order and not aggregated))
+        plan = self.finish(Filter(access, where) if where else access, result, order, limit, group)
+
+        # number of rows is kept in the catalog
+        if result and not where and not group and all(item == ("count", None) for item in result):
+            if self.storage.rows(name) is not None:
+                return RowCount(self.storage, name, len(result), plan)
+        return plan
+
+    def join(self, name: str, other: str, on: tuple, result: list, where: list, order: tuple = None,
+             limit: int = None, group: list = None) -> Plan:
+        """
+        Conditions on one of the tables are checked before the join, the rest on the joined rows.
+        When only one side is found by an index and the other has an index on its join column, the keys of
+        the found rows are looked up in that index, otherwise both sides are read and joined by a hash join
+        """
+
+        if name == other:
+            raise StorageException("Table %s can't be joined with itself" % name)
+        headers = {name: self.storage.header(name), other: self.storage.header(other)}
+        joined = "%s join %s" % (name, other)
+
+        def qualified(column: str) -> str:
+            table, _, bare = column.rpartition(".")
+            tables = [table] if table else [table for table in headers if column in headers[table]]
+            if len(tables) > 1:
+                raise StorageException("Column %s is ambiguous, it is in tables %s" % (column, ", ".join(tables)))
+            if not tables or tables[0] not in headers or bare not in headers[tables[0]]:
+                raise TableColumnNotExists(joined, column)
+            return "%s.%s" % (tables[0], bare)
+
+        result = [rename(item, qualified) for item in result]
+        where = [rename_condition(item, qualified) for item in where]
+        order = (rename(order[0], qualified), order[1]) if order else order
+        group = [qualified(column) for column in group or []]
+        keys = {qualified(column).rpartition(".")[0]: qualified(column).rpartition(".")[2] for column in on}
+        if len(keys) != 2:
+            raise StorageException("Join condition must compare columns of tables %s and %s" % (name, other))
+        header = ["%s.%s" % (table, column) for table in headers for column in headers[table]]
+        used = used_columns(joined, header, result, where, order, group)
+        used += ["%s.%s" % (table, keys[table]) for table in headers]
+
+        # conditions on one table are pushed down to it, the rest are checked on the joined rows
+        pushed, rest = {name: [], other: []}, []
+        for item in where:
+            tables = {column.rpartition(".")[0] for column in where_columns([item])}
+            if len(tables) == 1:
+                pushed[tables.pop()].append(rename_condition(item, lambda column: column.rpartition(".")[2]))
+            else:
+                rest.append(item)
+        columns = {table: self.columns(table, [column.rpartition(".")[2] for column in used
+                                               if column.rpartition(".")[0] == table]) for table in headers}
+
+        sides = [(name, keys[name]), (other, keys[other])]
+        found = [table for table in headers if self.lookups(table, pushed[table])]
+        inner = [table for table in headers if table not in found]
+        index = self.storage.index_on(inner[0], keys[inner[0]]) if len(found) == 1 else False
+        if index is not False:
+            outer = self.access(found[0], columns[found[0]], pushed[found[0]])
+            plan = IndexJoin(Filter(outer, pushed[found[0]]), self.storage, inner[0], columns[inner[0]],
+                             pushed[inner[0]], index, sides, used)
+        else:
+            plans = []
+            for table in headers:
+                access = self.access(table, columns[table], pushed[table])
+                plans.append(Filter(access, pushed[table]) if pushed[table] else access)
+            plan = HashJoin(plans[0], plans[1], sides, used)
+        return self.finish(Filter(plan, rest) if rest else plan, result, order, limit, group)
+
+    def columns(self, name: str, used: list) -> list:
+        """
+        Columns to read: used ones besides the primary key
+        """
+
+        primary_key = self.storage.header(name)[0]
+        columns = []
+        for column in used:
+            if column != primary_key and column not in columns:
+                columns.append(column)
+        return columns
+
+    def access(self, name: str, columns: list, where: list, early_stop: bool = False) -> Plan:
+        """
+        Index lookups if the conditions allow them, otherwise a scan. Tables that are not in memory
+        are read in chunks when the query can stop early or the table would not fit into the cache
+        """
+
+        lookups = self.lookups(name, where)
+        if lookups:
+            return IndexScan(self.storage, name, columns, lookups)
+        if not self.storage.in_memory(name, columns):
+            if early_stop or self.storage.nbytes(name) > self.storage.cache.max_bytes:
+                return ChunkedScan(self.storage, name, columns)
+        return Scan(self.storage, name, columns)
+
+    def lookups(self, name: str, where: list) -> list:
+        """
+        Index lookups for equality conditions: the primary key one, or ones of the indexed columns that are
+        estimated to find few rows, the most selective first
+        """
+
+        equalities = [item for item in map(condition, where) if not isinstance(item, Or) and item[1] == "="
+                      and not any(isinstance(side, Expression) for side in (item[0], item[2]))]
+        primary_key = self.storage.header(name)[0]
+        pk = None
+        for column, _, value in equalities:
+            if column == primary_key:
+                pk = value
+        if pk is not None:
+            return [(None, [pk])]
+
+        rows = self.storage.rows(name)
+        candidates = []
+        for column, _, value in equalities:
+            index = self.storage.index_on(name, column)
+            if index is None or index is False:
+                continue
+            distinct = self.storage.distinct(name, column)
+            # estimated rows found by the index, unknown ones go first
+            estimate = rows / distinct if rows and distinct else 0
+            if rows is not None and rows >= INDEX_MIN_ROWS and estimate > rows * INDEX_FRACTION:
+                continue
+            candidates.append((estimate, index, value))
+        return [(index, [value]) for _, index, value in sorted(candidates, key=lambda candidate: candidate[0])]
+
+    @staticmethod
+    def finish(plan: Plan, result: list, order: tuple, limit: int, group: list) -> Plan:
+        # operators after the rows are found: aggregation, or sorting, limit and projection
+        if is_aggregated(result + ([order[0]] if order else []), group):
+            return Aggregate(plan, result, group, order, limit)
+        if order and limit:
+            plan = TopK(plan, order, limit)
+        elif order:
+            plan = Sort(plan, order)
+        elif limit:
+            plan = Limit(plan, limit)
+        return Project(plan, result)
@@ -0,0 +1,156 @@
+import threading
+from collections import OrderedDict
+from typing import Mapping, Sequence, Union
+
+import nodes
+from engines import CsvEngine
+from interpreter import Interpreter
+from lexer import Lexer
+from optimizer import optimize
+from parser import Parser
+from storage import ResultCache
+from tokens import TokenType
+
+DEFAULT_MAX_STATEMENTS = 256
+
+LITERALS = (TokenType.INT, TokenType.STRING)
+
+
+def normalize(tokens: list) -> tuple:
+    """
+    Key of the text that doesn't depend on whitespace and literals: types of the tokens, names of the identifiers
+    and types of the literals. Literal tokens in the order of the text are the values of the statement
+    """
+
+    key, values = [], []
+    for token in tokens:
+        if token.type in LITERALS:
+            values.append(token)
+            key.append(token.type)
+        elif token.type in (TokenType.ID, TokenType.PARAMETER):
+            # names of tables, columns and parameters are case sensitive, keywords are told by their type
+            key.append(token.value)
+        else:
+            key.append(token.type)
+    return tuple(key), values
+
+
+def explains(statement: nodes.Statements) -> bool:
+    return any(isinstance(child, nodes.ExplainStatement) for child in statement.children)
+
+
+class StatementCache:
+    """
+    LRU cache of parsed statements. Texts that differ only in whitespace and literals share a statement parsed
+    with parameters in place of the literals, it is bound to the literals of the text and optimized.
+    Optimized trees of the recent texts are kept as well, so a repeated text is not even lexed.
+    Texts with ? or :name placeholders are only prepared, they are optimized with the values of the placeholders.
+    Plans are not cached: they are chosen by the current statistics of the tables
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_STATEMENTS):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # hits of the same text, they are counted in hits too
+        self.text_hits = 0
+        self.evictions = 0
+        self._statements = OrderedDict()
+        self._texts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def parse(self, text: str) -> nodes.Statements:
+        """
+        Optimized tree of the text, trees are shared and must not be changed
+        """
+
+        with self._lock:
+            tree = self._texts.get(text)
+            if tree is not None:
+                self._texts.move_to_end(text)
+                self.hits += 1
+                self.text_hits += 1
+                return tree
+
+        statement, values = self.prepare(text)
+        tree = optimize(statement, values)
+        if not explains(statement):
+            self._put(self._texts, text, tree)
+        return tree
+
+    def prepare(self, text: str) -> tuple:
+        """
+        Parsed statement of the text with parameters in place of its literals and the literal tokens
+        bound to them. Explain measures lexing and parsing of the text, so it is parsed as it is and not cached
+        """
+
+        tokens = list(Lexer(text))
+        key, values = normalize(tokens)
+        with self._lock:
+            statement = self._statements.get(key)
+            if statement is not None:
+                self._statements.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if statement is None:
+            statement = Parser(tokens, parameterize=True).parse()
+            if explains(statement):
+                return Parser(Lexer(text)).parse(), []
+            self._put(self._statements, key, statement)
+        return statement, values
+
+    def clear(self) -> None:
+        with self._lock:
+            self._statements.clear()
+            self._texts.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "text_hits": self.text_hits,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._statements),
+            "texts": len(self._texts),
+            "max_entries": self.max_entries,
+        }
+
+    def _put(self, entries: OrderedDict, key: any, value: nodes.Node) -> None:
+        with self._lock:
+            entries[key] = value
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+                self.evictions += 1
+
+
+# statements are parsed per request, so the cache is shared by the whole process
+default_statements = StatementCache()
+
+
+class PreparedStatement:
+    """
+    Statement parsed once and run many times with other values of its placeholders: ? are bound by their order
+    from a sequence, :name by name from a mapping. Every run binds the values, simplifies the statement and plans it
+    anew, the storage with its catalog is kept between the runs
+    """
+
+    def __init__(self, text: str, working_dir: str, engine: str = CsvEngine.name,
+                 statements: StatementCache = None, results: ResultCache = None) -> None:
+        self.text = text
+        statements = default_statements if statements is None else statements
+        self.statement, self.values = statements.prepare(text)
+        self.interpreter = Interpreter(None, working_dir, engine=engine, results=results)
+
+    def execute(self, parameters: Union[Sequence, Mapping] = None, cursor: bool = False) -> list:
+        self.interpreter.cursors = cursor
+        return self.interpreter.visit(optimize(self.statement, self.values, parameters))
+
+
+def prepare(text: str, working_dir: str, engine: str = CsvEngine.name,
+            results: ResultCache = None) -> PreparedStatement:
+    return PreparedStatement(text, working_dir, engine=engine, results=results)
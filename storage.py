@@ -1,9 +1,28 @@
 import io
+import operator
 import os
-from typing import Union
+import sys
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional, Union
 
+import numpy as np
 import pandas as pd
 
+from catalog import Catalog
+from engines import (ENGINES, TYPES, ZONE_ROWS, CsvEngine, DictionaryColumn, Engine, EngineException,
+                     NullableColumn, accepts, wider, zone_map)
+from index import HashIndex, hash_keys, index_key
+from vm import Code, run
+
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+DEFAULT_RESULT_BYTES = 64 * 1024 * 1024
+DEFAULT_CHUNK_ROWS = 64 * 1024
+# conditions are ordered by selectivity estimated on this many rows
+SAMPLE_ROWS = 1024
+# once fewer than 1/SPARSE of the rows are left, conditions are checked only on them
+SPARSE = 8
+
 
 class StorageException(Exception):
     pass
@@ -23,9 +42,349 @@ class TableColumnNotExists(StorageException):
         super().__init__(msg)
 
 
+OPERATORS = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+# can a block with values from mins to maxs have a value matching the comparison
+ZONE_TESTS = {
+    "=": lambda mins, maxs, value: (mins <= value) & (maxs >= value),
+    "<": lambda mins, maxs, value: mins < value,
+    "<=": lambda mins, maxs, value: mins <= value,
+    ">": lambda mins, maxs, value: maxs > value,
+    ">=": lambda mins, maxs, value: maxs >= value,
+}
+
+
+# aggregate function -> states kept for it by partial aggregation, besides the number of rows
+AGGREGATES = {
+    "count": ("count",),
+    "sum": ("count", "sum"),
+    "avg": ("count", "sum"),
+    "min": ("count", "min"),
+    "max": ("count", "max"),
+}
+
+
+class Or:
+    """
+    Where condition matching rows that match any of the branches, every branch is a where list
+    """
+
+    def __init__(self, branches: list):
+        self.branches = [[condition(item) for item in branch] for branch in branches]
+
+    def columns(self) -> list:
+        return [column for branch in self.branches for column in where_columns(branch)]
+
+    def __eq__(self, other: any) -> bool:
+        return isinstance(other, Or) and self.branches == other.branches
+
+    def __repr__(self) -> str:
+        return "Or(%r)" % self.branches
+
+
+class Expression:
+    """
+    Arithmetic over columns and literals in the result or in a where condition, compiled to bytecode.
+    It is evaluated by the VM on whole columns of the selected rows
+    """
+
+    def __init__(self, code: Code):
+        self.code = code
+
+    def columns(self) -> list:
+        return list(self.code.columns)
+
+    def rename(self, names: callable) -> 'Expression':
+        # columns are loaded by their number in the code, so only the names change
+        return Expression(Code(self.code.ops, self.code.constants, tuple(names(name) for name in self.code.columns)))
+
+    def evaluate(self, columns: dict) -> any:
+        return run(self.code, columns)
+
+    def __eq__(self, other: any) -> bool:
+        return isinstance(other, Expression) and str(self) == str(other)
+
+    def __hash__(self) -> int:
+        return hash(str(self))
+
+    def __str__(self) -> str:
+        return self.code.source()
+
+    def __repr__(self) -> str:
+        return "Expression(%s)" % self
+
+
+def condition(item: Union[tuple, Or]) -> Union[tuple, Or]:
+    """
+    Where condition as (column, operator, value) or Or, (column, value) pairs are equality conditions
+    """
+
+    if isinstance(item, Or) or len(item) == 3:
+        return item
+    column, value = item
+    return column, "=", value
+
+
+def where_columns(where: list) -> list:
+    columns = []
+    for item in map(condition, where):
+        if isinstance(item, Or):
+            columns += item.columns()
+        else:
+            column, _, value = item
+            columns += column.columns() if isinstance(column, Expression) else [column]
+            if isinstance(value, Expression):
+                columns += value.columns()
+    return columns
+
+
+def is_aggregated(result: list, group: Optional[list]) -> bool:
+    # aggregates are (function, column) pairs in the result, column is None for count(*)
+    return bool(group) or any(isinstance(item, tuple) for item in result)
+
+
+def used_columns(name: str, header: list, result: list, where: list, order: tuple = None,
+                 group: list = None) -> list:
+    """
+    Columns used by the query, raises if it refers to unknown columns or functions
+    or has columns that are neither grouped nor aggregated
+    """
+
+    group = group or []
+    items = result + ([order[0]] if order else [])
+    aggregated = is_aggregated(items, group)
+    used = group + where_columns(where)
+    for item in items:
+        if isinstance(item, Expression):
+            used += item.columns()
+            continue
+        if not isinstance(item, tuple):
+            used.append(item)
+            continue
+        function, column = item
+        if function not in AGGREGATES:
+            raise StorageException("Unknown aggregate function %s" % function)
+        if column is None and function != "count":
+            raise StorageException("Only count can be computed for *")
+        if column is not None:
+            used.append(column)
+    for column in used:
+        if column not in header:
+            raise TableColumnNotExists(name, column)
+    for item in items:
+        if aggregated and isinstance(item, Expression):
+            raise StorageException("Expression %s can't be used with aggregates" % item)
+        if aggregated and not isinstance(item, tuple) and item not in group:
+            raise StorageException("Column %s must be in group by or aggregated" % item)
+    return used
+
+
+def rename(item: Union[str, tuple], names: callable) -> Union[str, tuple]:
+    """
+    Result or order item with the column renamed
+    """
+
+    if isinstance(item, Expression):
+        return item.rename(names)
+    if isinstance(item, tuple):
+        function, column = item
+        return function, None if column is None else names(column)
+    return names(item)
+
+
+def rename_condition(item: Union[tuple, Or], names: callable) -> Union[tuple, Or]:
+    """
+    Where condition with the columns renamed
+    """
+
+    item = condition(item)
+    if isinstance(item, Or):
+        return Or([[rename_condition(branch_item, names) for branch_item in branch] for branch in item.branches])
+    column, op, value = item
+    return rename(column, names), op, value.rename(names) if isinstance(value, Expression) else value
+
+
+def hash_join(build: np.ndarray, probe: np.ndarray) -> tuple:
+    """
+    Pairs of positions of equal values: (positions in build, positions in probe) ordered by probe position.
+    Build values are put into a hash table and probe values are looked up in it, missing values match nothing
+    """
+
+    codes, uniques = pd.factorize(build)
+    found = pd.Index(uniques).get_indexer(probe)
+    matched = np.flatnonzero(found >= 0)
+    found = found[matched]
+
+    # build positions grouped by their value, missing values with code -1 go first and are skipped
+    positions = np.argsort(codes, kind="stable")
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    starts = np.count_nonzero(codes < 0) + np.cumsum(counts) - counts
+
+    # every probe position is repeated for each build position with its value
+    repeats = counts[found]
+    within = np.arange(repeats.sum()) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+    return positions[np.repeat(starts[found], repeats) + within], np.repeat(matched, repeats)
+
+
+def combine(partials: list) -> pd.DataFrame:
+    """
+    Partial aggregation of all rows from partial aggregations of their parts
+    """
+
+    frame = pd.concat(partials, ignore_index=True)
+    keys = [column for column in frame.columns if column.startswith("key:")]
+    functions = {}
+    for column in frame.columns:
+        if column not in keys:
+            state = column.split(":")[0]
+            functions[column] = "sum" if state in ("rows", "count") else state
+    return frame.groupby(keys, sort=False, dropna=False, observed=True).agg(functions).reset_index()
+
+
+def finish(states: pd.DataFrame, result: list, group: list, order: tuple = None, limit: int = 0) -> list:
+    """
+    Rows of the result from the partial aggregation of the selected rows, groups go in the order they were met
+    """
+
+    if not group and not len(states):
+        # aggregates of no rows: counts are 0, others are missing
+        states = pd.DataFrame({column: [0] for column in states.columns})
+
+    def output(item: Union[str, tuple]) -> pd.Series:
+        if not isinstance(item, tuple):
+            keys = states["key:%s" % item].astype(object)
+            return keys.where(keys.notna(), None)
+        function, column = item
+        if column is None:
+            return states["rows"].astype(object)
+        count = states["count:%s" % column]
+        if function == "count":
+            return count.astype(object)
+        if function == "avg":
+            values = states["sum:%s" % column] / count.where(count > 0, 1)
+        else:
+            values = states["%s:%s" % (function, column)]
+        return values.astype(object).where(count > 0, None)
+
+    positions = np.arange(len(states))
+    if order:
+        item, ascending = order
+        keys = output(item).reset_index(drop=True)
+        positions = keys.sort_values(ascending=ascending, kind="stable", na_position="last").index.to_numpy()
+    if limit:
+        positions = positions[:limit]
+    return [list(row) for row in zip(*[output(item).to_numpy()[positions].tolist() for item in result])]
+
+
+def _mask(mask: any, size: int) -> np.ndarray:
+    # old numpy returns a scalar when types are not comparable
+    if np.ndim(mask) == 0:
+        mask = np.full(size, bool(mask))
+    if isinstance(mask, (pd.Series, pd.Index)):
+        mask = mask.array
+    if isinstance(mask, pd.arrays.BooleanArray):
+        # missing values of nullable columns match nothing
+        return mask.to_numpy(dtype=bool, na_value=False)
+    return np.asarray(mask, dtype=bool)
+
+
+def compare_rows(values: np.ndarray, op: str, other: np.ndarray) -> np.ndarray:
+    """
+    Mask of the rows where the values match the comparison with the other values of the same row.
+    Missing values and values of other types match nothing
+    """
+
+    present = np.asarray(~pd.isna(values) & ~pd.isna(other), dtype=bool)
+    mask = np.zeros(len(values), dtype=bool)
+    try:
+        mask[present] = _mask(OPERATORS[op](values[present], other[present]), np.count_nonzero(present))
+    except TypeError:
+        pass
+    return mask
+
+
+def equals(values: any, value: any) -> np.ndarray:
+    return _mask(values == value, len(values))
+
+
+def compare(values: any, op: str, value: any) -> np.ndarray:
+    """
+    Mask of the values matching the comparison. Missing values and values of other types match nothing
+    """
+
+    if op == "=":
+        return equals(values, value)
+    if isinstance(values, DictionaryColumn):
+        # only distinct values are compared, rows get the result by their codes, missing code -1 gets False
+        return np.append(compare(values.dictionary[:-1], op, value), False)[values.codes]
+    if isinstance(values, NullableColumn):
+        return compare(np.asarray(values.data), op, value) & np.asarray(values.data != values.missing)
+    if isinstance(values, (pd.Series, pd.Index)):
+        values = values.array
+    if isinstance(values, pd.Categorical):
+        categories = np.asarray(values.categories, dtype=object)
+        return np.append(compare(categories, op, value), False)[values.codes]
+
+    if isinstance(values, np.ndarray) and values.dtype == object:
+        # missing values can't be compared with strings
+        present = np.asarray(~pd.isna(values), dtype=bool)
+        mask = np.zeros(len(values), dtype=bool)
+        try:
+            mask[present] = _mask(OPERATORS[op](values[present], value), np.count_nonzero(present))
+        except TypeError:
+            pass
+        return mask
+    try:
+        mask = _mask(OPERATORS[op](values, value), len(values))
+    except TypeError:
+        return np.zeros(len(values), dtype=bool)
+    # missing values are not equal to anything, but they are not unequal either
+    if op == "!=" and not (isinstance(values, np.ndarray) and values.dtype.kind in "iub"):
+        mask &= np.asarray(~pd.isna(values), dtype=bool)
+    return mask
+
+
+def top(values: np.ndarray, ascending: bool, limit: int) -> np.ndarray:
+    """
+    Mask of values that can get into the first limit values after sorting: values up to the limit-th one
+    including all its ties, found by partial selection. Missing values are sorted last
+    """
+
+    present = np.asarray(~pd.isna(values), dtype=bool)
+    mask = np.zeros(len(values), dtype=bool)
+    candidates = values[present]
+    if len(candidates) <= limit:
+        mask[present] = True
+        # missing values are sorted last, in their order
+        return mask | (~present & (np.cumsum(~present) <= limit - len(candidates)))
+    try:
+        if ascending:
+            kth = np.partition(candidates, limit - 1)[limit - 1]
+            mask[present] = candidates <= kth
+        else:
+            kth = np.partition(candidates, len(candidates) - limit)[len(candidates) - limit]
+            mask[present] = candidates >= kth
+    except TypeError:
+        # values that can't be compared to each other are left to the full sort
+        mask[:] = True
+    return mask
+
+
 class Table:
 
     def __init__(self, primary_key=None, columns=None):
+        # tables opened by memory mapping keep columns in data and have no DataFrame
+        self.data = None
+        # zone maps of the columns: stored ones of memory mapped tables, others are built on first use
+        self.zones = {}
+        self._sample = None
         if primary_key is not None and columns is not None:
             self.primary_key = primary_key
             self.columns = columns
@@ -37,16 +396,142 @@ class Table:
             self.df = None
 
     @staticmethod
-    def load(filepath: Union[str, io.StringIO]) -> 'Table':
+    def from_df(df: pd.DataFrame) -> 'Table':
         table = Table()
-        table.df = pd.read_csv(filepath, index_col=0)
-        table.primary_key = table.df.index.name
-        table.columns = table.df.columns.to_list()
+        table.df = df
+        table.primary_key = df.index.name
+        table.columns = df.columns.to_list()
         return table
 
+    @staticmethod
+    def from_columns(data: dict, zones: dict = None) -> 'Table':
+        table = Table()
+        table.data = data
+        table.primary_key, *table.columns = data.keys()
+        table.zones.update(zones or {})
+        return table
+
+    @staticmethod
+    def load(filepath: Union[str, io.StringIO]) -> 'Table':
+        return Table.from_df(CsvEngine.read(filepath))
+
+    def __len__(self) -> int:
+        if self.data is not None:
+            return len(self.data[self.primary_key])
+        return len(self.df)
+
+    def memory_usage(self) -> int:
+        if self.data is not None:
+            # memory mapped columns live in the OS page cache, only dictionaries are private
+            return sum(int(column.dictionary.nbytes) + sum(sys.getsizeof(value) for value in column.dictionary)
+                       for column in self.data.values() if isinstance(column, DictionaryColumn))
+        if self.df is None:
+            return 0
+        return int(self.df.memory_usage(index=True, deep=True).sum())
+
+    def nbytes(self, rows: np.ndarray = None) -> int:
+        """
+        Bytes of the column data of the rows, all rows by default
+        """
+
+        if not len(self):
+            return 0
+        if self.data is not None:
+            nbytes = sum(column.codes.nbytes if isinstance(column, DictionaryColumn) else
+                         column.data.nbytes if isinstance(column, NullableColumn) else column.nbytes
+                         for column in self.data.values())
+        else:
+            nbytes = int(self.df.memory_usage(index=True, deep=False).sum())
+        return nbytes if rows is None else nbytes * len(rows) // len(self)
+
+    def array(self, name: str, rows: np.ndarray) -> any:
+        """
+        Values of the column in the rows with pandas types: nullable integers, categorical strings
+        """
+
+        column = self.column(name)
+        if isinstance(column, DictionaryColumn):
+            return column.categorical(rows)
+        if isinstance(column, (pd.Series, pd.Index)):
+            column = column.array
+        return column.take(rows)
+
     def column_exists(self, name: str) -> bool:
         return name == self.primary_key or name in self.columns
 
+    def has(self, columns: list) -> bool:
+        return all(self.column_exists(name) for name in columns)
+
+    def column(self, name: str) -> any:
+        """
+        Whole column as pandas Index/Series, numpy (memory mapped) array or DictionaryColumn
+        """
+
+        if self.data is not None:
+            return self.data[name]
+        if name == self.primary_key:
+            return self.df.index
+        return self.df[name]
+
+    def values(self, name: Union[str, Expression], rows: np.ndarray) -> np.ndarray:
+        if isinstance(name, Expression):
+            values = self.evaluate(name, rows)
+        else:
+            column = self.column(name)
+            if isinstance(column, (pd.Series, pd.Index)):
+                # arrays are taken from without building a new index
+                column = column.array
+            values = column.take(rows)
+            if isinstance(column, DictionaryColumn):
+                # missing strings are None as missing integers are
+                values[np.asarray(column.codes[rows]) == -1] = None
+        if isinstance(values, pd.Categorical):
+            codes = values.codes
+            values = np.asarray(values, dtype=object)
+            values[codes == -1] = None
+            return values
+        if isinstance(values, (pd.arrays.IntegerArray, pd.arrays.FloatingArray)):
+            # nullable integers stay integers, missing values become None
+            if values.isna().any():
+                return values.to_numpy(dtype=object, na_value=None)
+            return values.to_numpy(dtype=values.dtype.numpy_dtype)
+        return np.asarray(values)
+
+    def evaluate(self, expression: Expression, rows: np.ndarray = None) -> any:
+        """
+        Values of the expression in the rows (all rows of the table by default), every operation is done
+        on whole columns. Integers are widened to 64 bits, missing values stay missing
+        """
+
+        rows = np.arange(len(self)) if rows is None else rows
+        data = {}
+        for name in expression.columns():
+            values = self.array(name, rows)
+            if isinstance(values, pd.arrays.IntegerArray):
+                # masked arithmetic is slower, the mask is kept only for columns with missing values
+                values = values.astype("Int64") if values.isna().any() else values.to_numpy(dtype=np.int64)
+            elif isinstance(values, np.ndarray) and values.dtype.kind in "iub":
+                values = values.astype(np.int64)
+            elif not pd.api.types.is_numeric_dtype(values):
+                raise StorageException("Can't compute %s on column %s" % (expression, name))
+            data[name] = values
+        # division by zero gives 0 as in numpy
+        with np.errstate(all="ignore"):
+            try:
+                values = expression.evaluate(data)
+            except TypeError:
+                raise StorageException("Can't compute %s" % expression)
+        if np.ndim(values) == 0:
+            # expression of literals only
+            return np.full(len(rows), values)
+        return values
+
+    def contains(self, keys: pd.Index) -> np.ndarray:
+        column = self.column(self.primary_key)
+        if isinstance(column, DictionaryColumn):
+            column = column.values()
+        return keys.isin(column)
+
     def save(self, filepath: Union[str, io.StringIO]) -> None:
         self.df.to_csv(filepath, index_label=self.df.index.name)
 
@@ -58,98 +543,843 @@ class Table:
         row = row.set_index(self.df.index.name)
         self.df = pd.concat([self.df, row])
 
-    def select(self, result: list, where: list, order: tuple = None, limit: int = 0) -> list:
-        search = self.df
+    def lookup(self, key: any) -> np.ndarray:
+        """
+        Positions of rows with the primary key
+        """
+
+        if self.data is None:
+            rows = self.df.index.get_indexer_for([key])
+            return rows[rows >= 0]
+        return np.flatnonzero(np.asarray(self.column(self.primary_key) == key))
+
+    def select(self, result: list, where: list, order: tuple = None, limit: int = 0,
+               rows: np.ndarray = None, group: list = None) -> list:
+        if is_aggregated(result + ([order[0]] if order else []), group):
+            return finish(self.partial(self.filter(where, rows=rows), result, group or [], order),
+                          result, group or [], order, limit)
+        rows = self.filter(where, order, limit, rows)
+        return [list(row) for row in zip(*[self.values(name, rows).tolist() for name in result])]
+
+    def partial(self, rows: np.ndarray, result: list, group: list, order: tuple = None) -> pd.DataFrame:
+        """
+        Hash aggregation of the rows into a row per group, in the order groups are met:
+        values of the group columns, number of rows and states of the aggregates (count, sum, min, max of values).
+        Partial aggregations of parts of a table are combined into the one of the whole table
+        """
+
+        data = {"key:%s" % column: self.array(column, rows) for column in group}
+        if not data:
+            data["key:"] = np.zeros(len(rows), dtype=np.int8)
+        keys = list(data)
+        aggregates = [item for item in result + ([order[0]] if order else []) if isinstance(item, tuple)]
+        for _, column in aggregates:
+            if column is not None and "value:%s" % column not in data:
+                values = self.array(column, rows)
+                # unordered categories have no min and max, strings have
+                if isinstance(values, pd.Categorical):
+                    values = np.asarray(values, dtype=object)
+                data["value:%s" % column] = values
+
+        grouped = pd.DataFrame(data).groupby(keys, sort=False, dropna=False, observed=True)
+        states = {"rows": grouped.size()}
+        for function, column in aggregates:
+            if column is None:
+                continue
+            if function in ("sum", "avg") and not pd.api.types.is_numeric_dtype(data["value:%s" % column]):
+                raise StorageException("Can't compute %s of column %s" % (function, column))
+            for state in AGGREGATES[function]:
+                if "%s:%s" % (state, column) not in states:
+                    try:
+                        states["%s:%s" % (state, column)] = grouped["value:%s" % column].agg(state)
+                    except TypeError:
+                        raise StorageException("Can't compute %s of column %s" % (function, column))
+        return pd.DataFrame(states).reset_index()
+
+    def mask(self, conditions: list, rows: np.ndarray = None) -> np.ndarray:
+        """
+        Mask of the rows (all rows of the table by default) matching all conditions.
+        Conditions are checked from the most selective one: on whole columns while most rows match,
+        then only on the matched rows, and not at all once no rows are left.
+        Blocks of rows that can't match a comparison by their zone maps are skipped
+        """
+
+        size = len(self) if rows is None else len(rows)
+        mask = np.ones(size, dtype=bool)
+        conditions = [condition(item) for item in conditions]
+        matched = size
+        if rows is None:
+            blocks = None
+            for item in conditions:
+                item_blocks = None if isinstance(item, Or) else self.blocks(*item)
+                if item_blocks is not None:
+                    blocks = item_blocks if blocks is None else blocks & item_blocks
+            if blocks is not None and not blocks.all():
+                mask = np.repeat(blocks, ZONE_ROWS)[:size]
+                matched = np.count_nonzero(mask)
+        # order matters for checks on whole columns, the rest cost as much as the rows they are checked on
+        if len(conditions) > 1 and matched > SAMPLE_ROWS and matched * SPARSE > size:
+            conditions = sorted(conditions, key=self.selectivity)
+        for item in conditions:
+            if not matched:
+                break
+            if rows is None and matched * SPARSE > size:
+                mask &= self.matches(item)
+            else:
+                positions = np.flatnonzero(mask)
+                mask[positions] = self.matches(item, positions if rows is None else rows[positions])
+            matched = np.count_nonzero(mask)
+        return mask
+
+    def matches(self, item: Union[tuple, Or], rows: np.ndarray = None) -> np.ndarray:
+        """
+        Mask of the rows (all rows of the table by default) matching the condition
+        """
+
+        if isinstance(item, Or):
+            # rows matched by a branch are not checked by the next ones
+            mask = np.zeros(len(self) if rows is None else len(rows), dtype=bool)
+            for branch in item.branches:
+                if rows is None:
+                    mask |= self.mask(branch)
+                else:
+                    rest = np.flatnonzero(~mask)
+                    mask[rest] = self.mask(branch, rows[rest])
+            return mask
+        name, op, value = item
+        if isinstance(value, Expression):
+            rows = np.arange(len(self)) if rows is None else rows
+            return compare_rows(self.values(name, rows), op, self.values(value, rows))
+        if isinstance(name, Expression):
+            return compare(self.evaluate(name, rows), op, value)
+        return compare(self.column(name) if rows is None else self.values(name, rows), op, value)
+
+    def selectivity(self, item: Union[tuple, Or]) -> float:
+        """
+        Estimated fraction of rows matching the condition, counted on evenly spaced rows
+        """
+
+        if not isinstance(item, Or) and item[1] == "=" and not any(isinstance(side, Expression)
+                                                                   for side in (item[0], item[2])):
+            column = self.column(item[0])
+            if isinstance(column, DictionaryColumn) and column.code(item[2]) is None:
+                return 0.0
+        if not len(self):
+            return 0.0
+        if self._sample is None:
+            self._sample = np.unique(np.linspace(0, len(self) - 1, SAMPLE_ROWS).astype(np.int64))
+        return float(np.mean(self.matches(item, self._sample)))
+
+    def zone(self, name: str) -> Optional[tuple]:
+        """
+        Zone map of the column: (smallest values, largest values) of its blocks of ZONE_ROWS rows,
+        None if the column is not numeric
+        """
+
+        if name not in self.zones:
+            column, missing = self.column(name), None
+            if isinstance(column, NullableColumn):
+                column, missing = column.data, column.missing
+            elif isinstance(column, (pd.Series, pd.Index)):
+                column = column.array
+                if isinstance(column, pd.arrays.IntegerArray):
+                    missing = np.iinfo(column.dtype.numpy_dtype).min
+                    column = column.to_numpy(dtype=column.dtype.numpy_dtype, na_value=missing)
+            # dictionary encoded, categorical and other extension columns have no zone maps
+            numeric = isinstance(column, (np.ndarray, pd.arrays.NumpyExtensionArray))
+            self.zones[name] = zone_map(np.asarray(column), missing) if numeric else None
+        return self.zones[name]
+
+    def blocks(self, name: Union[str, Expression], op: str, value: any) -> Optional[np.ndarray]:
+        """
+        Mask of blocks of ZONE_ROWS rows that may have rows matching the comparison, None if it is unknown.
+        Small tables are always checked row by row
+        """
+
+        if (op not in ZONE_TESTS or len(self) < 2 * ZONE_ROWS
+                or isinstance(name, Expression) or isinstance(value, Expression)):
+            return None
+        zone = self.zone(name)
+        if zone is None:
+            return None
+        mins, maxs = zone
+        blocks = np.ones(-(-len(self) // ZONE_ROWS), dtype=bool)
+        # stored zone maps may be read before or after the columns, blocks without zones are checked
+        count = min(len(blocks), len(mins))
+        try:
+            blocks[:count] = ZONE_TESTS[op](mins[:count], maxs[:count], value)
+        except (TypeError, OverflowError):
+            return None
+        return blocks
 
+    def filter(self, where: list, order: tuple = None, limit: int = 0, rows: np.ndarray = None) -> np.ndarray:
+        """
+        Positions of the selected rows in the order of the result.
+        Rows are candidate positions found by an index, they are checked against all conditions
+        """
+
+        # equality on the primary key is looked up, the last one wins
         pk = None
         conditions = []
-        for name, value in where:
-            if name == self.primary_key:
-                pk = value
+        for item in map(condition, where):
+            if (not isinstance(item, Or) and item[0] == self.primary_key and item[1] == "="
+                    and not isinstance(item[2], Expression)):
+                pk = item
             else:
-                conditions.append((name, value,))
+                conditions.append(item)
 
-        if pk is not None:
-            try:
-                search = search.loc[[pk], :]
-            except KeyError:
-                return []
+        # rows are tracked as positions, so columns are copied only once for the result
+        if rows is not None:
+            rows = np.unique(rows[rows < len(self)])
+            if pk is not None:
+                rows = rows[equals(self.values(self.primary_key, rows), pk[2])]
+        elif pk is not None:
+            rows = self.lookup(pk[2])
 
-        for name, value in conditions:
-            search = search[search[name] == value]
+        if conditions:
+            mask = self.mask(conditions, rows)
+            rows = np.flatnonzero(mask) if rows is None else rows[mask]
+        elif rows is None:
+            rows = np.arange(len(self))
+        return self.sort(rows, order, limit)
 
-        if self.primary_key in result:
-            search = search.reset_index()
+    def sort(self, rows: np.ndarray, order: tuple = None, limit: int = 0) -> np.ndarray:
+        """
+        Positions of the first limit rows (all of them without a limit) in the order
+        """
 
         if order:
             column, ascending = order
-            search = search.sort_values(by=column, ascending=ascending)
-
-        search = search[result]
+            keys = pd.Series(self.values(column, rows))
+            if limit and limit < len(keys):
+                # top-k: only rows that can get into the result are sorted, stable sort keeps the order of ties
+                keys = keys[top(keys.to_numpy(), ascending, limit)]
+            rows = rows[keys.sort_values(ascending=ascending, kind="stable").index.to_numpy()]
 
         if limit:
-            search = search[:limit]
-        return search.values.tolist()
+            rows = rows[:limit]
+        return rows
+
+
+class TableCache:
+    """
+    LRU cache of loaded tables bounded by their in-memory size.
+    Entry is valid while its signature (rewrite version + file stat) is unchanged,
+    so writes from this process and from other processes both invalidate it.
+    Appends don't bump the version: they always change file size, and stale entry
+    of an appended file can be brought up to date by reading only the new rows.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def version(self, key: str) -> int:
+        return self._versions.get(key, 0)
+
+    def bump(self, key: str) -> int:
+        with self._lock:
+            self._versions[key] = self._versions.get(key, 0) + 1
+            self._drop(key)
+            return self._versions[key]
+
+    def get(self, key: str, signature: tuple) -> Optional[Table]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def peek(self, key: str, signature: tuple) -> Optional[Table]:
+        """
+        Return valid entry without counting it as a hit or miss
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[1] if entry is not None and entry[0] == signature else None
+
+    def stale(self, key: str) -> Optional[tuple]:
+        """
+        Return signature and table of the entry regardless of its validity
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+            return None if entry is None else entry[:2]
+
+    def put(self, key: str, signature: tuple, table: Table) -> None:
+        nbytes = table.memory_usage()
+        with self._lock:
+            self._drop(key)
+            if nbytes > self.max_bytes:
+                return
+            while self._entries and self.size + nbytes > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self.size -= evicted
+                self.evictions += 1
+            self._entries[key] = (signature, table, nbytes)
+            self.size += nbytes
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+        }
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+
+# Storage objects are created per query, so the cache is shared by the whole process
+default_cache = TableCache()
+
+
+def rows_size(rows: list) -> int:
+    """
+    Estimated size of the rows in memory, values shared by the rows are counted for every row
+    """
+
+    return sys.getsizeof(rows) + sum(sys.getsizeof(row) + sum(map(sys.getsizeof, row)) for row in rows)
+
+
+class ResultCache:
+    """
+    LRU cache of results of select queries bounded by their estimated size. Entry is valid while the signatures
+    of the tables of the query are unchanged, so any write to them invalidates it, as for TableCache.
+    Tables are (name, cache key, signature), statistics are kept per table name, so they don't show the paths
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_RESULT_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def get(self, query: str, tables: tuple) -> Optional[list]:
+        key = self._key(query, tables)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == tables:
+                self._entries.move_to_end(key)
+                self._count(tables, "hits")
+                return entry[1]
+            if entry is not None:
+                # any of the tables is written since the result was cached
+                self._drop(key)
+                self._count([table for table, stale in zip(tables, entry[0]) if table != stale], "invalidations")
+            self._count(tables, "misses")
+            return None
+
+    def put(self, query: str, tables: tuple, rows: list) -> None:
+        key = self._key(query, tables)
+        nbytes = rows_size(rows)
+        with self._lock:
+            self._drop(key)
+            if nbytes > self.max_bytes:
+                return
+            while self._entries and self.size + nbytes > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self.size -= evicted
+                self.evictions += 1
+            self._entries[key] = (tables, rows, nbytes)
+            self.size += nbytes
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            tables = {name: dict(stats, entries=0) for name, stats in self._tables.items()}
+            for entry in self._entries.values():
+                for name, _, _ in entry[0]:
+                    tables[name]["entries"] += 1
+        return {
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "tables": tables,
+        }
+
+    def _count(self, tables: Iterable, counter: str) -> None:
+        # must be called with the cache locked
+        for name, _, _ in tables:
+            stats = self._tables.setdefault(name, {"hits": 0, "misses": 0, "invalidations": 0})
+            stats[counter] += 1
+
+    def _drop(self, key: tuple) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+    @staticmethod
+    def _key(query: str, tables: tuple) -> tuple:
+        # tables of the same name in other working dirs have other cache keys
+        return query, tuple(key for _, key, _ in tables)
+
+
+# results are cached only for interpreters that are given the cache
+default_results = ResultCache()
 
 
 class Storage:
 
-    def __init__(self, working_dir: str):
+    def __init__(self, working_dir: str, cache: TableCache = None, fsync: bool = False, engine: str = CsvEngine.name,
+                 mmap: bool = True, chunk_rows: int = DEFAULT_CHUNK_ROWS):
         if not os.path.exists(working_dir):
             raise StorageException("%s working dir is not exists")
+        if engine not in ENGINES:
+            raise StorageException("Unknown storage engine %s" % engine)
         self._working_dir = working_dir
+        self.catalog = Catalog(working_dir)
+        self.cache = default_cache if cache is None else cache
+        self.fsync = fsync
+        self.engine = ENGINES[engine]
+        self.mmap = mmap
+        self.chunk_rows = chunk_rows
+
+    def table_entry(self, name: str) -> Optional[dict]:
+        """
+        Catalog entry of the table, tables created without the catalog are added to it on first use
+        """
+
+        entry = self.catalog.table(name)
+        if entry is not None:
+            return entry
+        for engine in ENGINES.values():
+            path = engine.path(self._working_dir, name)
+            if engine.exists(path):
+                primary_key, *columns = engine.header(path)
+                with self.catalog.write() as tables:
+                    return tables.setdefault(name, Catalog.entry(engine.name, primary_key, columns, None, rows=None))
+        return None
+
+    def engine_of(self, name: str) -> Engine:
+        """
+        Engine of the existing table, or default engine for a new one
+        """
+
+        entry = self.table_entry(name)
+        return self.engine if entry is None else ENGINES[entry["engine"]]
 
     def path(self, name: str) -> str:
-        filename = "%s.csv" % name
-        return os.path.join(self._working_dir, filename)
+        return self.engine_of(name).path(self._working_dir, name)
 
     def exists(self, name: str) -> bool:
-        return os.path.exists(self.path(name))
+        return self.table_entry(name) is not None
+
+    def header(self, name: str) -> list:
+        """
+        Primary key and columns of the table from the catalog
+        """
+
+        entry = self.table_entry(name)
+        if entry is None:
+            raise TableNotExists(name)
+        return [entry["primary_key"]] + entry["columns"]
+
+    def index_path(self, name: str, index: str = None) -> str:
+        if index is None:
+            return os.path.join(self._working_dir, "%s.pk" % name)
+        return os.path.join(self._working_dir, "%s.%s.idx" % (name, index))
+
+    def types(self, name: str) -> dict:
+        """
+        Declared dtypes of the table columns
+        """
+
+        entry = self.table_entry(name)
+        return {} if entry is None else {column: dtype for column, dtype in entry["dtypes"].items() if dtype}
+
+    def kinds(self, name: str) -> dict:
+        """
+        Kinds of the untyped columns in the whole table for engines that infer types, so reading some of the rows
+        parses them as loading all of them does. Kept in the catalog while the size of the table data is the same
+        """
+
+        entry = self.table_entry(name)
+        engine = ENGINES[entry["engine"]]
+        untyped = [column for column, dtype in entry["dtypes"].items() if not dtype]
+        if not engine.infers or not untyped:
+            return {}
+        path = self.path(name)
+        known = entry.get("kinds")
+        if known is not None and known["size"] == engine.size(path):
+            return known["kinds"]
+        size = engine.size(path)
+        kinds = engine.kinds(path, untyped)
+        with self.catalog.write() as tables:
+            if name in tables:
+                tables[name]["kinds"] = {"size": size, "kinds": kinds}
+        return kinds
+
+    def indexes(self, name: str) -> dict:
+        """
+        Secondary indexes of the table: index name -> column
+        """
+
+        entry = self.table_entry(name)
+        return {} if entry is None else entry["indexes"]
+
+    def lock(self, name: str):
+        """
+        Writers of the table and its indexes hold the lock of the primary key index
+        """
+
+        return HashIndex(self.index_path(name)).lock()
+
+    def primary_index(self, name: str) -> HashIndex:
+        """
+        Primary key index of the table brought up to date with the table data
+        """
+
+        return self._up_to_date(name, HashIndex(self.index_path(name)), None)
+
+    def secondary_index(self, name: str, index: str) -> HashIndex:
+        return self._up_to_date(name, HashIndex(self.index_path(name, index)), self.indexes(name)[index])
+
+    def _up_to_date(self, name: str, index: HashIndex, column: Optional[str]) -> HashIndex:
+        engine, path = self.engine_of(name), self.path(name)
+        if index.covers(engine.identity(path), engine.size(path)) != engine.size(path):
+            with self.lock(name):
+                self._sync_index(name, index, self.header(name)[0] if column is None else column)
+        return index
+
+    def _sync_index(self, name: str, index: HashIndex, column: str) -> None:
+        # must be called with the index locked
+        engine, path = self.engine_of(name), self.path(name)
+        identity, size = engine.identity(path), engine.size(path)
+        covered = index.covers(identity, size)
+        if covered is None:
+            values, offsets, end = engine.keys(path, column, 0)
+            index.create(identity, hash_keys(values), offsets, end)
+        elif covered < size:
+            values, offsets, end = engine.keys(path, column, covered)
+            index.add(hash_keys(values), offsets, end)
+
+    def cache_key(self, name: str) -> str:
+        return os.path.abspath(self.path(name))
+
+    def signature(self, name: str) -> tuple:
+        return (self.cache.version(self.cache_key(name)),) + self.engine_of(name).signature(self.path(name))
+
+    def load(self, name: str, columns: list = None) -> Table:
+        """
+        Table with the columns besides the primary key, all of them by default.
+        Only the columns are read, a cached table gets the ones it lacks on the next load
+        """
+
+        if columns is None:
+            columns = self.header(name)[1:]
+        key = self.cache_key(name)
+        signature = self.signature(name)
+        table = self.cache.get(key, signature)
+        if table is not None and table.has(columns):
+            return table
+        if table is None:
+            table = self._merge_appended(name, signature)
+        if table is None or not table.has(columns):
+            if table is not None:
+                columns = table.columns + [column for column in columns if column not in table.columns]
+            table = self._open(name, columns)
+            if table is None:
+                table = Table.from_df(self.engine_of(name).load(self.path(name), columns, self.types(name)))
+        self.cache.put(key, signature, table)
+        return table
+
+    def cached(self, name: str) -> Optional[Table]:
+        return self.cache.get(self.cache_key(name), self.signature(name))
+
+    def mapped(self, name: str) -> bool:
+        return self.mmap and self.engine_of(name).mmap
+
+    def _open(self, name: str, columns: list) -> Optional[Table]:
+        # memory mapped tables are shared with other processes through the OS page cache
+        if not self.mapped(name):
+            return None
+        engine, path = self.engine_of(name), self.path(name)
+        return Table.from_columns(engine.open(path, columns), engine.zones(path, columns))
+
+    def _merge_appended(self, name: str, signature: tuple) -> Optional[Table]:
+        # tables are append-only until rewritten and every rewrite bumps the version,
+        # so the engine can read only the rows appended since the table was cached
+        stale = self.cache.stale(self.cache_key(name))
+        if stale is None or stale[0][0] != signature[0] or stale[1].df is None:
+            return None
+        old_signature, table = stale
+        df = self.engine_of(name).merge(self.path(name), table.df, old_signature[1:], signature[1:], self.types(name))
+        return None if df is None else Table.from_df(df)
+
+    def create(self, name: str, primary: str, columns: list, engine: str = None, types: dict = None) -> bool:
+        """
+        Types are declared types of some of the columns: int, int8, int16, int32, int64, float, float32, float64, text
+        """
 
-    def create(self, name: str, primary: str, columns: list) -> bool:
         if self.exists(name):
             return False
-        Table(primary, columns).save(self.path(name))
-        return self.exists(name)
+        if engine is not None and engine not in ENGINES:
+            raise StorageException("Unknown storage engine %s" % engine)
+        engine = self.engine if engine is None else ENGINES[engine]
+        dtypes = {}
+        for column, column_type in (types or {}).items():
+            if column not in [primary] + columns:
+                raise TableColumnNotExists(name, column)
+            if column_type not in TYPES:
+                raise StorageException("Unknown type %s of column %s" % (column_type, column))
+            dtypes[column] = TYPES[column_type]
 
-    def describe(self, name: str) -> list:
+        path = engine.path(self._working_dir, name)
+        with self.catalog.write() as tables:
+            if name in tables:
+                return False
+            HashIndex(self.index_path(name)).remove()
+            engine.create(path, primary, columns, dtypes)
+            tables[name] = Catalog.entry(engine.name, primary, columns, dtypes, size=engine.size(path))
+        self.cache.bump(os.path.abspath(path))
+        return True
+
+    def drop(self, name: str) -> bool:
         if not self.exists(name):
+            return False
+        path = self.path(name)
+        with self.catalog.write() as tables:
+            entry = tables.pop(name, None)
+            if entry is None:
+                return False
+            ENGINES[entry["engine"]].remove(path)
+            for index in entry["indexes"]:
+                HashIndex(self.index_path(name, index)).remove()
+            HashIndex(self.index_path(name)).remove()
+        self.cache.bump(os.path.abspath(path))
+        return True
+
+    def create_index(self, name: str, index: str, column: str) -> bool:
+        """
+        Build a persistent hash index on the column, it is used by select for equality conditions
+        """
+
+        if column not in self.header(name):
+            raise TableColumnNotExists(name, column)
+        with self.lock(name):
+            if index in self.indexes(name):
+                return False
+            hash_index = HashIndex(self.index_path(name, index))
+            hash_index.remove()
+            self._sync_index(name, hash_index, column)
+            with self.catalog.write() as tables:
+                tables[name]["indexes"][index] = column
+                tables[name].setdefault("distinct", {})[column] = hash_index.distinct()
+                tables[name]["version"] += 1
+        return True
+
+    def rows(self, name: str) -> Optional[int]:
+        """
+        Number of rows of the table from the catalog, None if the table was changed bypassing it
+        """
+
+        entry = self.table_entry(name)
+        if entry is None:
             raise TableNotExists(name)
-        return Table.load(self.path(name)).info()
+        if entry["rows"] is None or entry.get("size") != self.engine_of(name).size(self.path(name)):
+            return None
+        return entry["rows"]
+
+    def describe(self, name: str) -> list:
+        return self.header(name)
 
     def insert(self, name: str, columns: list) -> None:
-        if not self.exists(name):
-            raise TableNotExists(name)
-        table = Table.load(self.path(name))
-        row = {}
-        for column, value in columns:
-            if not table.column_exists(column):
-                raise TableColumnNotExists(name, column)
-            else:
-                row[column] = [value]
+        self.insert_many(name, [columns])
 
-        if table.primary_key not in row.keys():
-            raise StorageException("Primary key %s is required" % table.primary_key)
-        if not row[table.primary_key][0]:
-            raise StorageException("Primary key cant by empty")
-        if row[table.primary_key][0] in table.df.index.values:
-            raise StorageException("Such primary key %s already exists" % row[table.primary_key][0])
+    def insert_many(self, name: str, rows: list) -> None:
+        """
+        Insert rows given as lists of (column, value) pairs with a single write.
+        Nothing is written if any of the rows is invalid
+        """
 
-        table.insert(row)
-        table.save(self.path(name))
+        header = self.header(name)
+        primary_key = header[0]
 
-    def select(self, name: str, result: list, where: list, order: tuple = None, limit: int = None) -> list:
-        if not self.exists(name):
-            raise TableNotExists(name)
-        table = Table.load(self.path(name))
-        for column in result:
-            if not table.column_exists(column):
-                raise TableColumnNotExists(name, column)
-        for column, _ in where:
-            if not table.column_exists(column):
-                raise TableColumnNotExists(name, column)
-        if order:
-            column, ascending = order
-            if not table.column_exists(column):
-                raise TableColumnNotExists(name, column)
-        return table.select(result, where, order, limit)
+        data = {column: [] for column in header}
+        checked = set()
+        for columns in rows:
+            names = frozenset(column for column, _ in columns)
+            if names not in checked:
+                for column in names:
+                    if column not in data:
+                        raise TableColumnNotExists(name, column)
+                if primary_key not in names:
+                    raise StorageException("Primary key %s is required" % primary_key)
+                checked.add(names)
+            row = dict(columns)
+            for column, values in data.items():
+                values.append(row.get(column))
+
+        for column, dtype in self.types(name).items():
+            for value in data[column]:
+                if not accepts(dtype, value):
+                    raise StorageException("Column %s of type %s can't store value %r" % (column, dtype, value))
+
+        keys = data[primary_key]
+        for key in keys:
+            if not key:
+                raise StorageException("Primary key cant by empty")
+
+        keys = pd.Index([index_key(key) for key in keys])
+        duplicated = keys[keys.duplicated()]
+        if len(duplicated):
+            raise StorageException("Such primary key %s already exists" % duplicated[0])
+
+        engine, path = self.engine_of(name), self.path(name)
+        index = HashIndex(self.index_path(name))
+        with self.lock(name):
+            self._sync_index(name, index, primary_key)
+            secondary = [(HashIndex(self.index_path(name, idx)), column) for idx, column in self.indexes(name).items()]
+            for secondary_index, column in secondary:
+                self._sync_index(name, secondary_index, column)
+            hashes = hash_keys(keys)
+            found, offsets = index.lookup(hashes)
+            if len(found):
+                # hashes may collide, so keys of the found rows are compared too
+                found = engine.read_rows(path, offsets, [], kinds=self.kinds(name)).index
+                existing = keys.isin([index_key(key) for key in found])
+                if existing.any():
+                    raise StorageException("Such primary key %s already exists" % keys[existing][0])
+
+            old_size = engine.size(path)
+            try:
+                offsets = engine.append(path, data, fsync=self.fsync)
+            except EngineException as err:
+                raise StorageException(str(err))
+            size = engine.size(path)
+            index.add(hashes, offsets, size)
+            distinct = {}
+            for secondary_index, column in secondary:
+                column_hashes = hash_keys(data[column])
+                distinct[column] = secondary_index.new(column_hashes)
+                secondary_index.add(column_hashes, offsets, size)
+
+            with self.catalog.write() as tables:
+                entry = tables[name]
+                # rows and distinct values are counted only while the table is written through the catalog
+                if entry["rows"] is not None and entry.get("size") == old_size:
+                    entry["rows"] += len(keys)
+                    entry["size"] = size
+                    for column, count in distinct.items():
+                        entry.setdefault("distinct", {})[column] = entry["distinct"].get(column, 0) + count
+                else:
+                    entry["rows"] = None
+                known = entry.get("kinds")
+                if known is not None and known["size"] == old_size:
+                    added = engine.kinds(path, list(known["kinds"]), int(offsets[0]))
+                    kinds = {column: wider(kind, added[column]) for column, kind in known["kinds"].items()}
+                    entry["kinds"] = None if None in kinds.values() else {"size": size, "kinds": kinds}
+                else:
+                    entry["kinds"] = None
+                entry["version"] += 1
+
+    def select(self, name: str, result: list, where: list, order: tuple = None, limit: int = None,
+               group: list = None) -> list:
+        """
+        Result and order items are columns or aggregates: (function, column) pairs, column is None for count(*).
+        With aggregates or group columns there is a row per group, other columns of the result must be grouped by
+        """
+
+        # the planner is built on top of the storage, so it is imported on use
+        from planner import Planner
+        return Planner(self).select(name, result, where, order, limit, group).rows()
+
+    def join(self, name: str, other: str, on: tuple, result: list, where: list, order: tuple = None,
+             limit: int = None, group: list = None) -> list:
+        """
+        Select from rows of the table joined with rows of the other table where the on columns are equal.
+        Columns may be qualified by their table (table.column), unqualified ones must be in one of the tables only
+        """
+
+        from planner import Planner
+        return Planner(self).join(name, other, on, result, where, order, limit, group).rows()
+
+    def distinct(self, name: str, column: str) -> Optional[int]:
+        """
+        Number of distinct values of the primary key or an indexed column from the catalog, None if it is unknown
+        """
+
+        rows = self.rows(name)
+        if rows is None or column == self.header(name)[0]:
+            return rows
+        return self.table_entry(name).get("distinct", {}).get(column)
+
+    def index_on(self, name: str, column: str) -> Union[str, None, bool]:
+        """
+        Name of an index on the column, None for the primary key, False if the column is not indexed
+        """
+
+        if column == self.header(name)[0]:
+            return None
+        for index, indexed in self.indexes(name).items():
+            if indexed == column:
+                return index
+        return False
+
+    def in_memory(self, name: str, columns: list) -> bool:
+        # cached tables with the columns and memory mapped ones are not read to be scanned
+        table = self.cache.peek(self.cache_key(name), self.signature(name))
+        return (table is not None and table.has(columns)) or self.mapped(name)
+
+    def nbytes(self, name: str) -> int:
+        return self.engine_of(name).nbytes(self.path(name))
+
+    def read(self, name: str, columns: list, lookups: list) -> tuple:
+        """
+        Table with the rows found by index lookups: (index name or None for the primary key, values) pairs,
+        and positions of the rows in it, None for all rows. Rows with any of the values of every lookup are found,
+        they still have to be checked against the conditions
+        """
+
+        # loaded tables are searched in memory, others read only rows found by the indexes
+        table = self.cached(name)
+        if table is not None and table.df is not None and table.has(columns):
+            return table, None
+        offsets = None
+        for index, values in lookups:
+            hash_index = self.primary_index(name) if index is None else self.secondary_index(name, index)
+            _, found = hash_index.lookup(hash_keys(values))
+            found = np.unique(found)
+            offsets = found if offsets is None else np.intersect1d(offsets, found)
+        if self.mapped(name):
+            return self.load(name, columns), offsets
+        df = self.engine_of(name).read_rows(self.path(name), offsets, columns, self.types(name), self.kinds(name))
+        return Table.from_df(df), None
+
+    def chunks(self, name: str, columns: list):
+        """
+        Tables with the columns of consecutive chunks of rows, read one by one
+        """
+
+        engine, path = self.engine_of(name), self.path(name)
+        for chunk in engine.scan(path, self.chunk_rows, columns, self.types(name), self.kinds(name)):
+            yield Table.from_df(chunk)
@@ -1,24 +1,14 @@
-import os
-import unittest
-
+from cursor import Cursor
 from interpreter import Interpreter
 from lexer import Lexer
 from parser import Parser
-from tests.helpers import cases
+from storage import ResultCache
+from tests.helpers import TestDirCase, cases
 
 
-class TestInterpreter(unittest.TestCase):
+class TestInterpreter(TestDirCase):
     TEST_DIR = 'tests_tables'
 
-    def setUp(self) -> None:
-        if not os.path.exists(self.TEST_DIR):
-            os.mkdir(self.TEST_DIR)
-
-    def tearDown(self) -> None:
-        for filename in os.listdir(self.TEST_DIR):
-            os.remove(os.path.join(self.TEST_DIR, filename))
-        os.rmdir(self.TEST_DIR)
-
     @cases([
         (
                 [
@@ -92,13 +82,62 @@ class TestInterpreter(unittest.TestCase):
         results = inter.do()
         self.assertEqual(expected, results)
 
+    @cases([
+        (
+                [
+                    "create table foobar (primary key uid, a, b);",
+                    "insert into foobar (uid, a, b) values (1, 'Hello', 100), (2, 'World', 200);",
+                    "insert into foobar (b, uid) values (300, 3);",
+                    "select uid, b from foobar where b=300;",
+                    "select uid, a, b from foobar order by uid asc limit 2;"
+                ],
+                [
+                    True,
+                    None,
+                    None,
+                    [[3, 300]],
+                    [[1, "Hello", 100], [2, "World", 200]]
+                ]
+        ),
+    ])
+    def test_insert_values_ok(self, queries, expected):
+        sql = "".join(queries)
+        inter = Interpreter(tree=Parser(lex=Lexer(sql)).parse(), working_dir=self.TEST_DIR)
+        results = inter.do()
+        self.assertEqual(expected, results)
+
+    def test_create_typed_ok(self):
+        queries = [
+            "create table foobar (primary key uid int, a text, b int16);",
+            "insert into foobar (uid, a, b) values (1, 'Hello', 100), (2, 'World', 200);",
+            "insert into foobar (uid, a) values (3, 'Hello');",
+            "describe foobar;",
+            "select uid, a, b from foobar order by b desc;",
+        ]
+        inter = Interpreter(tree=Parser(lex=Lexer("".join(queries))).parse(), working_dir=self.TEST_DIR)
+        results = inter.do()
+        expected = [[2, "World", 200], [1, "Hello", 100], [3, "Hello", None]]
+        self.assertEqual([True, None, None, ["uid", "a", "b"], expected], results)
+
+    def test_create_index_ok(self):
+        queries = [
+            "create table foobar (primary key uid, a, b);",
+            "insert into foobar (uid, a, b) values (1, 'Hello', 100), (2, 'World', 200), (3, 'Hello', 300);",
+            "create index foobar_a on foobar (a);",
+            "create index foobar_a on foobar (b);",
+            "insert into foobar set uid=4, a='Hello', b=400;",
+            "select uid, b from foobar where a='Hello';",
+        ]
+        inter = Interpreter(tree=Parser(lex=Lexer("".join(queries))).parse(), working_dir=self.TEST_DIR)
+        results = inter.do()
+        self.assertEqual([True, None, True, False, None, [[1, 100], [3, 300], [4, 400]]], results)
+
 
-class TestInterpreterSelect(unittest.TestCase):
+class TestInterpreterSelect(TestDirCase):
     TEST_DIR = 'tests_tables'
 
     def setUp(self) -> None:
-        if not os.path.exists(self.TEST_DIR):
-            os.mkdir(self.TEST_DIR)
+        super().setUp()
 
         queries = [
             "create table foobar (primary key uid, a, b);",
@@ -108,17 +147,14 @@ class TestInterpreterSelect(unittest.TestCase):
             "insert into foobar set uid=4, a='d', b=200;",
             "insert into foobar set uid=5, a='e', b=300;",
             "insert into foobar set uid=6, a='f', b=300;",
+            "create table bar (primary key id, foobar_id, c);",
+            "insert into bar (id, foobar_id, c) values (1, 1, 'w'), (2, 3, 'x'), (3, 5, 'y'), (4, 1, 'z');",
         ]
 
         sql = "".join(queries)
         inter = Interpreter(tree=Parser(lex=Lexer(sql)).parse(), working_dir=self.TEST_DIR)
         inter.do()
 
-    def tearDown(self) -> None:
-        for filename in os.listdir(self.TEST_DIR):
-            os.remove(os.path.join(self.TEST_DIR, filename))
-        os.rmdir(self.TEST_DIR)
-
     @cases([
         ("select uid from foobar;", [[1], [2], [3], [4], [5], [6]]),
         ("select a from foobar;", [['a'], ['b'], ['c'], ['d'], ['e'], ['f']]),
@@ -137,6 +173,39 @@ class TestInterpreterSelect(unittest.TestCase):
         ("select uid from foobar where uid=1 and a='a';", [[1]]),
         ("select uid from foobar where b=100;", [[1], [2]]),
 
+        # aggregates
+        ("select count(*) from foobar;", [[6]]),
+        ("select count(*), sum(b), avg(b), min(a), max(a) from foobar where uid>2;", [[4, 1000, 250.0, 'c', 'f']]),
+        ("select b, count(*), max(a) from foobar group by b order by b desc limit 2;", [[300, 2, 'f'], [200, 2, 'd']]),
+        ("select b from foobar where a!='c' group by b order by count(*) asc limit 1;", [[200]]),
+
+        # ranges and or
+        ("select uid from foobar where b>100 and b<=300 and uid!=4;", [[3], [5], [6]]),
+        ("select uid from foobar where a>='e' or uid<2;", [[1], [5], [6]]),
+        ("select uid from foobar where (a='a' or a='c') and b>=200;", [[3]]),
+        ("select uid from foobar where uid<>1 and b<200 order by uid desc;", [[2]]),
+
+        # join
+        ("select foobar.uid, c from foobar join bar on foobar.uid = bar.foobar_id where b>100 order by c desc;",
+         [[5, 'y'], [3, 'x']]),
+        ("select a, count(*) from bar join foobar on bar.foobar_id = uid group by a;", [['a', 2], ['c', 1], ['e', 1]]),
+
+        # expressions
+        ("select uid, b / uid + 1 from foobar where b * 2 > 400;", [[5, 61], [6, 51]]),
+        ("select uid * 10 from foobar where uid - 1 = 1 + 1;", [[30]]),
+        ("select uid from foobar where b > 100 + 50 order by b - uid desc limit 2;", [[5], [6]]),
+        ("select 1, uid from foobar limit 2;", [[1, 1], [1, 2]]),
+        ("select foobar.uid + id, c from foobar join bar on foobar.uid = bar.foobar_id where foobar.uid + id > 5;",
+         [[8, 'y']]),
+        ("select uid from foobar where b > uid * 50;", [[1], [3], [5]]),
+        ("select uid from foobar where (uid + 1) * 100 > b + 200;", [[4], [5], [6]]),
+        ("select foobar.uid, c from foobar join bar on foobar.uid = bar.foobar_id where id > foobar.uid;", [[1, 'z']]),
+
+        # conditions known before the run
+        ("select uid from foobar where 1 = 1 and b = 100;", [[1], [2]]),
+        ("select uid from foobar where b = 100 and 1 > 2;", []),
+        ("select uid from foobar where (uid = 1 or 2 = 2) and b > 100 and b > 250;", [[5], [6]]),
+
         # select primary key order by primary key
         ("select uid from foobar order by uid asc limit 3;", [[1], [2], [3]]),
         ("select uid from foobar order by uid desc limit 3;", [[6], [5], [4]]),
@@ -157,3 +226,119 @@ class TestInterpreterSelect(unittest.TestCase):
         inter = Interpreter(tree=Parser(lex=Lexer(sql)).parse(), working_dir=self.TEST_DIR)
         results = inter.do()
         self.assertEqual(expected, results[0])
+
+    @cases([
+        "select uid + 1;",
+    ])
+    def test_select_expression_invalid(self, sql):
+        inter = Interpreter(tree=Parser(lex=Lexer(sql)).parse(), working_dir=self.TEST_DIR)
+        with self.assertRaises(Exception):
+            inter.do()
+
+    @cases([
+        ("explain select a from foobar where uid=1;",
+         [["Project a"], ["  Filter uid = 1"], ["    IndexScan foobar by primary key"]]),
+        ("explain select a from foobar order by b desc limit 2;",
+         [["Project a"], ["  TopK 2 by b desc"], ["    Scan foobar"]]),
+        ("explain select 1+1;", [["Expression"]]),
+        ("explain select b / uid from foobar where b * 2 > 400 order by (uid - 1) * 2 desc;",
+         [["Project b / uid"], ["  Sort by (uid - 1) * 2 desc"], ["    Filter b * 2 > 400"], ["      Scan foobar"]]),
+    ])
+    def test_explain(self, sql, expected):
+        inter = Interpreter(tree=Parser(lex=Lexer(sql)).parse(), working_dir=self.TEST_DIR)
+        self.assertEqual(expected, inter.do()[0])
+
+    @cases([
+        "select uid, a from foobar;",
+        "select uid, b * 2 from foobar where b >= 200 order by uid desc;",
+        "select a from foobar limit 3;",
+        "select b, count(*) from foobar group by b;",
+        "select a, c from foobar join bar on foobar.uid = bar.foobar_id;",
+    ])
+    def test_select_cursor(self, sql):
+        expected = Interpreter(tree=Parser(lex=Lexer(sql)).parse(), working_dir=self.TEST_DIR).do()[0]
+        cursor, = Interpreter(tree=Parser(lex=Lexer(sql)).parse(), working_dir=self.TEST_DIR).do(cursor=True)
+        self.assertIsInstance(cursor, Cursor)
+        self.assertEqual(expected[:1], [cursor.fetchone()])
+        self.assertEqual(expected[1:3], cursor.fetchmany(2))
+        self.assertEqual(expected[3:], list(cursor))
+
+    def test_select_cursor_before_later_statements(self):
+        sql = ("select uid from foobar where b >= 300;"
+               "insert into foobar set uid=7, a='g', b=300;"
+               "select uid from foobar where b >= 300;")
+        first, _, second = Interpreter(tree=Parser(lex=Lexer(sql)).parse(), working_dir=self.TEST_DIR).do(cursor=True)
+        self.assertEqual([[5], [6]], first.fetchall())
+        self.assertEqual([[5], [6], [7]], second.fetchall())
+
+    def test_select_cursor_errors_raised_by_do(self):
+        inter = Interpreter(tree=Parser(lex=Lexer("select a * 2 from foobar;")).parse(), working_dir=self.TEST_DIR)
+        with self.assertRaises(Exception):
+            inter.do(cursor=True)
+
+    def test_explain_analyze(self):
+        sql = "explain analyze select a from foobar where b>100 order by b desc limit 2;"
+        lines = Interpreter(tree=Parser(lex=Lexer(sql)).parse(), working_dir=self.TEST_DIR).do()[0]
+        self.assertEqual(["Lexing", "Parsing", "Project a", "  TopK 2 by b desc", "    Filter b > 100",
+                          "      Scan foobar"], [line[0] for line in lines])
+        self.assertEqual([[None, 17], [17, None], [2, 2], [4, 2], [6, 4], [None, 6]],
+                         [line[2:4] for line in lines])
+
+
+class TestInterpreterResultCache(TestDirCase):
+    TEST_DIR = 'tests_tables'
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.results = ResultCache()
+        self.run_sql("create table foobar (primary key uid int, a text, b int);"
+                     "insert into foobar (uid, a, b) values (1, 'a', 100), (2, 'b', 200), (3, 'c', 300);"
+                     "create table bar (primary key id, foobar_id, c);"
+                     "insert into bar (id, foobar_id, c) values (1, 1, 'x'), (2, 3, 'y');")
+
+    def run_sql(self, sql: str, cursor: bool = False) -> list:
+        inter = Interpreter(tree=Parser(lex=Lexer(sql)).parse(), working_dir=self.TEST_DIR, results=self.results)
+        return inter.do(cursor=cursor)
+
+    def table_stats(self, name: str) -> tuple:
+        stats = self.results.stats()["tables"][name]
+        return stats["hits"], stats["misses"], stats["invalidations"], stats["entries"]
+
+    def test_hits(self):
+        self.assertEqual([[[2], [3]]], self.run_sql("select uid from foobar where b > 100;"))
+        # the same query after the constants are computed
+        self.assertEqual([[[2], [3]]], self.run_sql("select uid  from foobar where b > 50 * 2;"))
+        self.assertEqual([[[3]]], self.run_sql("select uid from foobar where b > 200;"))
+        self.assertEqual((1, 2, 0, 2), self.table_stats("foobar"))
+
+    def test_insert_invalidates(self):
+        sql = "select a from foobar where b >= 300;"
+        self.assertEqual([[["c"]]], self.run_sql(sql))
+        self.run_sql("insert into foobar set uid=4, a='d', b=400;")
+        self.assertEqual([[["c"], ["d"]]], self.run_sql(sql))
+        self.assertEqual([[["c"], ["d"]]], self.run_sql(sql))
+        self.assertEqual((1, 2, 1, 1), self.table_stats("foobar"))
+
+    def test_join_depends_on_both_tables(self):
+        sql = "select a, c from foobar join bar on foobar.uid = bar.foobar_id;"
+        self.assertEqual([[["a", "x"], ["c", "y"]]], self.run_sql(sql))
+        self.run_sql("insert into bar set id=3, foobar_id=2, c='z';")
+        self.assertEqual([[["a", "x"], ["b", "z"], ["c", "y"]]], self.run_sql(sql))
+        self.assertEqual((0, 2, 0, 1), self.table_stats("foobar"))
+        self.assertEqual((0, 2, 1, 1), self.table_stats("bar"))
+
+    def test_cursor(self):
+        sql = "select uid from foobar where b > 100;"
+        # rows read by a cursor are not kept
+        self.assertEqual([[2], [3]], self.run_sql(sql, cursor=True)[0].fetchall())
+        self.assertEqual(0, self.results.stats()["entries"])
+        self.run_sql(sql)
+        self.assertEqual([[2], [3]], list(self.run_sql(sql, cursor=True)[0]))
+        self.assertEqual((1, 2, 0, 1), self.table_stats("foobar"))
+
+    def test_not_cached(self):
+        self.run_sql("select 1 + 1;")
+        self.run_sql("explain analyze select a from foobar;")
+        with self.assertRaises(Exception):
+            self.run_sql("select a from nothing;")
+        self.assertEqual(0, self.results.stats()["entries"])
@@ -1,4 +1,7 @@
 import functools
+import os
+import shutil
+import unittest
 
 
 def cases(test_cases):
@@ -16,3 +19,30 @@ def cases(test_cases):
         return wrapper
 
     return decorator
+
+
+class TestDirCase(unittest.TestCase):
+    """
+    Test with TEST_DIR created before every test and removed with all of its files after it
+    """
+
+    TEST_DIR = None
+
+    def setUp(self) -> None:
+        if not os.path.exists(self.TEST_DIR):
+            os.mkdir(self.TEST_DIR)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.TEST_DIR)
+
+    @staticmethod
+    def create_table(storage, name: str, primary: str, columns: list, rows: list, engine: str = None,
+                     types: dict = None) -> None:
+        """
+        Table made anew with the rows given as lists of values of the primary key and the columns,
+        trailing values may be left out
+        """
+
+        storage.drop(name)
+        storage.create(name, primary, columns, engine, types)
+        storage.insert_many(name, [list(zip([primary] + columns, row)) for row in rows])
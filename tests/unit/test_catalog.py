@@ -0,0 +1,38 @@
+import os
+
+from catalog import Catalog
+from tests.helpers import TestDirCase
+
+
+class TestCatalog(TestDirCase):
+    TEST_DIR = 'tests_catalog'
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.catalog = Catalog(self.TEST_DIR)
+
+    def test_empty(self):
+        self.assertEqual({}, self.catalog.tables())
+        self.assertIsNone(self.catalog.table("foobar"))
+
+    def test_write(self):
+        with self.catalog.write() as tables:
+            tables["foobar"] = Catalog.entry("csv", "uid", ["foo"])
+        entry = self.catalog.table("foobar")
+        self.assertEqual("uid", entry["primary_key"])
+        self.assertEqual(["foo"], entry["columns"])
+        self.assertEqual(0, entry["rows"])
+        self.assertEqual(entry, Catalog(self.TEST_DIR).table("foobar"))
+
+    def test_failed_write_is_not_saved(self):
+        with self.assertRaises(ValueError):
+            with self.catalog.write() as tables:
+                tables["foobar"] = Catalog.entry("csv", "uid", [])
+                raise ValueError()
+        self.assertIsNone(self.catalog.table("foobar"))
+
+    def test_file_changed_by_other_process(self):
+        self.assertEqual({}, self.catalog.tables())
+        with open(os.path.join(self.TEST_DIR, Catalog.FILENAME), "w") as f:
+            f.write('{"foobar": {"primary_key": "uid"}}')
+        self.assertEqual("uid", self.catalog.table("foobar")["primary_key"])
@@ -0,0 +1,44 @@
+import unittest
+
+from cursor import Cursor
+
+
+def batches(*sizes: int):
+    start = 0
+    for size in sizes:
+        yield [[i] for i in range(start, start + size)]
+        start += size
+
+
+class TestCursor(unittest.TestCase):
+
+    def test_fetchone(self):
+        cursor = Cursor(batches(2, 0, 1))
+        self.assertEqual([[0], [1], [2], None], [cursor.fetchone() for _ in range(4)])
+
+    def test_fetchmany_across_batches(self):
+        cursor = Cursor(batches(2, 3, 1), arraysize=4)
+        self.assertEqual([[0], [1], [2], [3]], cursor.fetchmany())
+        self.assertEqual([[4], [5]], cursor.fetchmany(5))
+        self.assertEqual([], cursor.fetchmany(5))
+
+    def test_iteration_and_fetchall(self):
+        cursor = Cursor(batches(3, 3))
+        self.assertEqual([0, 1], [next(cursor)[0], next(cursor)[0]])
+        self.assertEqual([[2], [3], [4], [5]], cursor.fetchall())
+        self.assertEqual([], list(cursor))
+
+    def test_batches_made_on_demand(self):
+        made = []
+
+        def tracked():
+            for batch in batches(2, 2, 2):
+                made.append(len(batch))
+                yield batch
+
+        cursor = Cursor(tracked())
+        cursor.fetchmany(3)
+        self.assertEqual(2, len(made))
+        cursor.close()
+        self.assertEqual(2, len(made))
+        self.assertIsNone(cursor.fetchone())
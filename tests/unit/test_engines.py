@@ -0,0 +1,247 @@
+import os
+import unittest
+
+import numpy as np
+
+from engines import ZONE_ROWS, ColumnarEngine, CsvEngine, EngineException, NullableColumn, accepts, zone_map
+from tests.helpers import TestDirCase, cases
+
+
+class TestEngines(TestDirCase):
+    TEST_DIR = 'tests_engines'
+
+    @cases([CsvEngine(), ColumnarEngine()])
+    def test_create_append_load(self, engine):
+        path = engine.path(self.TEST_DIR, "foobar")
+        engine.create(path, "uid", ["foo", "bar"])
+        self.assertTrue(engine.exists(path))
+        self.assertEqual(0, len(engine.load(path)))
+
+        engine.append(path, {"uid": [1, 2], "foo": ["a", "b"], "bar": [100, 200]})
+        engine.append(path, {"uid": [3], "foo": ["a"], "bar": [300]})
+        df = engine.load(path)
+
+        self.assertEqual("uid", df.index.name)
+        self.assertEqual(["foo", "bar"], df.columns.to_list())
+        self.assertEqual([1, 2, 3], df.index.to_list())
+        self.assertEqual([["a", 100], ["b", 200], ["a", 300]], df.values.tolist())
+
+        engine.remove(path)
+        self.assertFalse(engine.exists(path))
+
+    @cases([CsvEngine(), ColumnarEngine()])
+    def test_read_only_columns(self, engine):
+        path = engine.path(self.TEST_DIR, "foobar")
+        engine.create(path, "uid", ["foo", "bar", "buz"])
+        engine.append(path, {"uid": [1, 2], "foo": ["a", "b"], "bar": [100, 200], "buz": ["x", "y"]})
+
+        df = engine.load(path, ["buz", "foo"])
+        self.assertEqual(["foo", "buz"], df.columns.to_list())
+        self.assertEqual([["a", "x"], ["b", "y"]], df.values.tolist())
+        self.assertEqual([[], []], engine.load(path, []).values.tolist())
+        self.assertEqual([[200]], engine.read_rows(path, engine.keys(path, "uid", 0)[1][1:], ["bar"]).values.tolist())
+        self.assertEqual([["b"]], [chunk for chunk in engine.scan(path, 1, ["foo"])][1].values.tolist())
+
+        signature = engine.signature(path)
+        engine.append(path, {"uid": [3], "foo": ["c"], "bar": [300], "buz": ["z"]})
+        merged = engine.merge(path, df, signature, engine.signature(path))
+        self.assertEqual([["a", "x"], ["b", "y"], ["c", "z"]], merged.values.tolist())
+
+    @cases([CsvEngine(), ColumnarEngine()])
+    def test_declared_types(self, engine):
+        path = engine.path(self.TEST_DIR, "foobar")
+        types = {"uid": "int32", "foo": "str", "bar": "int16", "buz": "float32"}
+        engine.create(path, "uid", ["foo", "bar", "buz"], types)
+        engine.append(path, {"uid": [1, 2], "foo": ["a", None], "bar": [None, 7], "buz": [0.5, None]})
+        engine.append(path, {"uid": [3], "foo": ["b"], "bar": [8], "buz": [1.5]})
+
+        for df in [engine.load(path, types=types), engine.read_rows(path, engine.keys(path, "uid", 0)[1], types=types)]:
+            self.assertEqual(["category", "Int16", "float32"], [str(dtype) for dtype in df.dtypes])
+            self.assertEqual("Int32", str(df.index.dtype))
+            self.assertEqual([None, 7, 8], df["bar"].to_numpy(dtype=object, na_value=None).tolist())
+            self.assertEqual(["a", "b"], df["foo"].dropna().to_list())
+
+        df = engine.load(path, types=types)
+        signature = engine.signature(path)
+        engine.append(path, {"uid": [4], "foo": ["c"], "bar": [9], "buz": [2.5]})
+        merged = engine.merge(path, df, signature, engine.signature(path), types)
+        self.assertEqual("category", str(merged["foo"].dtype))
+        foo = merged["foo"].astype(object)
+        self.assertEqual(["a", None, "b", "c"], foo.where(foo.notna(), None).tolist())
+
+    @cases([
+        ("int8", 127, True),
+        ("int8", 128, False),
+        ("int8", -128, False),
+        ("int32", "1", False),
+        ("int32", 1.5, False),
+        ("int32", True, False),
+        ("float32", 1, True),
+        ("str", "1", True),
+        ("str", 1, False),
+        ("int64", None, True),
+    ])
+    def test_accepts(self, dtype, value, expected):
+        self.assertEqual(expected, accepts(dtype, value))
+
+    @cases([CsvEngine(), ColumnarEngine()])
+    def test_scan_chunks(self, engine):
+        path = engine.path(self.TEST_DIR, "foobar")
+        engine.create(path, "uid", ["foo"])
+        self.assertEqual([], [chunk for chunk in engine.scan(path, 2) if len(chunk)])
+
+        engine.append(path, {"uid": [1, 2, 3, 4, 5], "foo": ["a", "b", "c", "d", "e"]})
+        chunks = list(engine.scan(path, 2))
+        self.assertEqual([2, 2, 1], [len(chunk) for chunk in chunks])
+        self.assertEqual([3, 4], chunks[1].index.to_list())
+        self.assertEqual([["c"], ["d"]], chunks[1].values.tolist())
+
+    @cases([CsvEngine(), ColumnarEngine()])
+    def test_scan_skips_rows_appended_after_start(self, engine):
+        path = engine.path(self.TEST_DIR, "foobar")
+        engine.create(path, "uid", ["foo"])
+        engine.append(path, {"uid": [1, 2, 3], "foo": ["a", "b", "c"]})
+        chunks = engine.scan(path, 2)
+        first = next(chunks)
+        engine.append(path, {"uid": [4], "foo": ["d"]})
+        self.assertEqual([1, 2, 3], first.index.to_list() + [uid for chunk in chunks for uid in chunk.index])
+
+    @cases([CsvEngine(), ColumnarEngine()])
+    def test_merge_appended_rows(self, engine):
+        path = engine.path(self.TEST_DIR, "foobar")
+        engine.create(path, "uid", ["foo"])
+        engine.append(path, {"uid": [1], "foo": ["a"]})
+        df = engine.load(path)
+        signature = engine.signature(path)
+
+        engine.append(path, {"uid": [2], "foo": ["b"]})
+        self.assertNotEqual(signature, engine.signature(path))
+
+        merged = engine.merge(path, df, signature, engine.signature(path))
+        self.assertEqual([1, 2], merged.index.to_list())
+        self.assertEqual([["a"], ["b"]], merged.values.tolist())
+
+
+class TestColumnarEngine(TestDirCase):
+    TEST_DIR = 'tests_engines'
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.engine = ColumnarEngine()
+        self.path = self.engine.path(self.TEST_DIR, "foobar")
+        self.engine.create(self.path, "uid", ["foo", "bar"])
+
+    def test_types(self):
+        self.engine.append(self.path, {"uid": [1, 2], "foo": ["a", "b"], "bar": [100, 200]})
+        self.assertEqual({"uid": "int64", "foo": "str", "bar": "int64"}, self.engine.schema(self.path)["dtypes"])
+
+    def test_strings_dictionary_encoded(self):
+        self.engine.append(self.path, {"uid": [1, 2, 3], "foo": ["a", "b", "a"], "bar": [None, None, None]})
+        with open(os.path.join(self.path, "foo.dict")) as f:
+            self.assertEqual(['"a"\n', '"b"\n'], f.readlines())
+        self.assertEqual(3 * 4, os.path.getsize(os.path.join(self.path, "foo.bin")))
+
+    def test_missing_int_becomes_float(self):
+        self.engine.append(self.path, {"uid": [1], "foo": [None], "bar": [100]})
+        self.engine.append(self.path, {"uid": [2], "foo": ["b"], "bar": [None]})
+        self.engine.append(self.path, {"uid": [3], "foo": ["c"], "bar": [300]})
+        df = self.engine.load(self.path)
+
+        self.assertEqual("float64", self.engine.schema(self.path)["dtypes"]["bar"])
+        self.assertEqual([100.0, 300.0], df["bar"].dropna().to_list())
+        self.assertEqual(["b", "c"], df["foo"].dropna().to_list())
+
+    def test_retype_keeps_committed_file(self):
+        self.engine.append(self.path, {"uid": [1, 2], "foo": ["a", "b"], "bar": [100, 200]})
+        old = self.engine.schema(self.path)
+        mapped = self.engine.open(self.path)
+        self.engine.append(self.path, {"uid": [3], "foo": ["c"], "bar": [0.5]})
+
+        # readers of the old schema still see integers
+        self.assertEqual([100, 200], self.engine._read(self.path, old, 0)["bar"].to_list())
+        self.assertEqual([100, 200], mapped["bar"].tolist())
+        schema = self.engine.schema(self.path)
+        self.assertEqual({"bar": "bar.float64"}, schema["files"])
+        self.assertEqual([100.0, 200.0, 0.5], self.engine.load(self.path)["bar"].to_list())
+        mins, maxs = self.engine.zones(self.path)["bar"]
+        self.assertEqual(([0.5], [200.0]), (mins.tolist(), maxs.tolist()))
+
+    @cases([
+        {"uid": [1], "foo": [1], "bar": [1]},
+        {"uid": [1], "foo": ["a"], "bar": ["1"]},
+        {"uid": [1], "foo": ["a"], "bar": [[1]]},
+    ])
+    def test_type_mismatch(self, data):
+        self.engine.append(self.path, {"uid": [0], "foo": ["a"], "bar": [1]})
+        with self.assertRaises(EngineException):
+            self.engine.append(self.path, data)
+
+    def test_interrupted_append_is_ignored(self):
+        self.engine.append(self.path, {"uid": [1], "foo": ["a"], "bar": [100]})
+        with open(os.path.join(self.path, "bar.bin"), "ab") as f:
+            f.write(b"garbage")
+        self.assertEqual([["a", 100]], self.engine.load(self.path).values.tolist())
+
+        self.engine.append(self.path, {"uid": [2], "foo": ["b"], "bar": [200]})
+        self.assertEqual([["a", 100], ["b", 200]], self.engine.load(self.path).values.tolist())
+
+    def test_declared_int_column_is_nullable(self):
+        path = self.engine.path(self.TEST_DIR, "typed")
+        self.engine.create(path, "uid", ["foo"], {"foo": "int16"})
+        self.engine.append(path, {"uid": [1, 2, 3], "foo": [5, None, 7]})
+        self.assertEqual("int16", self.engine.schema(path)["dtypes"]["foo"])
+        self.assertEqual(3 * 2, os.path.getsize(os.path.join(path, "foo.bin")))
+
+        column = self.engine.open(path)["foo"]
+        self.assertIsInstance(column, NullableColumn)
+        self.assertEqual([False, False, True], (column == 7).tolist())
+        self.assertEqual([5, None, 7], column.values().to_numpy(dtype=object, na_value=None).tolist())
+
+    def test_zone_maps(self):
+        path = self.engine.path(self.TEST_DIR, "zones")
+        self.engine.create(path, "uid", ["foo", "bar", "buz"], {"bar": "int32"})
+        size = 3 * ZONE_ROWS + 10
+        for start in range(0, size, 1000):
+            uids = list(range(start, min(start + 1000, size)))
+            self.engine.append(path, {
+                "uid": uids,
+                "foo": ["a"] * len(uids),
+                "bar": [None if uid < ZONE_ROWS else uid for uid in uids],
+                "buz": [uid / 2 for uid in uids],
+            })
+        zones = self.engine.zones(path)
+
+        self.assertEqual(["uid", "bar", "buz"], list(zones))
+        self.assertEqual([0, ZONE_ROWS, 2 * ZONE_ROWS, 3 * ZONE_ROWS], zones["uid"][0].tolist())
+        self.assertEqual([ZONE_ROWS - 1, 2 * ZONE_ROWS - 1, 3 * ZONE_ROWS - 1, size - 1], zones["uid"][1].tolist())
+        self.assertGreater(zones["bar"][0][0], zones["bar"][1][0])
+        self.assertEqual([ZONE_ROWS, size - 1], [zones["bar"][0][1], zones["bar"][1][-1]])
+        self.assertEqual((size - 1) / 2, zones["buz"][1][-1])
+        self.assertEqual(["uid"], list(self.engine.zones(path, [])))
+        self.assertFalse(os.path.exists(os.path.join(path, "foo.zone")))
+
+    def test_zone_maps_rebuilt_on_retype(self):
+        self.engine.append(self.path, {"uid": [1], "foo": ["a"], "bar": [100]})
+        self.engine.append(self.path, {"uid": [2], "foo": ["b"], "bar": [None]})
+        self.engine.append(self.path, {"uid": [3], "foo": ["c"], "bar": [1.5]})
+        mins, maxs = self.engine.zones(self.path)["bar"]
+        self.assertEqual(([1.5], [100.0]), (mins.tolist(), maxs.tolist()))
+
+
+class TestZoneMap(unittest.TestCase):
+
+    def test_zone_map(self):
+        values = np.arange(2 * ZONE_ROWS + 1, dtype=np.int16) % 1000
+        mins, maxs = zone_map(values)
+        self.assertEqual(([0, 0, 192], [999, 999, 192]), (mins.tolist(), maxs.tolist()))
+        self.assertIsNone(zone_map(np.array(["a"], dtype=object)))
+        self.assertEqual(0, len(zone_map(np.array([], dtype=np.float64))[0]))
+
+    def test_zone_map_skips_missing_values(self):
+        mins, maxs = zone_map(np.array([np.nan, 2.0, 1.0]))
+        self.assertEqual(([1.0], [2.0]), (mins.tolist(), maxs.tolist()))
+        self.assertTrue(np.isnan(zone_map(np.array([np.nan]))[0][0]))
+
+        missing = np.iinfo(np.int32).min
+        mins, maxs = zone_map(np.array([missing, 5, 3], dtype=np.int32), missing)
+        self.assertEqual(([3], [5]), (mins.tolist(), maxs.tolist()))
@@ -0,0 +1,74 @@
+import os
+import unittest
+
+import numpy as np
+
+from index import HashIndex, MIN_CAPACITY, hash_keys, index_key
+from tests.helpers import TestDirCase, cases
+
+
+class TestIndexKey(unittest.TestCase):
+
+    @cases([
+        (1, "1"),
+        ("1", "1"),
+        (1.0, "1"),
+        (np.int64(1), "1"),
+        (np.float64(1.5), "1.5"),
+        ("foo", "foo"),
+    ])
+    def test_index_key(self, value, expected):
+        self.assertEqual(expected, index_key(value))
+
+    def test_hash_keys_stable(self):
+        self.assertEqual(hash_keys([1, "foo"]).tolist(), hash_keys(["1", "foo"]).tolist())
+        self.assertNotEqual(hash_keys(["foo"]).tolist(), hash_keys(["bar"]).tolist())
+
+
+class TestHashIndex(TestDirCase):
+    TEST_DIR = 'tests_index'
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.index = HashIndex(os.path.join(self.TEST_DIR, "foobar.pk"))
+
+    def lookup(self, keys: list) -> list:
+        found, offsets = self.index.lookup(hash_keys(keys))
+        return sorted(zip(found.tolist(), offsets.tolist()))
+
+    def test_create_lookup(self):
+        self.assertIsNone(self.index.header())
+        self.index.create(42, hash_keys([1, 2, 3]), np.array([10, 20, 30]), 40)
+
+        self.assertEqual(40, self.index.covers(42, 40))
+        self.assertEqual(40, self.index.covers(42, 100))
+        self.assertIsNone(self.index.covers(43, 40))
+        self.assertIsNone(self.index.covers(42, 30))
+
+        self.assertEqual([(0, 20), (2, 10)], self.lookup([2, 100500, 1]))
+
+    def test_add_and_grow(self):
+        self.index.create(1, hash_keys([]), np.array([], dtype=np.int64), 0)
+        keys = list(range(MIN_CAPACITY * 2))
+        for start in range(0, len(keys), 100):
+            chunk = keys[start:start + 100]
+            self.index.add(hash_keys(chunk), np.array(chunk) * 10, chunk[-1])
+
+        self.assertGreater(self.index.header()["capacity"], MIN_CAPACITY)
+        self.assertEqual(len(keys), self.index.header()["count"])
+        self.assertEqual(keys[-1], self.index.covers(1, keys[-1]))
+        found, offsets = self.index.lookup(hash_keys(keys))
+        self.assertEqual(keys, found.tolist())
+        self.assertEqual([key * 10 for key in keys], offsets.tolist())
+
+    def test_same_key_many_rows(self):
+        hashes = hash_keys(["a", "b", "a", "a"])
+        self.index.create(1, hashes, np.arange(4), 4)
+        self.assertEqual([(0, 0), (0, 2), (0, 3)], self.lookup(["a"]))
+
+    def test_colliding_hashes(self):
+        hashes = np.array([MIN_CAPACITY, 2 * MIN_CAPACITY, MIN_CAPACITY - 1], dtype=np.uint64)
+        self.index.create(1, hashes, np.arange(3), 3)
+        found, offsets = self.index.lookup(hashes)
+        self.assertEqual([0, 1, 2], found.tolist())
+        self.assertEqual([0, 1, 2], offsets.tolist())
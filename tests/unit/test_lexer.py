@@ -15,6 +15,10 @@ class TestLexer(unittest.TestCase):
         self.assertEqual(1, len(tokens))
         self.assertEqual(TokenType.EOF, tokens.pop().type)
 
+    def test_keyword_prefix_is_id(self):
+        tokens = list(Lexer("values_count android one"))
+        self.assertEqual([TokenType.ID, TokenType.ID, TokenType.ID, TokenType.EOF], [token.type for token in tokens])
+
     def test_unknown_symbol(self):
         text = "@foobar"
         lex = Lexer(text)
@@ -27,27 +31,44 @@ class TestLexer(unittest.TestCase):
         ('table', TokenType.TABLE),
         ('primary', TokenType.PRIMARY),
         ('key', TokenType.KEY),
+        ('index', TokenType.INDEX),
+        ('on', TokenType.ON),
         ('describe', TokenType.DESCRIBE),
+        ('explain', TokenType.EXPLAIN),
+        ('analyze', TokenType.ANALYZE),
         ('insert', TokenType.INSERT),
         ('into', TokenType.INTO),
         ('set', TokenType.SET),
+        ('values', TokenType.VALUES),
         ('select', TokenType.SELECT),
         ('from', TokenType.FROM),
         ('where', TokenType.WHERE),
         ('limit', TokenType.LIMIT),
         ('order', TokenType.ORDER),
         ('by', TokenType.BY),
+        ('group', TokenType.GROUP),
+        ('join', TokenType.JOIN),
         ('asc', TokenType.ASC),
         ('desc', TokenType.DESC),
         ('foobar', TokenType.ID),
         ('100500', TokenType.INT),
         ("'foo'", TokenType.STRING),
+        ('?', TokenType.PARAMETER),
+        (':foo_1', TokenType.PARAMETER),
         ('(', TokenType.LPAREN),
         (')', TokenType.RPAREN),
         (',', TokenType.COMMA),
+        ('.', TokenType.DOT),
         (';', TokenType.SEMICOLON),
         ('and', TokenType.AND),
+        ('or', TokenType.OR),
         ('=', TokenType.EQUALS),
+        ('!=', TokenType.NOT_EQUALS),
+        ('<>', TokenType.NOT_EQUALS),
+        ('<', TokenType.LESS),
+        ('<=', TokenType.LESS_EQUALS),
+        ('>', TokenType.GREATER),
+        ('>=', TokenType.GREATER_EQUALS),
         ('+', TokenType.PLUS),
         ('-', TokenType.MINUS),
         ('*', TokenType.MUL),
@@ -0,0 +1,130 @@
+import unittest
+
+import nodes
+import vm
+from lexer import Lexer
+from optimizer import OptimizerException, optimize
+from parser import Parser
+from tests.helpers import cases
+from tokens import TokenType
+
+
+def select(sql: str) -> nodes.SelectStatement:
+    return optimize(Parser(lex=Lexer(sql)).parse()).children[0]
+
+
+def describe(where: list) -> list:
+    lines = []
+    for item in where:
+        if isinstance(item, nodes.Or):
+            lines.append([describe(branch) for branch in item.branches])
+            continue
+        operation = "=" if isinstance(item, nodes.Assign) else item.operation.name
+        right = item.right.value if isinstance(item.right, nodes.String) else vm.compile_expression(item.right).source()
+        lines.append("%s %s %s" % (vm.compile_expression(item.left).source(), operation, right))
+    return lines
+
+
+class TestConstantFolding(unittest.TestCase):
+
+    @cases([
+        ("select 1+2*3;", "7"),
+        ("select (2+3) * (10-8) / 2;", "5"),
+        ("select 1 - 5;", "-4"),
+    ])
+    def test_expression(self, sql, expected):
+        node = select(sql)
+        self.assertIsInstance(node.result, nodes.Number)
+        self.assertEqual(expected, node.result.value)
+
+    def test_keeps_position(self):
+        # position of the first number, as the parser would report it
+        node = select("select   (2+3) * 4;")
+        self.assertEqual(11, node.result.token.pos)
+
+    def test_division_by_zero_is_left(self):
+        self.assertIsInstance(select("select 1 / (2 - 2);").result, nodes.BinaryOperation)
+
+    def test_columns(self):
+        node = select("select a * (2 + 3), a + 1 + 2 from foo where b > 10 * 10 order by a - (1 + 1) asc;")
+        self.assertEqual(["a * 5", "a + 1 + 2"], [vm.compile_expression(item).source() for item in node.result])
+        self.assertEqual(["b GREATER 100"], describe(node.where))
+        self.assertEqual("a - 2", vm.compile_expression(node.order.column).source())
+
+
+class TestConditions(unittest.TestCase):
+
+    @cases([
+        ("select a from foo where 1 = 1 and a = 2;", ["a = 2"]),
+        ("select a from foo where a = 2 and 1 < 2 and 1 + 1 = 2;", ["a = 2"]),
+        ("select a from foo where a = 2 and 1 > 2;", ["1 GREATER 2"]),
+        ("select a from foo where a = 2 or 1 = 1;", []),
+        ("select a from foo where (a = 2 or 1 = 0) and b = 3;", ["a = 2", "b = 3"]),
+        ("select a from foo where 1 = 0 or 2 = 0;", ["1 = 0"]),
+        ("select a from foo where a = 2 or b = 3;", [[["a = 2"], ["b = 3"]]]),
+        # literals of other types are compared by storage
+        ("select a from foo where 1 = '1';", ["1 = '1'"]),
+    ])
+    def test_tautologies(self, sql, expected):
+        self.assertEqual(expected, describe(select(sql).where))
+
+    @cases([
+        ("select a from foo where a = 1 and b = 'x' and a = 1;", ["b = 'x'", "a = 1"]),
+        ("select a from foo where a = 1 and a = 2 and a = 1;", ["a = 2", "a = 1"]),
+        ("select a from foo where a * 2 > 1 and a * 2 > 1 + 0;", ["a * 2 GREATER 1"]),
+        ("select a from foo where a > 1 and a >= 5 and a > 4 and a < 10 and a <= 9;",
+         ["a GREATER_EQUALS 5", "a LESS_EQUALS 9"]),
+        ("select a from foo where a >= 5 and a > 5 and a < 5 + 5 and a <= 10;", ["a GREATER 5", "a LESS 10"]),
+        ("select a from foo where a > 1 and b > 2 and a > 'x';", ["a GREATER 1", "b GREATER 2", "a GREATER 'x'"]),
+    ])
+    def test_repeats(self, sql, expected):
+        self.assertEqual(expected, describe(select(sql).where))
+
+
+class TestParameters(unittest.TestCase):
+
+    def test_bind(self):
+        statement = Parser(lex=Lexer("select a from foo where b > 1 + 2 limit 3;"), parameterize=True).parse()
+        values = [token for token in Lexer("10 20 5") if token.type != TokenType.EOF]
+        node = optimize(statement, values).children[0]
+        self.assertEqual(["b GREATER 30"], describe(node.where))
+        self.assertEqual("5", node.limit.value)
+        # the parsed statement is left as it was
+        self.assertIsInstance(statement.children[0].where[0].right.left, nodes.Parameter)
+
+    def test_missing_value(self):
+        statement = Parser(lex=Lexer("select a from foo where b > 1;"), parameterize=True).parse()
+        with self.assertRaises(OptimizerException):
+            optimize(statement)
+
+    def test_bind_placeholders(self):
+        statement = Parser(lex=Lexer("select a from foo where b > ? + 1 and c = ? limit ?;")).parse()
+        node = optimize(statement, parameters=[-5, "x", 3]).children[0]
+        self.assertEqual(["b GREATER -4", "c = 'x'"], describe(node.where))
+        self.assertEqual("3", node.limit.value)
+
+    def test_expressions_kept_between_runs(self):
+        statement = Parser(lex=Lexer("select a * 2 from foo where b + 1 > ?;")).parse()
+        first, second = [optimize(statement, parameters=[value]).children[0] for value in (1, 2)]
+        self.assertIs(first.result[0], second.result[0])
+        self.assertIs(first.where[0].left, second.where[0].left)
+        self.assertIs(vm.compiled(first.where[0].left), vm.compiled(second.where[0].left))
+
+    def test_bind_named(self):
+        statement = Parser(lex=Lexer("select a from foo where b = :b and c < :b + 1;")).parse()
+        self.assertEqual(["b = 2", "c LESS 3"], describe(optimize(statement, parameters={"b": 2}).children[0].where))
+
+    @cases([
+        ("select a from foo where b = ?;", None),
+        ("select a from foo where b = ?;", []),
+        ("select a from foo where b = :b;", [1]),
+        ("select a from foo where b = ?;", {"b": 1}),
+        ("select a from foo where b = ?;", [1.5]),
+        ("select a from foo where b = ?;", [True]),
+        ("select a from foo where b = ?;", ["it's"]),
+        ("select a from foo limit ?;", ["10"]),
+        ("select ? + 1;", ["1"]),
+    ])
+    def test_bind_invalid(self, sql, parameters):
+        with self.assertRaises(OptimizerException):
+            optimize(Parser(lex=Lexer(sql)).parse(), parameters=parameters)
@@ -2,8 +2,9 @@ import unittest
 
 import nodes
 from lexer import Lexer
-from parser import Parser
+from parser import Parser, ParserException
 from tests.helpers import cases
+from tokens import TokenType
 
 
 class TestParser(unittest.TestCase):
@@ -90,7 +91,8 @@ class TestCreate(unittest.TestCase):
 
     @cases([
         "create table foo (primary key foo);",
-        "create table foo (primary key foo, bar);"
+        "create table foo (primary key foo, bar);",
+        "create table foo (primary key foo int, bar text, buz);",
     ])
     def test_create_statement(self, sql):
         parser = Parser(lex=Lexer(sql))
@@ -105,6 +107,35 @@ class TestCreate(unittest.TestCase):
             with self.subTest(column=column):
                 self.assertIsInstance(column, nodes.Column)
 
+        self.assertEqual(len(node.columns) + 1, len(node.types))
+        for column_type in node.types:
+            with self.subTest(column_type=column_type):
+                self.assertIsInstance(column_type, (nodes.Type, nodes.Empty))
+
+
+class TestCreateIndex(unittest.TestCase):
+
+    def test_create_index_statement(self):
+        sql = "create index foo_bar on foo (bar);"
+        parser = Parser(lex=Lexer(sql))
+        statements = parser.parse()
+        node = statements.children[0]
+
+        self.assertIsInstance(node, nodes.CreateIndexStatement)
+        self.assertIsInstance(node.index, nodes.Index)
+        self.assertIsInstance(node.table, nodes.Table)
+        self.assertIsInstance(node.column, nodes.Column)
+
+    @cases([
+        "create index foo_bar on foo;",
+        "create index foo_bar on foo (bar, buz);",
+        "create index on foo (bar);",
+    ])
+    def test_create_index_statement_invalid(self, sql):
+        parser = Parser(lex=Lexer(sql))
+        with self.assertRaises(ParserException):
+            parser.parse()
+
 
 class TestDescribe(unittest.TestCase):
 
@@ -134,6 +165,38 @@ class TestInsert(unittest.TestCase):
                 self.assertIsInstance(assignee, nodes.Assign)
 
 
+class TestInsertValues(unittest.TestCase):
+
+    @cases([
+        ("insert into foo (a) values (1);", 1, 1),
+        ("insert into foo (a, b, c) values (1, 2, '3');", 3, 1),
+        ("insert into foo (a, b) values (1, 2), (3, 4), (5, '6');", 2, 3),
+    ])
+    def test_insert_values_statement(self, sql, columns, rows):
+        parser = Parser(lex=Lexer(sql))
+        statements = parser.parse()
+        node = statements.children[0]
+
+        self.assertIsInstance(node, nodes.InsertValuesStatement)
+        self.assertIsInstance(node.table, nodes.Table)
+        self.assertEqual(columns, len(node.columns))
+        self.assertEqual(rows, len(node.rows))
+        for values in node.rows:
+            with self.subTest(values=values):
+                self.assertEqual(columns, len(values))
+
+    @cases([
+        "insert into foo (a, b) values (1);",
+        "insert into foo (a, b) values (1, 2), (1, 2, 3);",
+        "insert into foo (a, b) values;",
+        "insert into foo () values (1);",
+    ])
+    def test_insert_values_statement_invalid(self, sql):
+        parser = Parser(lex=Lexer(sql))
+        with self.assertRaises(ParserException):
+            parser.parse()
+
+
 class TestSelect(unittest.TestCase):
 
     @cases([
@@ -184,3 +247,218 @@ class TestSelect(unittest.TestCase):
 
         self.assertTrue(isinstance(node.order, (nodes.Empty, nodes.Order)))
         self.assertTrue(isinstance(node.limit, (nodes.Empty, nodes.Number)))
+
+
+class TestWhere(unittest.TestCase):
+
+    def where(self, sql: str) -> list:
+        return Parser(lex=Lexer(sql)).parse().children[0].where
+
+    @cases([
+        ("select a from foo where a!=1;", TokenType.NOT_EQUALS),
+        ("select a from foo where a<>'a';", TokenType.NOT_EQUALS),
+        ("select a from foo where a<1;", TokenType.LESS),
+        ("select a from foo where a<=1;", TokenType.LESS_EQUALS),
+        ("select a from foo where a>1;", TokenType.GREATER),
+        ("select a from foo where a>=1;", TokenType.GREATER_EQUALS),
+    ])
+    def test_comparison(self, sql, operation):
+        where = self.where(sql)
+        self.assertEqual(1, len(where))
+        self.assertIsInstance(where[0], nodes.Comparison)
+        self.assertEqual("a", where[0].left.name)
+        self.assertEqual(operation, where[0].operation)
+
+    def test_or(self):
+        where = self.where("select a from foo where a=1 and b>2 or c<3;")
+        self.assertEqual(1, len(where))
+        self.assertIsInstance(where[0], nodes.Or)
+        self.assertEqual([2, 1], [len(branch) for branch in where[0].branches])
+        self.assertIsInstance(where[0].branches[0][0], nodes.Assign)
+
+    def test_parentheses(self):
+        where = self.where("select a from foo where (a=1 or a=2) and (b>2 and c<3) order by a asc;")
+        self.assertEqual([nodes.Or, nodes.Comparison, nodes.Comparison], [type(node) for node in where])
+
+    def test_parenthesized_expressions(self):
+        where = self.where("select a from foo where (a + 1) * 2 > b and ((a=1 or b=2)) and (a) = b - 1;")
+        self.assertEqual([nodes.Comparison, nodes.Or, nodes.Assign], [type(node) for node in where])
+        self.assertEqual(TokenType.MUL, where[0].left.operation)
+        self.assertIsInstance(where[0].right, nodes.Column)
+        self.assertIsInstance(where[2].left, nodes.Column)
+        self.assertEqual(TokenType.MINUS, where[2].right.operation)
+
+    def test_parenthesized_expressions_parameterized(self):
+        # literals read while a parenthesis is tried as an expression are numbered once
+        sql = "select a from foo where (a = 1 or b = 2) and (c + 3) * 4 > 5;"
+        parser = Parser(lex=Lexer(sql), parameterize=True)
+        parser.parse()
+        self.assertEqual(5, parser.parameters)
+
+    @cases([
+        "select a from foo where a 1;",
+        "select a from foo where a=1 or;",
+        "select a from foo where (a=1;",
+        "select a from foo where (a + 1) * 2;",
+        "select a from foo where a=<1;",
+    ])
+    def test_where_invalid(self, sql):
+        with self.assertRaises(ParserException):
+            self.where(sql)
+
+
+class TestExpressions(unittest.TestCase):
+
+    def select(self, sql: str) -> nodes.SelectStatement:
+        return Parser(lex=Lexer(sql)).parse().children[0]
+
+    def test_select_items(self):
+        node = self.select("select a, a * 2 + foo.b, (1 + a) / 2, 3, count(*) from foo order by a - b desc;")
+        self.assertEqual([nodes.Column, nodes.BinaryOperation, nodes.BinaryOperation, nodes.Number, nodes.Aggregate],
+                         [type(item) for item in node.result])
+        self.assertEqual(TokenType.PLUS, node.result[1].operation)
+        self.assertEqual("foo", node.result[1].right.table.name)
+        self.assertIsInstance(node.order.column, nodes.BinaryOperation)
+
+    def test_select_literal_with_columns(self):
+        node = self.select("select a + 1;")
+        self.assertIsInstance(node.table, nodes.Empty)
+        self.assertIsInstance(node.result, nodes.BinaryOperation)
+
+    def test_where(self):
+        where = self.select("select a from foo where a * 2 > 1000 / 3 and b - 1 = 'x';").where
+        self.assertEqual([nodes.Comparison, nodes.Assign], [type(node) for node in where])
+        self.assertIsInstance(where[0].left, nodes.BinaryOperation)
+        self.assertIsInstance(where[0].right, nodes.BinaryOperation)
+        self.assertIsInstance(where[1].right, nodes.String)
+
+    @cases([
+        "select a;",
+        "select a + 1, 2;",
+        "select a + from foo;",
+        "select a from foo where a + > 1;",
+        "select a from foo where a * 2;",
+    ])
+    def test_expressions_invalid(self, sql):
+        with self.assertRaises(ParserException):
+            self.select(sql)
+
+
+class TestPlaceholders(unittest.TestCase):
+
+    def test_placeholders(self):
+        node = Parser(lex=Lexer("select a + ? from foo where b = :b and c > ? limit :size;")).parse().children[0]
+        parameters = [node.result[0].right, node.where[0].right, node.where[1].right, node.limit]
+        self.assertEqual([nodes.Parameter] * 4, [type(parameter) for parameter in parameters])
+        self.assertEqual([(0, None), (None, "b"), (1, None), (None, "size")],
+                         [(parameter.index, parameter.name) for parameter in parameters])
+
+    def test_insert_values(self):
+        node = Parser(lex=Lexer("insert into foo (a, b) values (?, :b), (1, 'x');")).parse().children[0]
+        self.assertEqual([nodes.Parameter, nodes.Parameter, nodes.Number, nodes.String],
+                         [type(value) for row in node.rows for value in row])
+
+    def test_literals_parameterized_apart(self):
+        # literals are numbered apart from the placeholders
+        node = Parser(lex=Lexer("select a from foo where b = ? and c = 5;"), parameterize=True).parse().children[0]
+        self.assertEqual([TokenType.PARAMETER, TokenType.INT], [item.right.token.type for item in node.where])
+        self.assertEqual([0, 0], [item.right.index for item in node.where])
+
+    @cases([
+        "select a from ?;",
+        "select a from foo where b = ? ?;",
+        "select a from foo where b = ?1;",
+    ])
+    def test_placeholders_invalid(self, sql):
+        with self.assertRaises(ParserException):
+            Parser(lex=Lexer(sql)).parse()
+
+
+class TestAggregate(unittest.TestCase):
+
+    def test_aggregates(self):
+        sql = "select foo, count(*), SUM(bar) from foobar where bar>1 group by foo, buz order by count(*) desc limit 3;"
+        node = Parser(lex=Lexer(sql)).parse().children[0]
+
+        self.assertIsInstance(node.result[0], nodes.Column)
+        self.assertEqual(["count", "sum"], [item.function for item in node.result[1:]])
+        self.assertIsInstance(node.result[1].column, nodes.Empty)
+        self.assertEqual("bar", node.result[2].column.name)
+        self.assertEqual(["foo", "buz"], [column.name for column in node.group])
+        self.assertIsInstance(node.order.column, nodes.Aggregate)
+        self.assertIsInstance(node.limit, nodes.Number)
+
+    def test_no_group(self):
+        node = Parser(lex=Lexer("select foo from foobar;")).parse().children[0]
+        self.assertEqual([], node.group)
+
+    @cases([
+        "select count( from foobar;",
+        "select count(*, foo) from foobar;",
+        "select foo from foobar group foo;",
+        "select foo from foobar group by;",
+        "select foo from foobar order by foo asc group by foo;",
+    ])
+    def test_aggregate_invalid(self, sql):
+        with self.assertRaises(ParserException):
+            Parser(lex=Lexer(sql)).parse()
+
+
+class TestJoin(unittest.TestCase):
+
+    def test_join(self):
+        sql = "select foo.a, b, count(*) from foo join bar on foo.uid = bar.foo_id " \
+              "where bar.c>1 group by foo.a, b order by max(bar.c) desc;"
+        node = Parser(lex=Lexer(sql)).parse().children[0]
+
+        self.assertEqual("foo", node.table.name)
+        self.assertIsInstance(node.join, nodes.Join)
+        self.assertEqual("bar", node.join.table.name)
+        self.assertEqual(("foo", "uid"), (node.join.left.table.name, node.join.left.name))
+        self.assertEqual(("bar", "foo_id"), (node.join.right.table.name, node.join.right.name))
+        self.assertEqual(["foo", None], [column.table and column.table.name for column in node.result[:2]])
+        self.assertEqual("bar", node.where[0].left.table.name)
+        self.assertEqual(["foo", None], [column.table and column.table.name for column in node.group])
+        self.assertEqual("bar", node.order.column.column.table.name)
+
+    def test_no_join(self):
+        node = Parser(lex=Lexer("select foo from foobar;")).parse().children[0]
+        self.assertIsNone(node.join)
+        self.assertIsNone(node.result[0].table)
+
+    @cases([
+        "select a from foo join bar;",
+        "select a from foo join bar on a;",
+        "select a from foo join bar on a > b;",
+        "select a from foo join on a = b;",
+        "select foo. from foo;",
+    ])
+    def test_join_invalid(self, sql):
+        with self.assertRaises(ParserException):
+            Parser(lex=Lexer(sql)).parse()
+
+
+class TestExplain(unittest.TestCase):
+
+    @cases([
+        ("explain select foo from foobar;", False, 6),
+        ("explain analyze select foo from foobar where foo=1;", True, 11),
+    ])
+    def test_explain(self, sql, analyze, tokens):
+        node = Parser(lex=Lexer(sql)).parse().children[0]
+        self.assertIsInstance(node, nodes.ExplainStatement)
+        self.assertIsInstance(node.statement, nodes.SelectStatement)
+        self.assertEqual(analyze, node.analyze)
+        # tokens lexed after explain, up to the end of the text
+        self.assertEqual(tokens, node.tokens)
+        self.assertGreater(node.lexing, 0)
+        self.assertGreater(node.parsing, 0)
+
+    @cases([
+        "explain;",
+        "explain analyze;",
+        "explain describe foobar;",
+    ])
+    def test_explain_invalid(self, sql):
+        with self.assertRaises(ParserException):
+            Parser(lex=Lexer(sql)).parse()
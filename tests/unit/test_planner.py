@@ -0,0 +1,87 @@
+from planner import Planner
+from storage import Storage, TableCache
+from tests.helpers import TestDirCase, cases
+
+
+class TestPlanner(TestDirCase):
+    TEST_DIR = 'tests_planner'
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.cache = TableCache()
+        self.storage = Storage(self.TEST_DIR, cache=self.cache, chunk_rows=100)
+        self.storage.create("foobar", "uid", ["foo", "bar"])
+        self.storage.insert_many("foobar", [[("uid", i), ("foo", "v%d" % (i % 2)), ("bar", i % 500)]
+                                            for i in range(1, 2001)])
+        self.storage.create_index("foobar", "foobar_foo", "foo")
+        self.storage.create_index("foobar", "foobar_bar", "bar")
+        self.storage.create("buz", "id", ["foobar_id", "baz"])
+        self.storage.insert_many("buz", [[("id", i), ("foobar_id", i * 7 % 2000 + 1), ("baz", i % 3)]
+                                         for i in range(1, 51)])
+        self.planner = Planner(self.storage)
+
+    def explain(self, *query) -> list:
+        return self.planner.select("foobar", *query).explain()
+
+    @cases([
+        ((["uid"], [("uid", 3), ("bar", 3)]),
+         ["Project uid", "  Filter uid = 3 and bar = 3", "    IndexScan foobar by primary key"]),
+        # index of foo is estimated to find half of the rows, bar is looked up by its index only
+        ((["uid"], [("foo", "v1"), ("bar", 3)]),
+         ["Project uid", "  Filter foo = 'v1' and bar = 3", "    IndexScan foobar by index foobar_bar"]),
+        ((["uid"], [("foo", "v1")]),
+         ["Project uid", "  Filter foo = 'v1'", "    Scan foobar"]),
+        ((["uid"], [("bar", ">", 3)], ("bar", False), 3),
+         ["Project uid", "  TopK 3 by bar desc", "    Filter bar > 3", "      Scan foobar"]),
+        ((["uid"], [], ("bar", True)),
+         ["Project uid", "  Sort by bar asc", "    Scan foobar"]),
+        ((["uid"], [], None, 3),
+         ["Project uid", "  Limit 3", "    ChunkedScan foobar (100 rows per chunk)"]),
+        ((["foo", ("max", "bar")], [], None, None, ["foo"]),
+         ["Aggregate foo, max(bar) group by foo", "  Scan foobar"]),
+        (([("count", None)], []),
+         ["RowCount foobar", "  Aggregate count(*)", "    Scan foobar"]),
+    ])
+    def test_select_plan(self, query, expected):
+        self.assertEqual(expected, self.explain(*query))
+
+    def test_plans_give_select_results(self):
+        for query in [(["uid"], [("foo", "v1"), ("bar", 3)]), (["uid", "bar"], [], ("bar", False), 3),
+                      (["uid"], [("bar", ">", 490)], None, 5), ([("count", None), ("sum", "bar")], [("foo", "v0")])]:
+            expected = self.storage.load("foobar").select(*query)
+            self.assertEqual(expected, self.planner.select("foobar", *query).rows())
+
+    def test_analyze(self):
+        plan = self.planner.select("foobar", ["uid"], [("bar", ">", 490)], ("bar", False), 5)
+        lines = plan.analyze()
+        self.assertEqual(plan.explain(), [line[0] for line in lines])
+        self.assertEqual([[None, 2000], [2000, 36], [36, 5], [5, 5]],
+                         [line[2:4] for line in reversed(lines)])
+        self.assertTrue(all(line[1] >= 0 for line in lines))
+        self.assertGreater(lines[-1][4], 0)
+        self.assertEqual([0, 0, 0], [line[4] for line in lines[:-1]])
+        self.assertIsNone(plan.stats)
+
+    def test_limit_stops_chunked_scan(self):
+        with open(self.storage.path("foobar"), "a") as f:
+            f.write("2001,broken,row,with,extra,values\n")
+        self.assertEqual([[1], [2]], self.planner.select("foobar", ["uid"], [], None, 2).rows())
+        self.assertEqual(0, self.cache.stats()["entries"])
+
+    def test_join_plan(self):
+        plan = self.planner.join("buz", "foobar", ("foobar_id", "uid"), ["id", "foo"], [("id", 8)])
+        self.assertEqual(["Project buz.id, foobar.foo",
+                          "  IndexJoin foobar by primary key on buz.foobar_id = foobar.uid",
+                          "    Filter id = 8",
+                          "      IndexScan buz by primary key"], plan.explain())
+        self.assertEqual([[8, "v1"]], plan.rows())
+
+        plan = self.planner.join("buz", "foobar", ("foobar_id", "uid"), ["id"], [("baz", 1), ("bar", ">", 100)])
+        self.assertEqual(["Project buz.id",
+                          "  HashJoin on buz.foobar_id = foobar.uid",
+                          "    Filter baz = 1",
+                          "      Scan buz",
+                          "    Filter bar > 100",
+                          "      Scan foobar"], plan.explain())
+        self.assertEqual(self.storage.join("buz", "foobar", ("foobar_id", "uid"), ["id"],
+                                           [("baz", 1), ("bar", ">", 100)]), plan.rows())
@@ -0,0 +1,121 @@
+import unittest
+
+import nodes
+from interpreter import Interpreter
+from lexer import Lexer
+from parser import Parser, ParserException
+from optimizer import OptimizerException
+from statements import PreparedStatement, StatementCache, normalize
+from tests.helpers import TestDirCase, cases
+
+
+class TestNormalize(unittest.TestCase):
+
+    @cases([
+        ("select a from foo where b = 1;", "select  a\nfrom foo where b=  2 ;", True),
+        ("select a from foo where b = 'x';", "select a from foo where b = 'y';", True),
+        ("select a from foo where b = 1;", "select a from foo where b = '1';", False),
+        ("select a from foo;", "select A from foo;", False),
+        ("select a from foo limit 1;", "select a from foo limit 10;", True),
+        ("select a from foo where b = :b;", "select a from foo where b = :c;", False),
+    ])
+    def test_key(self, first, second, same):
+        self.assertEqual(same, normalize(list(Lexer(first)))[0] == normalize(list(Lexer(second)))[0])
+
+    def test_values(self):
+        _, values = normalize(list(Lexer("select a + 1 from foo where b = 'x' limit 5;")))
+        self.assertEqual(["1", "'x'", "5"], [token.value for token in values])
+
+
+class TestStatementCache(TestDirCase):
+    TEST_DIR = 'tests_statements'
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.cache = StatementCache()
+        self.run_sql("create table foo (primary key uid, a);"
+                     "insert into foo (uid, a) values (1, 'x'), (2, 'y'), (3, 'z');")
+
+    def run_sql(self, sql: str) -> list:
+        return Interpreter(self.cache.parse(sql), self.TEST_DIR, optimized=True).do()
+
+    def test_parameters(self):
+        tree = Parser(Lexer("select a from foo where uid > 1 + 1 limit 2;"), parameterize=True).parse()
+        select = tree.children[0]
+        self.assertIsInstance(select.limit, nodes.Parameter)
+        self.assertEqual([0, 1], [select.where[0].right.left.index, select.where[0].right.right.index])
+
+    def test_hits(self):
+        self.cache = StatementCache()
+        self.assertEqual([[["y"]]], self.run_sql("select a from foo where uid = 2;"))
+        self.assertEqual([[["y"]]], self.run_sql("select a from foo where uid = 2;"))
+        self.assertEqual([[["z"]]], self.run_sql("select a from foo   where uid = 3;"))
+        self.assertEqual([[["x"], ["y"]]], self.run_sql("select a from foo where a < 'z';"))
+        stats = self.cache.stats()
+        self.assertEqual((2, 2, 1), (stats["hits"], stats["misses"], stats["text_hits"]))
+        self.assertEqual(0.5, stats["hit_rate"])
+
+    def test_statement_not_changed_by_values(self):
+        sql = "select uid from foo where uid > 1 and %d = %d order by uid desc limit %d;"
+        self.assertEqual([[[3]]], self.run_sql(sql % (1, 1, 1)))
+        self.assertEqual([[]], self.run_sql(sql % (1, 2, 1)))
+        self.assertEqual([[[3], [2]]], self.run_sql(sql % (2, 2, 5)))
+
+    def test_evicts_least_recently_used(self):
+        self.cache = StatementCache(max_entries=2)
+        for sql in ["select a from foo;", "select uid from foo;", "select uid, a from foo;", "select a from foo;"]:
+            self.run_sql(sql)
+        stats = self.cache.stats()
+        self.assertEqual((2, 2, 0), (stats["entries"], stats["texts"], stats["hits"]))
+
+    def test_explain_not_cached(self):
+        self.cache.clear()
+        self.run_sql("explain analyze select a from foo;")
+        self.assertEqual(0, self.cache.stats()["entries"])
+
+    def test_errors_not_cached(self):
+        with self.assertRaises(ParserException):
+            self.cache.parse("select from foo;")
+        self.assertNotIn("select from foo;", self.cache._texts)
+
+
+class TestPreparedStatement(TestDirCase):
+    TEST_DIR = 'tests_prepared'
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.statements = StatementCache()
+        self.prepare("create table foo (primary key uid int, a text);").execute()
+
+    def prepare(self, sql: str) -> PreparedStatement:
+        return PreparedStatement(sql, self.TEST_DIR, statements=self.statements)
+
+    def test_execute(self):
+        insert = self.prepare("insert into foo (uid, a) values (?, ?);")
+        for uid, a in [(1, "x"), (2, "y"), (3, "z")]:
+            insert.execute([uid, a])
+        select = self.prepare("select a, uid * 10 from foo where uid = :uid;")
+        self.assertEqual([[["y", 20]]], select.execute({"uid": 2}))
+        self.assertEqual([[["z", 30]]], select.execute({"uid": 3}))
+        self.assertEqual([[]], select.execute({"uid": 4}))
+        self.assertEqual([[["x"], ["y"]]], self.prepare("select a from foo where a != ? order by uid asc limit ?;")
+                         .execute(["z", 5]))
+
+    def test_literals_and_placeholders(self):
+        self.prepare("insert into foo (uid, a) values (1, 'x'), (2, 'y');").execute()
+        select = self.prepare("select uid from foo where a = ? and uid > 1;")
+        self.assertEqual([[[2]]], select.execute(["y"]))
+        self.assertEqual([[]], select.execute(["x"]))
+        # texts of the same shape share the parsed statement
+        self.prepare("select uid from foo where a = ? and uid > 5;")
+        self.assertEqual(1, self.statements.stats()["hits"])
+
+    def test_strings_are_not_columns(self):
+        with self.assertRaises(Exception):
+            self.prepare("select a from foo where ? = 1;").execute(["uid"])
+
+    def test_not_parsed_with_values(self):
+        with self.assertRaises(OptimizerException):
+            self.statements.parse("select a from foo where uid = ?;")
+        with self.assertRaises(OptimizerException):
+            self.prepare("select a from foo where uid = ?;").execute()
@@ -1,22 +1,30 @@
 import os
 import unittest
 
-from storage import Storage, StorageException, TableNotExists, TableColumnNotExists
+import numpy as np
 
+from engines import ZONE_ROWS
+from lexer import Lexer
+from parser import Parser
+from storage import (Expression, Or, ResultCache, Storage, StorageException, TableCache, TableNotExists,
+                     TableColumnNotExists, rows_size)
+from tests.helpers import TestDirCase, cases
+from vm import compile_expression
 
-class TestStorage(unittest.TestCase):
+TYPES = {"uid": "int", "foo": "text", "bar": "int32"}
+
+
+def expression(text: str) -> Expression:
+    return Expression(compile_expression(Parser(lex=Lexer(text)).expr()))
+
+
+class TestStorage(TestDirCase):
     TEST_DIR = 'tests_storage'
 
     def setUp(self) -> None:
-        if not os.path.exists(self.TEST_DIR):
-            os.mkdir(self.TEST_DIR)
+        super().setUp()
         self.storage = Storage(self.TEST_DIR)
 
-    def tearDown(self) -> None:
-        for filename in os.listdir(self.TEST_DIR):
-            os.remove(os.path.join(self.TEST_DIR, filename))
-        os.rmdir(self.TEST_DIR)
-
     def test_init_raise_exception_on_invalid_dir(self):
         with self.assertRaises(StorageException):
             Storage("foobar")
@@ -31,6 +39,28 @@ class TestStorage(unittest.TestCase):
         created = self.storage.create("foobar", "uid", [])
         self.assertEqual(False, created)
 
+    def test_describe_does_not_read_table(self):
+        self.storage.create("foobar", "uid", ["foo", "bar"])
+        os.remove(self.storage.path("foobar"))
+        self.assertTrue(self.storage.exists("foobar"))
+        self.assertEqual(["uid", "foo", "bar"], self.storage.describe("foobar"))
+
+    def test_catalog_counts_rows_and_versions(self):
+        self.storage.create("foobar", "uid", ["foo"])
+        self.storage.insert_many("foobar", [[("uid", 1)], [("uid", 2)]])
+        self.storage.insert("foobar", [("uid", 3)])
+        entry = self.storage.catalog.table("foobar")
+        self.assertEqual(3, entry["rows"])
+        self.assertEqual(3, entry["version"])
+        self.assertEqual("csv", entry["engine"])
+
+    def test_table_without_catalog_entry(self):
+        with open(os.path.join(self.TEST_DIR, "foobar.csv"), "w") as f:
+            f.write("uid,foo\n1,a\n")
+        self.assertEqual(["uid", "foo"], self.storage.describe("foobar"))
+        self.assertIsNone(self.storage.catalog.table("foobar")["rows"])
+        self.assertEqual([["a"]], self.storage.select("foobar", ["foo"], [("uid", 1)]))
+
     def test_describe_raise_exception_on_invalid_table(self):
         with self.assertRaises(TableNotExists):
             self.storage.describe("foobar")
@@ -78,3 +108,645 @@ class TestStorage(unittest.TestCase):
         self.storage.create("foobar", "uid", ["foo", "bar"])
         with self.assertRaises(TableColumnNotExists):
             self.storage.select("foobar", ["uid"], [], ("a", True))
+
+
+class TestStorageTypes(TestDirCase):
+    TEST_DIR = 'tests_storage'
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.storage = Storage(self.TEST_DIR, cache=TableCache())
+
+    @cases(["csv", "columnar"])
+    def test_typed_columns(self, engine):
+        name = "foobar_%s" % engine
+        self.storage.create(name, "uid", ["foo", "bar"], engine, {"uid": "int", "foo": "text", "bar": "int32"})
+        self.assertEqual({"uid": "int64", "foo": "str", "bar": "int32"}, self.storage.types(name))
+        self.storage.insert_many(name, [
+            [("uid", 1), ("foo", "a"), ("bar", 100)],
+            [("uid", 2), ("foo", "b")],
+        ])
+        self.assertEqual([[1, "a", 100], [2, "b", None]], self.storage.select(name, ["uid", "foo", "bar"], []))
+        self.assertEqual([[2, None]], self.storage.select(name, ["uid", "bar"], [("uid", 2)]))
+        self.assertEqual([[1]], self.storage.select(name, ["uid"], [("bar", 100)]))
+
+    @cases(["csv", "columnar"])
+    def test_missing_values_are_none(self, engine):
+        name = "foobar_%s" % engine
+        self.storage.create(name, "uid", ["foo", "bar"], engine, {"uid": "int", "foo": "text", "bar": "int32"})
+        self.storage.insert_many(name, [[("uid", 1), ("foo", "a"), ("bar", 5)], [("uid", 2)]])
+        expected = [[1, "a", 5], [2, None, None]]
+        self.assertEqual(expected, self.storage.select(name, ["uid", "foo", "bar"], []))
+        self.assertEqual(expected[1:], self.storage.select(name, ["uid", "foo", "bar"], [("uid", 2)]))
+        self.assertEqual([[None], ["a"]], self.storage.select(name, ["foo"], [], ("uid", False)))
+
+    @cases([
+        [("uid", 1), ("bar", "100")],
+        [("uid", 1), ("bar", 2 ** 31)],
+        [("uid", 1), ("foo", 1)],
+        [("uid", "1")],
+    ])
+    def test_insert_raise_exception_on_type_mismatch(self, row):
+        self.storage.create("foobar", "uid", ["foo", "bar"], types={"uid": "int", "foo": "text", "bar": "int32"})
+        with self.assertRaises(StorageException):
+            self.storage.insert("foobar", row)
+
+    def test_create_raise_exception_on_unknown_type(self):
+        with self.assertRaises(StorageException):
+            self.storage.create("foobar", "uid", ["foo"], types={"foo": "varchar"})
+        with self.assertRaises(TableColumnNotExists):
+            self.storage.create("foobar", "uid", ["foo"], types={"bar": "int"})
+        self.assertFalse(self.storage.exists("foobar"))
+
+    def test_typed_columns_are_compact(self):
+        self.storage.create("foobar", "uid", ["foo", "bar"], types={"foo": "text", "bar": "int8"})
+        self.storage.insert_many("foobar", [[("uid", i + 1), ("foo", "v%d" % (i % 3)), ("bar", i % 100)]
+                                            for i in range(1000)])
+        df = self.storage.load("foobar").df
+        self.assertEqual("category", str(df["foo"].dtype))
+        self.assertEqual("Int8", str(df["bar"].dtype))
+
+    def test_untyped_rows_read_as_loaded(self):
+        self.storage.create("foobar", "uid", ["foo"])
+        self.storage.insert_many("foobar", [[("uid", "007"), ("foo", "5")]])
+        self.storage.insert_many("foobar", [[("uid", "abc"), ("foo", "6")], [("uid", "x"), ("foo", "abc")]])
+        cold = Storage(self.TEST_DIR, cache=TableCache())
+        warm = Storage(self.TEST_DIR, cache=TableCache())
+        warm.load("foobar")
+        for storage in (cold, warm):
+            self.assertEqual([["007", "5"]], storage.select("foobar", ["uid", "foo"], [("uid", "=", "007")]))
+        cold.insert("foobar", [("uid", "7"), ("foo", "7")])
+        with self.assertRaises(StorageException):
+            cold.insert("foobar", [("uid", "007")])
+
+    def test_untyped_rows_found_by_index_read_as_loaded(self):
+        self.storage.create("foobar", "uid", ["foo"])
+        self.storage.insert_many("foobar", [[("uid", "007"), ("foo", "5")], [("uid", "abc"), ("foo", "abc")]])
+        self.storage.create_index("foobar", "foo_idx", "foo")
+        cold = Storage(self.TEST_DIR, cache=TableCache())
+        warm = Storage(self.TEST_DIR, cache=TableCache())
+        warm.load("foobar")
+        for storage in (cold, warm):
+            self.assertEqual([["007"]], storage.select("foobar", ["uid"], [("foo", "=", "5")]))
+
+    def test_untyped_chunks_read_as_loaded(self):
+        self.storage.create("foobar", "uid", ["foo"])
+        self.storage.insert_many("foobar", [[("uid", i + 1), ("foo", foo)] for i, foo in enumerate("56a5")])
+        chunked = Storage(self.TEST_DIR, cache=TableCache(max_bytes=1), chunk_rows=2)
+        warm = Storage(self.TEST_DIR, cache=TableCache())
+        warm.load("foobar")
+        for storage in (chunked, warm):
+            self.assertEqual([[1], [4]], storage.select("foobar", ["uid"], [("foo", "=", "5")], limit=10))
+
+
+class TestStorageRanges(TestDirCase):
+    TEST_DIR = 'tests_storage'
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.storage = Storage(self.TEST_DIR, cache=TableCache())
+
+    @cases(["csv", "columnar"])
+    def test_select_ranges(self, engine):
+        name = "foobar_%s" % engine
+        self.storage.create(name, "uid", ["ts", "foo"], engine, {"uid": "int", "ts": "int64", "foo": "text"})
+        size = 3 * ZONE_ROWS
+        self.storage.insert_many(name, [[("uid", i + 1), ("ts", i * 10), ("foo", "v%d" % (i % 3))]
+                                        for i in range(size)])
+
+        where = [("ts", ">=", 100), ("ts", "<", 140)]
+        self.assertEqual([[11], [12], [13], [14]], self.storage.select(name, ["uid"], where))
+        where = [("ts", ">", 10 * (size - 3)), ("foo", "!=", "v0")]
+        self.assertEqual([[size - 1, "v1"], [size, "v2"]], self.storage.select(name, ["uid", "foo"], where))
+        where = [Or([[("uid", "<", 3)], [("uid", ">=", size)]])]
+        self.assertEqual([[size], [2], [1]], self.storage.select(name, ["uid"], where, ("uid", False)))
+        self.assertEqual([[3]], self.storage.select(name, ["uid"], [("uid", "<=", 3), ("foo", ">", "v1")]))
+        self.assertEqual([], self.storage.select(name, ["uid"], [("ts", "<", 0)]))
+
+    def test_select_or_with_indexes(self):
+        self.storage.create("foobar", "uid", ["foo", "bar"])
+        self.storage.create_index("foobar", "foobar_foo", "foo")
+        self.storage.insert_many("foobar", [
+            [("uid", 1), ("foo", "a"), ("bar", 100)],
+            [("uid", 2), ("foo", "b"), ("bar", 200)],
+            [("uid", 3), ("foo", "c"), ("bar", 300)],
+        ])
+        self.assertEqual([[1], [3]], self.storage.select("foobar", ["uid"], [Or([[("foo", "a")], [("uid", 3)]])]))
+        where = [("foo", "b"), Or([[("bar", 200)], [("uid", 9)]])]
+        self.assertEqual([[2]], self.storage.select("foobar", ["uid"], where))
+        self.assertEqual([], self.storage.select("foobar", ["uid"], [("uid", 1), ("bar", ">", 100)]))
+
+    def test_select_raise_exception_on_invalid_condition(self):
+        self.storage.create("foobar", "uid", ["foo"])
+        with self.assertRaises(TableColumnNotExists):
+            self.storage.select("foobar", ["uid"], [Or([[("foo", "a")], [("bar", ">", 1)]])])
+
+
+class TestStorageExpressions(TestDirCase):
+    TEST_DIR = 'tests_storage'
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.storage = Storage(self.TEST_DIR, cache=TableCache())
+
+    def create(self, name: str, engine: str = None) -> None:
+        rows = [[i + 1, "v%d" % i, i * 10] for i in range(5)] + [[6, "v5"]]
+        self.create_table(self.storage, name, "uid", ["foo", "bar"], rows, engine, TYPES)
+
+    @cases(["csv", "columnar"])
+    def test_select_expressions(self, engine):
+        name = "foobar_%s" % engine
+        self.create(name, engine)
+        result = ["uid", expression("bar / uid + 1"), expression("2 * 3")]
+        self.assertEqual([[1, 1, 6], [2, 6, 6], [3, 7, 6], [4, 8, 6], [5, 9, 6], [6, None, 6]],
+                         self.storage.select(name, result, []))
+        where = [(expression("bar * 2"), ">", 30), (expression("uid - 1"), "!=", 3)]
+        self.assertEqual([[3, 4], [5, 6]], self.storage.select(name, ["uid", expression("uid + 1")], where))
+        where = [("bar", ">=", expression("uid * 5")), (expression("(uid + 1) * 10"), "<", expression("bar * 2"))]
+        self.assertEqual([[4], [5]], self.storage.select(name, ["uid"], where))
+        order = (expression("0 - bar"), True)
+        self.assertEqual([[5], [4]], self.storage.select(name, ["uid"], [], order, 2))
+
+        # integers are widened and don't overflow
+        self.assertEqual([[40 * 10 ** 9]], self.storage.select(name, [expression("bar * 1000000000")], [("uid", 5)]))
+
+    def test_select_expressions_in_chunks(self):
+        self.create("foobar")
+        storage = Storage(self.TEST_DIR, cache=TableCache(max_bytes=1), chunk_rows=2)
+        self.assertEqual([[4], [5]], storage.select("foobar", ["uid"], [(expression("bar + uid"), ">", 30)]))
+        self.assertEqual([[3], [4]], storage.select("foobar", ["uid"], [("bar", ">", expression("uid * 5"))],
+                                                    limit=2))
+
+    @cases([
+        ([expression("foo + 1")], [], StorageException),
+        ([expression("nonexistent * 2")], [], TableColumnNotExists),
+        ([expression("bar + 1"), ("count", None)], [], StorageException),
+        (["uid"], [(expression("foo * 2"), ">", 1)], StorageException),
+    ])
+    def test_select_expressions_raise_exception(self, result, where, exception):
+        self.create("foobar")
+        with self.assertRaises(exception):
+            self.storage.select("foobar", result, where)
+
+
+class TestStorageAggregates(TestDirCase):
+    TEST_DIR = 'tests_storage'
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.cache = TableCache()
+        self.storage = Storage(self.TEST_DIR, cache=self.cache)
+        self.create("foobar")
+
+    def create(self, name: str, engine: str = None) -> None:
+        rows = [[i + 1, "v%d" % (i % 3), i] for i in range(100)]
+        self.create_table(self.storage, name, "uid", ["foo", "bar"], rows, engine, TYPES)
+
+    @cases(["csv", "columnar"])
+    def test_select_aggregates(self, engine):
+        name = "foobar_%s" % engine
+        self.create(name, engine)
+        result = ["foo", ("count", None), ("sum", "bar"), ("min", "uid")]
+        expected = [["v0", 34, 1683, 1], ["v1", 33, 1617, 2], ["v2", 33, 1650, 3]]
+        self.assertEqual(expected, self.storage.select(name, result, [], group=["foo"]))
+        self.assertEqual([[17]], self.storage.select(name, [("count", "uid")], [("foo", "v1"), ("bar", "<", 50)]))
+        self.assertEqual([[99, 0]], self.storage.select(name, [("max", "bar"), ("min", "bar")], []))
+        self.assertEqual([["v0"], ["v2"]], self.storage.select(name, ["foo"], [], (("sum", "bar"), False), 2, ["foo"]))
+
+        # tables that don't fit into the cache are aggregated chunk by chunk
+        storage = Storage(self.TEST_DIR, cache=TableCache(max_bytes=1), chunk_rows=7)
+        self.assertEqual(expected, storage.select(name, result, [], group=["foo"]))
+
+    def test_count_from_catalog(self):
+        self.assertEqual([[100, 100]], self.storage.select("foobar", [("count", None), ("count", None)], []))
+        self.assertEqual(0, self.cache.stats()["entries"])
+
+        with open(self.storage.path("foobar"), "a") as f:
+            f.write("101,v0,100\n")
+        self.assertIsNone(self.storage.rows("foobar"))
+        self.assertEqual([[101]], self.storage.select("foobar", [("count", None)], []))
+        self.storage.insert("foobar", [("uid", 102)])
+        self.assertIsNone(self.storage.rows("foobar"))
+        self.assertEqual([[102]], self.storage.select("foobar", [("count", None)], []))
+
+    @cases([
+        (["foo", ("count", None)], [], StorageException),
+        ([("sum", "foo")], [], StorageException),
+        ([("median", "bar")], [], StorageException),
+        ([("sum", None)], [], StorageException),
+        ([("sum", "nonexistent")], [], TableColumnNotExists),
+        (["bar"], ["foo"], StorageException),
+        (["foo"], ["nonexistent"], TableColumnNotExists),
+    ])
+    def test_select_aggregates_raise_exception(self, result, group, exception):
+        with self.assertRaises(exception):
+            self.storage.select("foobar", result, [], group=group)
+
+
+class TestStorageJoin(TestDirCase):
+    TEST_DIR = 'tests_storage'
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.cache = TableCache()
+
+    def create(self, engine: str = None) -> Storage:
+        storage = Storage(self.TEST_DIR, cache=self.cache, engine=engine or "csv")
+        users = [[i, "u%d" % i, "c%d" % (i % 3)] for i in range(1, 8)]
+        orders = [[i, i * 5 % 9, i * 10] for i in range(1, 13)]
+        self.create_table(storage, "users", "uid", ["name", "city"], users)
+        self.create_table(storage, "orders", "oid", ["user_id", "total"], orders)
+        return storage
+
+    @cases(["csv", "columnar"])
+    def test_join(self, engine):
+        storage = self.create(engine)
+        on = ("users.uid", "orders.user_id")
+        self.assertEqual([["u1", 2], ["u1", 11], ["u2", 4], ["u3", 6], ["u4", 8], ["u5", 1], ["u5", 10], ["u6", 3],
+                          ["u6", 12], ["u7", 5]], storage.join("users", "orders", on, ["name", "oid"], []))
+        self.assertEqual([[5, "u7"], [8, "u4"], [11, "u1"]],
+                         storage.join("orders", "users", ("user_id", "uid"), ["oid", "users.name"],
+                                      [("city", "c1"), ("total", ">", 30)]))
+        self.assertEqual([["u1", 11], ["u3", 6], ["u6", 3], ["u6", 12]],
+                         storage.join("users", "orders", on, ["name", "oid"],
+                                      [Or([[("city", "c0")], [("orders.total", ">", 100)]])]))
+        self.assertEqual([["c0", 3, 210], ["c1", 4, 260], ["c2", 3, 150]],
+                         storage.join("users", "orders", on, ["city", ("count", None), ("sum", "total")], [],
+                                      ("city", True), None, ["city"]))
+        self.assertEqual([], storage.join("users", "orders", on, ["name"], [("uid", 100)]))
+
+    def test_join_by_index_does_not_load_tables(self):
+        storage = self.create()
+        storage.create_index("orders", "orders_user", "user_id")
+        on = ("uid", "user_id")
+        self.assertEqual([["u5", 1], ["u5", 10]], storage.join("users", "orders", on, ["name", "oid"], [("uid", 5)]))
+        self.assertEqual([["u5", 10]],
+                         storage.join("users", "orders", on, ["name", "oid"], [("uid", 5), ("total", ">", 50)]))
+        self.assertEqual([], storage.join("users", "orders", on, ["name"], [("uid", 100)]))
+        self.assertEqual(0, self.cache.stats()["entries"])
+
+    @cases([
+        (("uid", "name"), ["name"], StorageException),
+        (("uid", "user_id"), ["nonexistent"], TableColumnNotExists),
+        (("uid", "user_id"), ["foobar.name"], TableColumnNotExists),
+        (("uid", "user_id"), [("median", "total")], StorageException),
+        (("uid", "user_id"), ["name", ("count", None)], StorageException),
+    ])
+    def test_join_raise_exception(self, on, result, exception):
+        storage = self.create()
+        with self.assertRaises(exception):
+            storage.join("users", "orders", on, result, [])
+
+    def test_join_raise_exception_on_ambiguous_column(self):
+        storage = self.create()
+        storage.create("cities", "city", ["name"])
+        with self.assertRaises(StorageException):
+            storage.join("users", "cities", ("city", "cities.city"), ["name"], [])
+        with self.assertRaises(StorageException):
+            storage.join("users", "users", ("uid", "uid"), ["name"], [])
+
+
+class TestStorageCache(TestDirCase):
+    TEST_DIR = 'tests_storage'
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.cache = TableCache()
+        self.storage = Storage(self.TEST_DIR, cache=self.cache)
+        self.storage.create("foobar", "uid", ["foo", "bar"])
+        self.storage.insert("foobar", [("uid", 1), ("foo", "a"), ("bar", 100)])
+
+    def test_select_hits_cache(self):
+        self.cache.clear()
+        self.cache.hits = self.cache.misses = 0
+        self.storage.select("foobar", ["uid"], [])
+        self.storage.select("foobar", ["uid"], [("uid", 1)])
+        self.storage.select("foobar", ["uid"], [("foo", "a")])
+        stats = self.cache.stats()
+        self.assertEqual(1, stats["misses"])
+        self.assertEqual(2, stats["hits"])
+        self.assertEqual(1, stats["entries"])
+
+    def test_insert_invalidates_cache(self):
+        self.assertEqual([[1]], self.storage.select("foobar", ["uid"], []))
+        self.storage.insert("foobar", [("uid", 2), ("foo", "b"), ("bar", 200)])
+        self.assertEqual([[1], [2]], self.storage.select("foobar", ["uid"], []))
+
+    def test_external_write_invalidates_cache(self):
+        self.assertEqual([[1]], self.storage.select("foobar", ["uid"], []))
+        with open(self.storage.path("foobar"), "a") as f:
+            f.write("2,b,200\n")
+        self.assertEqual([[1], [2]], self.storage.select("foobar", ["uid"], []))
+
+    def test_evicts_least_recently_used(self):
+        self.storage.create("other", "uid", ["foo"])
+        self.storage.insert("other", [("uid", 1), ("foo", "a")])
+        first = self.storage.load("foobar").memory_usage()
+        second = self.storage.load("other").memory_usage()
+        self.cache.max_bytes = max(first, second)
+        self.cache.clear()
+        self.storage.select("foobar", ["uid", "foo", "bar"], [])
+        self.storage.select("other", ["uid", "foo"], [])
+        stats = self.cache.stats()
+        self.assertEqual(1, stats["evictions"])
+        self.assertEqual(1, stats["entries"])
+        self.assertLessEqual(stats["bytes"], stats["max_bytes"])
+
+    def test_select_reads_only_used_columns(self):
+        self.cache.clear()
+        self.assertEqual([[1]], self.storage.select("foobar", ["uid"], [], ("uid", True)))
+        self.assertEqual([], self.storage.load("foobar", []).columns)
+        self.assertEqual([[100]], self.storage.select("foobar", ["bar"], [("foo", "a")]))
+        self.assertEqual(["foo", "bar"], self.storage.load("foobar", []).columns)
+        self.assertEqual(1, self.cache.stats()["entries"])
+
+    def test_insert_appends_to_table_file(self):
+        path = self.storage.path("foobar")
+        with open(path) as f:
+            content = f.read()
+        self.storage.insert("foobar", [("uid", 2), ("foo", "b, c"), ("bar", 200)])
+        with open(path) as f:
+            self.assertEqual(content + '2,"b, c",200\n', f.read())
+
+    def test_appended_rows_merged_into_cached_table(self):
+        self.assertEqual([[1, "a", 100]], self.storage.select("foobar", ["uid", "foo", "bar"], []))
+        self.storage.insert("foobar", [("uid", 2), ("foo", "b"), ("bar", 200)])
+        self.storage.insert("foobar", [("uid", 3), ("foo", "c")])
+        self.assertEqual([[1, "a"], [2, "b"], [3, "c"]], self.storage.select("foobar", ["uid", "foo"], []))
+        self.assertEqual([[2]], self.storage.select("foobar", ["uid"], [("bar", 200)]))
+
+    def test_appended_rows_with_other_types_reload_table(self):
+        self.assertEqual([[100]], self.storage.select("foobar", ["bar"], []))
+        self.storage.insert("foobar", [("uid", 2), ("foo", "b"), ("bar", "many")])
+        self.assertEqual([["100"], ["many"]], self.storage.select("foobar", ["bar"], []))
+
+
+class TestResultCache(unittest.TestCase):
+
+    def test_stale_tables(self):
+        cache = ResultCache()
+        cache.put("query", (("foo", "/foo", (1,)), ("bar", "/bar", (1,))), [[1]])
+        self.assertEqual([[1]], cache.get("query", (("foo", "/foo", (1,)), ("bar", "/bar", (1,)))))
+        self.assertIsNone(cache.get("query", (("foo", "/foo", (1,)), ("bar", "/bar", (2,)))))
+        self.assertEqual({"hits": 1, "misses": 1, "invalidations": 1, "entries": 0}, cache.stats()["tables"]["bar"])
+        self.assertEqual({"hits": 1, "misses": 1, "invalidations": 0, "entries": 0}, cache.stats()["tables"]["foo"])
+
+    def test_evicts_least_recently_used(self):
+        rows = [[1, "a"], [2, "b"]]
+        cache = ResultCache(max_bytes=rows_size(rows) * 2)
+        for query in ["first", "second", "first", "third"]:
+            if cache.get(query, (("foo", "/foo", (1,)),)) is None:
+                cache.put(query, (("foo", "/foo", (1,)),), rows)
+        stats = cache.stats()
+        self.assertEqual((1, 2), (stats["evictions"], stats["entries"]))
+        self.assertIsNotNone(cache.get("first", (("foo", "/foo", (1,)),)))
+        self.assertLessEqual(stats["bytes"], stats["max_bytes"])
+
+    def test_too_big(self):
+        cache = ResultCache(max_bytes=1)
+        cache.put("query", (("foo", "/foo", (1,)),), [[1]])
+        self.assertEqual((0, 0), (cache.stats()["entries"], cache.stats()["bytes"]))
+
+
+class TestStorageInsertMany(TestDirCase):
+    TEST_DIR = 'tests_storage'
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.storage = Storage(self.TEST_DIR)
+        self.storage.create("foobar", "uid", ["foo", "bar"])
+        self.storage.insert("foobar", [("uid", 1), ("foo", "a"), ("bar", 100)])
+
+    def test_insert_many(self):
+        self.storage.insert_many("foobar", [
+            [("uid", 2), ("foo", "b"), ("bar", 200)],
+            [("bar", 300), ("uid", 3), ("foo", "c")],
+        ])
+        self.assertEqual(
+            [[1, "a", 100], [2, "b", 200], [3, "c", 300]],
+            self.storage.select("foobar", ["uid", "foo", "bar"], [])
+        )
+
+    @cases([
+        ([[("uid", 2)], [("uid", 2)]], StorageException),
+        ([[("uid", 2)], [("uid", 1)]], StorageException),
+        ([[("uid", 2)], [("foo", "c")]], StorageException),
+        ([[("uid", 2)], [("uid", "")]], StorageException),
+        ([[("uid", 2)], [("uid", 3), ("a", 1)]], TableColumnNotExists),
+    ])
+    def test_insert_many_writes_nothing_on_error(self, rows, exception):
+        with open(self.storage.path("foobar")) as f:
+            content = f.read()
+        with self.assertRaises(exception):
+            self.storage.insert_many("foobar", rows)
+        with open(self.storage.path("foobar")) as f:
+            self.assertEqual(content, f.read())
+
+
+class TestStorageEngines(TestDirCase):
+    TEST_DIR = 'tests_storage'
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.storage = Storage(self.TEST_DIR, engine="columnar")
+
+    def test_init_raise_exception_on_unknown_engine(self):
+        with self.assertRaises(StorageException):
+            Storage(self.TEST_DIR, engine="foobar")
+
+    def test_engine_per_table(self):
+        self.storage.create("foo", "uid", ["a"])
+        self.storage.create("bar", "uid", ["a"], engine="csv")
+        self.assertEqual("columnar", self.storage.engine_of("foo").name)
+        self.assertEqual("csv", self.storage.engine_of("bar").name)
+        self.assertEqual("csv", Storage(self.TEST_DIR).engine_of("bar").name)
+        self.assertEqual("columnar", Storage(self.TEST_DIR).engine_of("foo").name)
+
+    def test_insert_select(self):
+        self.storage.create("foobar", "uid", ["foo", "bar"])
+        self.storage.insert_many("foobar", [
+            [("uid", 1), ("foo", "a"), ("bar", 100)],
+            [("uid", 2), ("foo", "b"), ("bar", 200)],
+        ])
+        self.assertEqual([[2, "b"]], self.storage.select("foobar", ["uid", "foo"], [("bar", 200)]))
+        self.storage.insert("foobar", [("uid", 3), ("foo", "c"), ("bar", 300)])
+        self.assertEqual([["c"], ["b"]], self.storage.select("foobar", ["foo"], [], ("bar", False), 2))
+        self.assertEqual(["uid", "foo", "bar"], self.storage.describe("foobar"))
+
+    def test_columnar_table_is_memory_mapped(self):
+        self.storage.create("foobar", "uid", ["foo", "bar"])
+        self.storage.insert("foobar", [("uid", 1), ("foo", "a"), ("bar", 100)])
+
+        table = self.storage.load("foobar")
+        self.assertIsNone(table.df)
+        self.assertIsInstance(table.column("bar"), np.memmap)
+        self.assertIsInstance(table.column("foo").codes, np.memmap)
+
+        table = Storage(self.TEST_DIR, cache=TableCache(), mmap=False).load("foobar")
+        self.assertEqual([[1, "a", 100]], table.df.reset_index().values.tolist())
+
+    def test_insert_raise_exception_on_type_mismatch(self):
+        self.storage.create("foobar", "uid", ["foo"])
+        self.storage.insert("foobar", [("uid", 1), ("foo", 100)])
+        with self.assertRaises(StorageException):
+            self.storage.insert("foobar", [("uid", 2), ("foo", "a")])
+
+    def test_drop(self):
+        self.storage.create("foobar", "uid", ["foo"])
+        self.assertTrue(self.storage.drop("foobar"))
+        self.assertFalse(self.storage.exists("foobar"))
+        self.assertFalse(self.storage.drop("foobar"))
+
+
+class TestStoragePrimaryIndex(TestDirCase):
+    TEST_DIR = 'tests_storage'
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.cache = TableCache()
+        self.storage = Storage(self.TEST_DIR, cache=self.cache)
+        self.storage.create("foobar", "uid", ["foo", "bar"])
+        self.storage.insert_many("foobar", [
+            [("uid", 1), ("foo", "a"), ("bar", 100)],
+            [("uid", 2), ("foo", "b\nc"), ("bar", 200)],
+            [("uid", 3), ("foo", "c"), ("bar", 300)],
+        ])
+
+    def test_point_lookup_does_not_load_table(self):
+        self.assertEqual([[3, "c", 300]], self.storage.select("foobar", ["uid", "foo", "bar"], [("uid", 3)]))
+        self.assertEqual([[2, "b\nc"]], self.storage.select("foobar", ["uid", "foo"], [("uid", 2)]))
+        self.assertEqual([], self.storage.select("foobar", ["uid"], [("uid", 100500)]))
+        self.assertEqual([], self.storage.select("foobar", ["uid"], [("uid", 3), ("foo", "a")]))
+        self.assertEqual(0, self.cache.stats()["entries"])
+
+    def test_index_catches_up_with_external_append(self):
+        with open(self.storage.path("foobar"), "a") as f:
+            f.write('4,"d\n",400\n5,e,500\n')
+        self.assertEqual([[4, "d\n"]], self.storage.select("foobar", ["uid", "foo"], [("uid", 4)]))
+        with self.assertRaises(StorageException):
+            self.storage.insert("foobar", [("uid", 5)])
+
+    def test_index_rebuilt_for_new_table(self):
+        self.storage.drop("foobar")
+        self.storage.create("foobar", "uid", ["foo"])
+        self.storage.insert("foobar", [("uid", 1), ("foo", "z")])
+        self.assertEqual([["z"]], self.storage.select("foobar", ["foo"], [("uid", 1)]))
+
+    def test_duplicate_check_uses_key_text(self):
+        with self.assertRaises(StorageException):
+            self.storage.insert("foobar", [("uid", "2")])
+        self.storage.insert("foobar", [("uid", 4)])
+
+    def test_point_lookup_columnar(self):
+        storage = Storage(self.TEST_DIR, cache=self.cache, engine="columnar")
+        storage.create("columns", "uid", ["foo"])
+        storage.insert_many("columns", [[("uid", i), ("foo", "v%d" % i)] for i in range(1, 100)])
+        self.assertEqual([[50, "v50"]], storage.select("columns", ["uid", "foo"], [("uid", 50)]))
+        with self.assertRaises(StorageException):
+            storage.insert("columns", [("uid", 99)])
+
+
+class TestStorageSecondaryIndex(TestDirCase):
+    TEST_DIR = 'tests_storage'
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.cache = TableCache()
+        self.storage = Storage(self.TEST_DIR, cache=self.cache)
+        self.storage.create("foobar", "uid", ["foo", "bar"])
+        self.storage.insert_many("foobar", [
+            [("uid", 1), ("foo", "a"), ("bar", 100)],
+            [("uid", 2), ("foo", "b"), ("bar", 200)],
+            [("uid", 3), ("foo", "a"), ("bar", 300)],
+        ])
+
+    def test_create_index(self):
+        self.assertTrue(self.storage.create_index("foobar", "foobar_foo", "foo"))
+        self.assertFalse(self.storage.create_index("foobar", "foobar_foo", "bar"))
+        self.assertEqual({"foobar_foo": "foo"}, self.storage.indexes("foobar"))
+        self.assertTrue(os.path.exists(self.storage.index_path("foobar", "foobar_foo")))
+
+    def test_distinct_values_counted(self):
+        self.storage.create_index("foobar", "foobar_foo", "foo")
+        self.assertEqual(2, self.storage.distinct("foobar", "foo"))
+        self.assertEqual(3, self.storage.distinct("foobar", "uid"))
+        self.assertIsNone(self.storage.distinct("foobar", "bar"))
+
+        self.storage.insert_many("foobar", [[("uid", 4), ("foo", "c")], [("uid", 5), ("foo", "a")],
+                                            [("uid", 6), ("foo", "c")]])
+        self.assertEqual(3, self.storage.distinct("foobar", "foo"))
+        with open(self.storage.path("foobar"), "a") as f:
+            f.write("7,d,700\n")
+        self.assertIsNone(self.storage.distinct("foobar", "foo"))
+
+    def test_create_index_raise_exception(self):
+        with self.assertRaises(TableNotExists):
+            self.storage.create_index("nonexistent", "idx", "foo")
+        with self.assertRaises(TableColumnNotExists):
+            self.storage.create_index("foobar", "idx", "nonexistent")
+
+    def test_select_by_index_does_not_load_table(self):
+        self.storage.create_index("foobar", "foobar_foo", "foo")
+        self.storage.create_index("foobar", "foobar_bar", "bar")
+        self.assertEqual([[1], [3]], self.storage.select("foobar", ["uid"], [("foo", "a")]))
+        self.assertEqual([[3]], self.storage.select("foobar", ["uid"], [("foo", "a"), ("bar", 300)]))
+        self.assertEqual([[2]], self.storage.select("foobar", ["uid"], [("bar", 200)]))
+        self.assertEqual([], self.storage.select("foobar", ["uid"], [("foo", "z")]))
+        self.assertEqual(0, self.cache.stats()["entries"])
+
+    def test_index_maintained_by_insert(self):
+        self.storage.create_index("foobar", "foobar_foo", "foo")
+        self.storage.insert_many("foobar", [[("uid", 4), ("foo", "a")], [("uid", 5), ("foo", "c")]])
+        with open(self.storage.path("foobar"), "a") as f:
+            f.write("6,a,600\n")
+        self.assertEqual([[1], [3], [4], [6]], self.storage.select("foobar", ["uid"], [("foo", "a")]))
+        self.assertEqual([[5]], self.storage.select("foobar", ["uid"], [("foo", "c")]))
+
+    def test_drop_removes_indexes(self):
+        self.storage.create_index("foobar", "foobar_foo", "foo")
+        self.storage.drop("foobar")
+        self.assertFalse(os.path.exists(self.storage.index_path("foobar", "foobar_foo")))
+        self.storage.create("foobar", "uid", ["foo"])
+        self.assertEqual({}, self.storage.indexes("foobar"))
+
+    def test_select_by_index_columnar(self):
+        storage = Storage(self.TEST_DIR, cache=self.cache, engine="columnar")
+        storage.create("columns", "uid", ["foo"])
+        storage.insert_many("columns", [[("uid", i), ("foo", "v%d" % (i % 10))] for i in range(1, 100)])
+        storage.create_index("columns", "columns_foo", "foo")
+        storage.insert("columns", [("uid", 100), ("foo", "v3")])
+        self.assertEqual([[100], [93], [83]], storage.select("columns", ["uid"], [("foo", "v3")], ("uid", False), 3))
+        self.assertEqual(11, len(storage.select("columns", ["uid"], [("foo", "v3")])))
+
+
+class TestStorageChunkedScan(TestDirCase):
+    TEST_DIR = 'tests_storage'
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.cache = TableCache()
+        self.storage = Storage(self.TEST_DIR, cache=self.cache, chunk_rows=2)
+        self.storage.create("foobar", "uid", ["foo", "bar"])
+        self.storage.insert_many("foobar", [[("uid", i), ("foo", "v%d" % (i % 3)), ("bar", i % 4)]
+                                            for i in range(1, 12)])
+
+    def test_limit_stops_scan(self):
+        with open(self.storage.path("foobar"), "a") as f:
+            f.write("12,broken,row,with,extra,values\n")
+        self.assertEqual([[1], [4], [7]], self.storage.select("foobar", ["uid"], [("foo", "v1")], None, 3))
+        self.assertEqual(0, self.cache.stats()["entries"])
+
+    @cases([
+        (["uid", "bar"], [], ("bar", False), 5),
+        (["uid", "bar"], [], ("bar", True), 3),
+        (["uid", "foo"], [("foo", "v2")], ("bar", False), 2),
+        (["uid"], [("bar", 1)], None, 100),
+        (["uid"], [], ("foo", True), None),
+        (["uid"], [("foo", "nonexistent")], None, 1),
+    ])
+    def test_large_table_scanned_in_chunks(self, result, where, order, limit):
+        expected = self.storage.load("foobar").select(result, where, order, limit)
+        self.cache.clear()
+        self.cache.max_bytes = 1
+        self.assertEqual(expected, self.storage.select("foobar", result, where, order, limit))
+        self.assertEqual(0, self.cache.stats()["entries"])
@@ -2,7 +2,11 @@ import csv
 import io
 import unittest
 
-from storage import Table
+import numpy as np
+import pandas as pd
+
+from engines import ZONE_ROWS, DictionaryColumn, NullableColumn
+from storage import SAMPLE_ROWS, Or, Table, combine, compare, finish, hash_join, top
 from tests.helpers import cases
 
 
@@ -157,3 +161,179 @@ class TestTable(unittest.TestCase):
         table = Table.load(buff_table.buff)
         values = table.select(*query)
         self.assertEqual(expected, values)
+
+    @cases([
+        ((["foo", "uid"], []), [["a", 1], ["b", 2], ["c", 3]]),
+        ((["uid"], [("foo", "c")]), [[3]]),
+        ((["uid"], [("uid", 3), ("foo", "c")]), [[3]]),
+        ((["foo"], [], ("uid", False), 1), [["c"]]),
+    ])
+    def test_table_select_columns(self, query, expected):
+        table = Table.from_columns({
+            "uid": np.array([1, 2, 3]),
+            "foo": DictionaryColumn(np.array([0, 1, 2], dtype=np.int32), ["a", "b", "c"]),
+            "bar": np.array([100, 200, 300]),
+        })
+        values = table.select(*query)
+        self.assertEqual(expected, values)
+
+    def test_table_select_columns_missing_values(self):
+        table = Table.from_columns({
+            "uid": np.array([1, 2, 3]),
+            "foo": DictionaryColumn(np.array([1, -1, 0], dtype=np.int32), ["a", "b"]),
+        })
+        self.assertEqual([[3], [1]], table.select(["uid"], [], ("foo", True), 2))
+        self.assertEqual([[1], [3]], table.select(["uid"], [], ("foo", False), 2))
+        self.assertEqual([], table.select(["uid"], [("foo", 100500)]))
+
+    @cases([
+        (True, 1),
+        (True, 5),
+        (False, 5),
+        (True, 95),
+        (False, 98),
+    ])
+    def test_table_select_top_k_same_as_sort(self, ascending, limit):
+        rng = np.random.default_rng(42)
+        values = rng.integers(0, 10, 100).astype(float)
+        values[rng.integers(0, 100, 10)] = np.nan
+        table = Table.from_columns({"uid": np.arange(100), "foo": values})
+
+        expected = table.select(["uid"], [], ("foo", ascending))[:limit]
+        self.assertEqual(expected, table.select(["uid"], [], ("foo", ascending), limit))
+
+    def test_top(self):
+        values = np.array(["b", "a", np.nan, "c", "a"], dtype=object)
+        self.assertEqual([False, True, False, False, True], top(values, True, 1).tolist())
+        self.assertEqual([True, False, False, True, False], top(values, False, 2).tolist())
+        self.assertEqual([True, True, True, True, True], top(values, True, 5).tolist())
+
+    def test_hash_join(self):
+        build = np.array([3, 1, None, 3, 2], dtype=object)
+        probe = np.array([1, 3, 5, None, 3], dtype=object)
+        positions, probe_positions = hash_join(build, probe)
+        self.assertEqual([1, 0, 3, 0, 3], positions.tolist())
+        self.assertEqual([0, 1, 1, 4, 4], probe_positions.tolist())
+
+        positions, probe_positions = hash_join(np.array(["a", "b"], dtype=object), np.array([1, 2]))
+        self.assertEqual(([], []), (positions.tolist(), probe_positions.tolist()))
+
+    def test_table_mask(self):
+        size = 10 * SAMPLE_ROWS
+        table = Table.from_columns({
+            "uid": np.arange(size),
+            "foo": np.arange(size) % 2,
+            "bar": np.arange(size) % 100,
+            "baz": DictionaryColumn(np.zeros(size, dtype=np.int32), ["a"]),
+        })
+        self.assertLess(table.selectivity(("bar", "=", 1)), table.selectivity(("foo", "=", 1)))
+        self.assertEqual(0.0, table.selectivity(("baz", "=", "b")))
+
+        expected = (np.arange(size) % 100 == 1)
+        self.assertEqual(expected.tolist(), table.mask([("foo", 1), ("baz", "a"), ("bar", 1)]).tolist())
+        self.assertFalse(table.mask([("foo", 1), ("baz", "b"), ("bar", 1)]).any())
+
+        rows = np.array([1, 2, 101, 201])
+        self.assertEqual([True, False, True, True], table.mask([("foo", 1), ("bar", 1)], rows).tolist())
+
+    def test_table_mask_nullable(self):
+        df = pd.DataFrame({"foo": pd.array([1, None, 1], dtype="Int32")}, index=pd.Index([1, 2, 3], name="uid"))
+        table = Table.from_df(df)
+        self.assertEqual([True, False, True], table.mask([("foo", 1)]).tolist())
+        self.assertEqual([[3]], table.select(["uid"], [("foo", 1)], ("uid", False), 1))
+
+    @cases([
+        ("<", 2, [True, False, False, False]),
+        ("<=", 2, [True, True, False, False]),
+        (">", 2, [False, False, True, False]),
+        (">=", 2, [False, True, True, False]),
+        ("!=", 2, [True, False, True, False]),
+        ("=", 2, [False, True, False, False]),
+        ("<", "a", [False, False, False, False]),
+    ])
+    def test_compare(self, op, value, expected):
+        columns = [
+            np.array([1.0, 2.0, 3.0, np.nan]),
+            pd.Series([1, 2, 3, None], dtype="Int64"),
+            NullableColumn(np.array([1, 2, 3, np.iinfo(np.int32).min], dtype=np.int32)),
+        ]
+        for column in columns:
+            with self.subTest(column=type(column).__name__):
+                self.assertEqual(expected, compare(column, op, value).tolist())
+
+    @cases([
+        ("<", "b", [True, False, False, False]),
+        (">=", "b", [False, True, True, False]),
+        ("!=", "b", [True, False, True, False]),
+        (">", 1, [False, False, False, False]),
+    ])
+    def test_compare_strings(self, op, value, expected):
+        columns = [
+            np.array(["a", "b", "c", np.nan], dtype=object),
+            pd.Series(["a", "b", "c", None], dtype="category"),
+            DictionaryColumn(np.array([0, 1, 2, -1], dtype=np.int32), ["a", "b", "c"]),
+        ]
+        for column in columns:
+            with self.subTest(column=type(column).__name__):
+                self.assertEqual(expected, compare(column, op, value).tolist())
+
+    def test_table_select_or(self):
+        table = Table.from_columns({
+            "uid": np.array([1, 2, 3, 4]),
+            "foo": DictionaryColumn(np.array([0, 1, 0, 1], dtype=np.int32), ["a", "b"]),
+            "bar": np.array([100, 200, 300, 400]),
+        })
+        where = [Or([[("foo", "a")], [("bar", ">", 300)]]), ("uid", "!=", 3)]
+        self.assertEqual([[1], [4]], table.select(["uid"], where))
+        self.assertEqual([[4], [1]], table.select(["uid"], where, ("bar", False)))
+        self.assertEqual([[3]], table.select(["uid"], [Or([[("uid", 3)], [("uid", 5)]])]))
+
+    def test_table_zone_maps_skip_blocks(self):
+        size = 4 * ZONE_ROWS
+        table = Table.from_columns({"uid": np.arange(size), "foo": np.arange(size) // 2})
+
+        self.assertIsNone(table.blocks("foo", "!=", 1))
+        self.assertIsNone(table.blocks("foo", "<", "a"))
+        self.assertEqual([False, True, False, False], table.blocks("foo", "=", ZONE_ROWS // 2 + 1).tolist())
+        self.assertEqual([True, True, False, False], table.blocks("foo", "<", ZONE_ROWS).tolist())
+
+        where = [("foo", ">=", ZONE_ROWS), ("foo", "<", ZONE_ROWS + 2)]
+        self.assertEqual([[2 * ZONE_ROWS], [2 * ZONE_ROWS + 1], [2 * ZONE_ROWS + 2], [2 * ZONE_ROWS + 3]],
+                         table.select(["uid"], where))
+
+        # stored zone maps are used as they are
+        table = Table.from_columns({"uid": np.arange(size), "foo": np.zeros(size)},
+                                   {"foo": (np.array([0.0, 1.0, 0.0, 1.0]), np.array([0.0, 1.0, 0.0, 1.0]))})
+        self.assertEqual([False, True, False, True], table.blocks("foo", ">", 0).tolist())
+        self.assertEqual([], table.select(["uid"], [("foo", ">", 0)]))
+
+    def test_table_aggregate(self):
+        df = pd.DataFrame({
+            "foo": pd.Categorical(["a", "b", "a", None, "b"]),
+            "bar": pd.array([1, None, 3, 4, 5], dtype="Int32"),
+            "buz": [1.5, 2.5, np.nan, 0.5, 1.0],
+        }, index=pd.Index([1, 2, 3, 4, 5], name="uid"))
+        table = Table.from_df(df)
+
+        result = [("count", None), ("count", "bar"), ("sum", "bar"), ("avg", "buz"), ("min", "foo"), ("max", "bar")]
+        self.assertEqual([[5, 4, 13, 1.375, "a", 5]], table.select(result, []))
+        self.assertEqual([[0, 0, None, None, None, None]], table.select(result, [("uid", ">", 5)]))
+
+        result = ["foo", ("count", None), ("sum", "bar"), ("max", "buz")]
+        expected = [["a", 2, 4, 1.5], ["b", 2, 5, 2.5], [None, 1, 4, 0.5]]
+        self.assertEqual(expected, table.select(result, [], group=["foo"]))
+        # missing bar is not unequal to 4 either
+        where = [("bar", "!=", 4)]
+        self.assertEqual([["b", 1, 5, 1.0]], table.select(result, where, (("sum", "bar"), False), 1, group=["foo"]))
+        self.assertEqual([["a"], ["b"], [None]], table.select(["foo"], [], ("foo", True), group=["foo"]))
+        self.assertEqual([], table.select(result, [("uid", ">", 5)], group=["foo"]))
+
+    def test_partial_aggregations_are_combined(self):
+        table = Table.from_columns({
+            "uid": np.arange(10),
+            "foo": np.arange(10) % 3,
+            "bar": np.arange(10, dtype=float),
+        })
+        result = ["foo", ("count", None), ("avg", "bar"), ("min", "bar")]
+        partials = [table.partial(rows, result, ["foo"]) for rows in (np.arange(4), np.arange(4, 10))]
+        self.assertEqual(table.select(result, [], group=["foo"]), finish(combine(partials), result, ["foo"]))
@@ -0,0 +1,75 @@
+import unittest
+from array import array
+
+import numpy as np
+
+import nodes
+import vm
+from lexer import Lexer
+from parser import Parser
+from tests.helpers import cases
+from tokens import Token, TokenType
+
+
+def expression(text: str):
+    return Parser(Lexer(text)).expr()
+
+
+class TestCompiler(unittest.TestCase):
+
+    def test_postfix(self):
+        code = vm.compile_expression(expression("1 + 2 * 3"))
+        self.assertEqual(["LOAD_CONST 1", "LOAD_CONST 2", "LOAD_CONST 3", "MUL", "ADD"], code.disassemble())
+
+    def test_constants_shared(self):
+        code = vm.compile_expression(expression("2 * 2 + 2"))
+        self.assertEqual((2,), code.constants)
+        self.assertEqual(10, len(code.ops))
+
+    @cases([
+        ("1 + 2 * 3", "1 + 2 * 3"),
+        ("(1 + 2) * 3", "(1 + 2) * 3"),
+        ("10 - (4 - 3)", "10 - (4 - 3)"),
+        ("(10 - 4) - 3", "10 - 4 - 3"),
+        ("((7)) / (2 * 1)", "7 / (2 * 1)"),
+    ])
+    def test_source(self, text, expected):
+        self.assertEqual(expected, vm.compile_expression(expression(text)).source())
+
+    def test_unknown_node(self):
+        with self.assertRaises(vm.VMException):
+            vm.compile_expression(object())
+
+    def test_compiled_once(self):
+        node = expression("a * 2")
+        self.assertIs(vm.compiled(node), vm.compiled(node))
+        self.assertEqual("a * 2", vm.compiled(node).source())
+
+
+class TestVM(unittest.TestCase):
+
+    @cases([
+        ("1", 1),
+        ("1 + 2 * 3", 7),
+        ("(1 + 2) * 3", 9),
+        ("10 - 4 - 3", 3),
+        ("7 / 2", 3),
+        ("100 / 10 / 5", 2),
+    ])
+    def test_scalar(self, text, expected):
+        self.assertEqual(expected, vm.run(vm.compile_expression(expression(text))))
+
+    def test_columns(self):
+        column = nodes.Column(Token(TokenType.ID, "num_of_jobs", 0))
+        two = nodes.Number(Token(TokenType.INT, "2", 0))
+        one = nodes.Number(Token(TokenType.INT, "1", 0))
+        node = nodes.BinaryOperation(nodes.BinaryOperation(column, TokenType.MUL, two), TokenType.PLUS, one)
+        code = vm.compile_expression(node)
+        self.assertEqual(["LOAD_COLUMN num_of_jobs", "LOAD_CONST 2", "MUL", "LOAD_CONST 1", "ADD"], code.disassemble())
+        result = vm.run(code, {"num_of_jobs": np.array([1, 5, 10])})
+        self.assertEqual([3, 11, 21], result.tolist())
+
+    def test_unknown_column(self):
+        code = vm.Code(array("I", [vm.LOAD_COLUMN, 0]), (), ("foo",))
+        with self.assertRaises(vm.VMException):
+            vm.run(code, {"bar": np.array([1])})
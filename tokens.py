@@ -2,36 +2,51 @@ from enum import Enum
 
 
 class TokenType(Enum):
-    CREATE = r'create'
-    TABLE = r'table'
-    PRIMARY = r'primary'
-    KEY = r'key'
-
-    DESCRIBE = r'describe'
-
-    INSERT = r'insert'
-    INTO = r'into'
-    SET = r'set'
-
-    SELECT = r'select'
-    FROM = r'from'
-    WHERE = r'where'
-    LIMIT = r'limit'
-    ORDER = r'order'
-    BY = r'by'
-    ASC = r'asc'
-    DESC = r'desc'
-
-    AND = r'and'
+    CREATE = r'create\b'
+    TABLE = r'table\b'
+    PRIMARY = r'primary\b'
+    KEY = r'key\b'
+    INDEX = r'index\b'
+    ON = r'on\b'
+
+    DESCRIBE = r'describe\b'
+    EXPLAIN = r'explain\b'
+    ANALYZE = r'analyze\b'
+
+    INSERT = r'insert\b'
+    INTO = r'into\b'
+    SET = r'set\b'
+    VALUES = r'values\b'
+
+    SELECT = r'select\b'
+    FROM = r'from\b'
+    JOIN = r'join\b'
+    WHERE = r'where\b'
+    LIMIT = r'limit\b'
+    ORDER = r'order\b'
+    BY = r'by\b'
+    GROUP = r'group\b'
+    ASC = r'asc\b'
+    DESC = r'desc\b'
+
+    AND = r'and\b'
+    OR = r'or\b'
 
     ID = r'[a-zA-Z_]+\d*'
     INT = r'\d+'
     STRING = r"'[^']*'"
+    PARAMETER = r'\?|:[a-zA-Z_]\w*'
 
     LPAREN = r'\('
     RPAREN = r'\)'
     COMMA = r','
+    DOT = r'\.'
     SEMICOLON = r';'
+    NOT_EQUALS = r'!=|<>'
+    LESS_EQUALS = r'<='
+    GREATER_EQUALS = r'>='
+    LESS = r'<'
+    GREATER = r'>'
     EQUALS = r'='
 
     PLUS = r'\+'
@@ -0,0 +1,196 @@
+import operator
+from array import array
+from typing import Mapping, Optional
+
+import nodes
+from tokens import TokenType
+
+# every instruction is a pair of unsigned ints: opcode and its argument
+LOAD_CONST = 1
+LOAD_COLUMN = 2
+ADD = 3
+SUB = 4
+MUL = 5
+DIV = 6
+
+OPNAMES = {
+    LOAD_CONST: "LOAD_CONST",
+    LOAD_COLUMN: "LOAD_COLUMN",
+    ADD: "ADD",
+    SUB: "SUB",
+    MUL: "MUL",
+    DIV: "DIV",
+}
+
+BINARY_OPCODES = {
+    TokenType.PLUS: ADD,
+    TokenType.MINUS: SUB,
+    TokenType.MUL: MUL,
+    TokenType.DIV: DIV,
+}
+
+SYMBOLS = {
+    ADD: "+",
+    SUB: "-",
+    MUL: "*",
+    DIV: "/",
+}
+
+PRECEDENCE = {
+    ADD: 1,
+    SUB: 1,
+    MUL: 2,
+    DIV: 2,
+}
+
+# works the same way on ints and on numpy arrays, DIV is an integer division
+BINARY = {
+    ADD: operator.add,
+    SUB: operator.sub,
+    MUL: operator.mul,
+    DIV: operator.floordiv,
+}
+
+
+class VMException(Exception):
+    pass
+
+
+class Code:
+
+    def __init__(self, ops: array, constants: tuple, columns: tuple):
+        self.ops = ops
+        self.constants = constants
+        # names of the columns loaded by LOAD_COLUMN, a column is loaded once
+        self.columns = columns
+
+    def instructions(self) -> list:
+        return [(self.ops[i], self.ops[i + 1]) for i in range(0, len(self.ops), 2)]
+
+    def disassemble(self) -> list:
+        lines = []
+        for opcode, arg in self.instructions():
+            if opcode == LOAD_CONST:
+                lines.append("%s %r" % (OPNAMES[opcode], self.constants[arg]))
+            elif opcode == LOAD_COLUMN:
+                lines.append("%s %s" % (OPNAMES[opcode], self.columns[arg]))
+            else:
+                lines.append(OPNAMES[opcode])
+        return lines
+
+    def source(self) -> str:
+        """
+        Expression in SQL with only the parentheses it needs
+        """
+
+        # texts of the operands with the precedence of their topmost operation
+        stack = []
+        for opcode, arg in self.instructions():
+            if opcode == LOAD_CONST:
+                stack.append((repr(self.constants[arg]), 3))
+            elif opcode == LOAD_COLUMN:
+                stack.append((self.columns[arg], 3))
+            else:
+                (right, right_precedence), (left, left_precedence) = stack.pop(), stack.pop()
+                precedence = PRECEDENCE[opcode]
+                if left_precedence < precedence:
+                    left = "(%s)" % left
+                # operations are left associative: a - (b - c)
+                if right_precedence <= precedence:
+                    right = "(%s)" % right
+                stack.append(("%s %s %s" % (left, SYMBOLS[opcode], right), precedence))
+        return stack[-1][0]
+
+    def __repr__(self):
+        return "Code(%s)" % "; ".join(self.disassemble())
+
+
+class Compiler:
+    """
+    Compiles an expression tree to a flat postfix bytecode, so it is walked once
+    """
+
+    def __init__(self):
+        self.ops = array("I")
+        self.constants = []
+        self.columns = []
+
+    def compile(self, node: nodes.Node) -> Code:
+        self.ops = array("I")
+        self.constants = []
+        self.columns = []
+        self.emit_node(node)
+        return Code(self.ops, tuple(self.constants), tuple(self.columns))
+
+    def emit(self, opcode: int, arg: int = 0) -> None:
+        self.ops.append(opcode)
+        self.ops.append(arg)
+
+    def emit_node(self, node: nodes.Node) -> None:
+        if isinstance(node, nodes.BinaryOperation):
+            if node.operation not in BINARY_OPCODES:
+                raise VMException('Unknown operation %s' % node.operation)
+            self.emit_node(node.left)
+            self.emit_node(node.right)
+            self.emit(BINARY_OPCODES[node.operation])
+        elif isinstance(node, nodes.Number):
+            self.emit(LOAD_CONST, self.slot(self.constants, int(node.value)))
+        elif isinstance(node, nodes.String):
+            self.emit(LOAD_CONST, self.slot(self.constants, str(node.value.strip("'"))))
+        elif isinstance(node, nodes.Column):
+            name = node.name if node.table is None else "%s.%s" % (node.table.name, node.name)
+            self.emit(LOAD_COLUMN, self.slot(self.columns, name))
+        else:
+            raise VMException("Can't compile node %s" % type(node).__name__)
+
+    @staticmethod
+    def slot(values: list, value: any) -> int:
+        for i, known in enumerate(values):
+            if type(known) is type(value) and known == value:
+                return i
+        values.append(value)
+        return len(values) - 1
+
+
+def compile_expression(node: nodes.Node) -> Code:
+    return Compiler().compile(node)
+
+
+def compiled(node: nodes.Node) -> Code:
+    """
+    Code of the node compiled on the first call and kept on the node, so cached trees are compiled once
+    """
+
+    code = getattr(node, "code", None)
+    if code is None:
+        code = node.code = compile_expression(node)
+    return code
+
+
+def run(code: Code, columns: Optional[Mapping] = None) -> any:
+    """
+    Evaluates the bytecode on a stack. Columns are arrays, so every instruction
+    is done for all rows at once and the result is an array of the same size
+    """
+
+    loaded = []
+    for name in code.columns:
+        if columns is None or name not in columns:
+            raise VMException("Unknown column %s" % name)
+        loaded.append(columns[name])
+
+    ops = code.ops
+    constants = code.constants
+    stack = []
+    for i in range(0, len(ops), 2):
+        opcode = ops[i]
+        if opcode == LOAD_CONST:
+            stack.append(constants[ops[i + 1]])
+        elif opcode == LOAD_COLUMN:
+            stack.append(loaded[ops[i + 1]])
+        else:
+            right = stack.pop()
+            stack[-1] = BINARY[opcode](stack[-1], right)
+    if len(stack) != 1:
+        raise VMException("Broken bytecode, %d values left on the stack" % len(stack))
+    return stack[0]
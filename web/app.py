@@ -1,11 +1,13 @@
 import os
 
-from flask import Flask, render_template, request, flash
+from flask import Flask, render_template, request, flash, jsonify
 
+from engines import CsvEngine
 from interpreter import Interpreter
-from lexer import Lexer, LexerException
-from parser import Parser, ParserException
-from storage import TableNotExists, TableColumnNotExists, StorageException
+from lexer import LexerException
+from parser import ParserException
+from statements import default_statements
+from storage import TableNotExists, TableColumnNotExists, StorageException, default_cache, default_results
 from web.demo import initialize
 
 app = Flask(__name__)
@@ -14,7 +16,7 @@ app.config["SECRET_KEY"] = os.getenv("SECRET_KEY")
 
 def startapp():
     working_dir = os.getenv("WORKING_DIR")
-    initialize(working_dir)
+    initialize(working_dir, engine=os.getenv("STORAGE_ENGINE", CsvEngine.name))
 
 
 app.before_first_request(startapp)
@@ -32,7 +34,9 @@ def index():
             flash("Please provide SQL query")
         else:
             try:
-                inter = Interpreter(tree=Parser(lex=Lexer(content)).parse(), working_dir=os.getenv("WORKING_DIR"))
+                inter = Interpreter(tree=default_statements.parse(content), working_dir=os.getenv("WORKING_DIR"),
+                                    engine=os.getenv("STORAGE_ENGINE", CsvEngine.name), optimized=True,
+                                    results=default_results)
                 results = inter.do()
             except LexerException as err:
                 error = "Lexer Error: %s" % str(err)
@@ -46,3 +50,8 @@ def index():
         content = "select uid, name, num_of_jobs, avg_salary from languages;"
 
     return render_template('index.html', content=content, results=results, error=error)
+
+
+@app.route("/stats")
+def stats():
+    return jsonify(statements=default_statements.stats(), tables=default_cache.stats(), results=default_results.stats())
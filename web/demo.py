@@ -1,6 +1,7 @@
 import os
 from random import shuffle
 
+from engines import CsvEngine
 from storage import Storage
 
 TABLE_NAME = 'languages'
@@ -13,6 +14,13 @@ TABLE_COLUMNS = [
     "avg_salary",
 ]
 
+TABLE_TYPES = {
+    "uid": "int",
+    "name": "text",
+    "num_of_jobs": "int32",
+    "avg_salary": "int32",
+}
+
 TABLE_ROWS = [
     ("Python", 19000, 120000,),
     ("JavaScript", 24000, 118000,),
@@ -27,19 +35,17 @@ TABLE_ROWS = [
 ]
 
 
-def initialize(working_dir, reset_on_exists=True):
+def initialize(working_dir, reset_on_exists=True, engine=CsvEngine.name):
     if not os.path.exists(working_dir):
         os.mkdir(working_dir)
-    storage = Storage(working_dir=working_dir)
+    storage = Storage(working_dir=working_dir, engine=engine)
     if storage.exists(TABLE_NAME):
         if not reset_on_exists:
             return
-        os.remove(storage.path(TABLE_NAME))
+        storage.drop(TABLE_NAME)
 
-    storage.create(TABLE_NAME, TABLE_PK, TABLE_COLUMNS)
+    storage.create(TABLE_NAME, TABLE_PK, TABLE_COLUMNS, types=TABLE_TYPES)
 
     rows = TABLE_ROWS.copy()
     shuffle(rows)
-    for i, row in enumerate(rows):
-        cols = [(TABLE_PK, i + 1)] + list(zip(TABLE_COLUMNS, row))
-        storage.insert(TABLE_NAME, cols)
+    storage.insert_many(TABLE_NAME, [[(TABLE_PK, i + 1)] + list(zip(TABLE_COLUMNS, row)) for i, row in enumerate(rows)])